@@ -0,0 +1,258 @@
+"""Semantic cache of final CLaRa answers.
+
+Questions are embedded (the same query embedding retrieval uses, so a miss
+costs nothing extra) and compared with the questions of cached answers. A
+cached answer is returned when a previous question asked with the same
+``max_iterations``/``max_hops`` scores at least ``ANSWER_CACHE_MIN_SIMILARITY``
+(cosine, default 0.92) and mentions the same numbers and identifiers, so
+"budget of project 1" never answers "budget of project 2".
+
+Each entry records the files its evidence came from, including the files a
+deduplicated chunk is shared with (``also_in``). When one of them is
+re-indexed or deleted, exactly the answers that used it are dropped.
+Answers built from no evidence are not cached, since new documents could
+answer them. Reader workers in multi-worker mode are only told that the
+index changed, not which files, so they drop all their cached answers then.
+
+Entries live in a ``ByteLRU`` (``CACHE_ANSWERS_MB``, default 32; ``0``
+disables the cache) and expire after ``ANSWER_CACHE_TTL_SECONDS`` (default
+86400). ``stats()`` reports the hit rate and the LLM time hits saved.
+"""
+
+import dataclasses
+import itertools
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+import events
+import metrics
+from cache import ByteLRU
+from utils import env_float
+
+logger = logging.getLogger(__name__)
+
+_ANCHOR_RE = re.compile(r"\w*\d\w*")
+
+
+def min_similarity() -> float:
+    return env_float("ANSWER_CACHE_MIN_SIMILARITY", 0.92)
+
+
+def ttl_seconds() -> float:
+    return env_float("ANSWER_CACHE_TTL_SECONDS", 86400)
+
+
+@dataclass
+class Entry:
+    question: str
+    params: Tuple[int, int]  # (max_iterations, max_hops)
+    anchors: FrozenSet[str]
+    vector: Any  # unit-length numpy array
+    response: Any  # CLaRaResponse
+    sources: FrozenSet[str]
+    seconds: float  # time the pipeline took
+    llm_seconds: float
+    created_at: float = field(default_factory=time.time)
+
+    def nbytes(self) -> int:
+        steps = self.response.reasoning_steps
+        text = len(self.response.final_answer) + sum(
+            len(e.content) + 256 for step in steps for e in step.evidence
+        )
+        return 1024 + len(self.question) + self.vector.nbytes + text
+
+
+_answers = ByteLRU("answers", default_mb=32, sizeof=lambda entry: entry.nbytes())
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_generation = 0  # bumped by every invalidation
+_counters = {
+    "lookups": 0,
+    "hits": 0,
+    "stored": 0,
+    "invalidated": 0,
+    "saved_seconds": 0.0,
+    "saved_llm_seconds": 0.0,
+}
+
+
+def enabled() -> bool:
+    return _answers.max_bytes > 0
+
+
+def _anchors(question: str) -> FrozenSet[str]:
+    """Tokens with digits in them: numbers, versions, ids, years."""
+    return frozenset(_ANCHOR_RE.findall(question.lower()))
+
+
+def _unit(vector) -> Any:
+    import numpy as np
+
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+def _evidence_files(evidence) -> list:
+    """The file a piece of evidence came from, plus the files that share it
+    through deduplication (``also_in``)."""
+    files = [evidence.source] if evidence.source != "unknown" else []
+    also_in = (evidence.metadata or {}).get("also_in")
+    if also_in:
+        files.extend(name.strip() for name in also_in.split(",") if name.strip())
+    return files
+
+
+def _count(name: str, amount: float = 1) -> None:
+    with _lock:
+        _counters[name] += amount
+
+
+def lookup(question: str, max_iterations: int, max_hops: int):
+    """A copy of the cached response for a similar question, or None.
+
+    The copy's ``cache`` field says which question it was cached for and
+    how similar it was.
+    """
+    if not enabled():
+        return None
+    import numpy as np
+    from processor import embed_query
+
+    params = (max_iterations, max_hops)
+    anchors = _anchors(question)
+    candidates = [
+        (key, entry) for key, entry in _answers.items()
+        if entry.params == params and entry.anchors == anchors
+    ]
+    _count("lookups")
+    best_key, best_entry, best_score = None, None, min_similarity()
+    if candidates:
+        vector = _unit(embed_query(question))
+        scores = np.stack([entry.vector for _, entry in candidates]) @ vector
+        index = int(np.argmax(scores))
+        if float(scores[index]) >= best_score:
+            best_key, best_entry = candidates[index]
+            best_score = float(scores[index])
+
+    if best_entry is not None and time.time() - best_entry.created_at > ttl_seconds():
+        _answers.pop(best_key)
+        best_entry = None
+    if best_entry is None or _answers.get(best_key) is None:
+        if best_entry is None:
+            _answers.misses += 1  # the scan above bypasses get()
+        metrics.ANSWER_CACHE_LOOKUPS.inc(result="miss")
+        return None
+
+    _count("hits")
+    _count("saved_seconds", best_entry.seconds)
+    _count("saved_llm_seconds", best_entry.llm_seconds)
+    metrics.ANSWER_CACHE_LOOKUPS.inc(result="hit")
+    metrics.ANSWER_CACHE_SAVED_LLM_SECONDS.inc(best_entry.llm_seconds)
+    return dataclasses.replace(
+        best_entry.response,
+        cache={
+            "hit": True,
+            "cached_question": best_entry.question,
+            "similarity": round(best_score, 4),
+            "age_seconds": round(time.time() - best_entry.created_at, 1),
+            "saved_llm_seconds": round(best_entry.llm_seconds, 3),
+        },
+    )
+
+
+def generation() -> int:
+    """Pass to ``store()`` to skip answers whose files changed while they were built."""
+    return _generation
+
+
+def store(
+    question: str,
+    max_iterations: int,
+    max_hops: int,
+    response,
+    seconds: float,
+    llm_seconds: float,
+    started_generation: int,
+) -> bool:
+    """Cache ``response``; returns False when it has no evidence to depend on
+    or the index changed since ``started_generation``."""
+    if not enabled() or started_generation != _generation:
+        return False
+    from processor import embed_query
+
+    sources = frozenset(
+        name
+        for step in response.reasoning_steps
+        for e in step.evidence
+        for name in _evidence_files(e)
+    )
+    if not sources:
+        return False
+    entry = Entry(
+        question=question,
+        params=(max_iterations, max_hops),
+        anchors=_anchors(question),
+        vector=_unit(embed_query(question)),  # served from the query embedding cache
+        response=dataclasses.replace(response, cache=None, trace=None),
+        sources=sources,
+        seconds=seconds,
+        llm_seconds=llm_seconds,
+    )
+    key = next(_ids)
+    if not _answers.put(key, entry):
+        return False
+    if started_generation != _generation:
+        _answers.pop(key)  # invalidated while it was being stored
+        return False
+    _count("stored")
+    return True
+
+
+def invalidate(file_name: Optional[str] = None) -> int:
+    """Drop the answers that used ``file_name`` (all answers if None)."""
+    global _generation
+    with _lock:
+        _generation += 1
+    if file_name is None:
+        dropped = len(_answers)
+        _answers.clear()
+    else:
+        dropped = _answers.discard_where(lambda _key, entry: file_name in entry.sources)
+    if dropped:
+        _count("invalidated", dropped)
+        logger.info(f"Answer cache: dropped {dropped} answers ({file_name or 'index refreshed'})")
+    return dropped
+
+
+def stats() -> Dict[str, Any]:
+    # Memory use is reported with the other caches (``cache.stats()``).
+    with _lock:
+        counters = dict(_counters)
+    lookups = counters["lookups"]
+    counters["saved_seconds"] = round(counters["saved_seconds"], 3)
+    counters["saved_llm_seconds"] = round(counters["saved_llm_seconds"], 3)
+    return {
+        "enabled": enabled(),
+        "entries": len(_answers),
+        "hit_rate": round(counters["hits"] / lookups, 4) if lookups else None,
+        **counters,
+    }
+
+
+def _on_event(event: dict) -> None:
+    data = event["data"]
+    if event["type"] == "catalog":
+        if data.get("file"):
+            invalidate(data["file"])
+        elif data.get("action") == "refreshed":
+            invalidate()
+    elif event["type"] == "job" and data.get("stage") == "done" and data.get("file"):
+        invalidate(data["file"])
+
+
+events.add_listener(_on_event)
@@ -0,0 +1,184 @@
+"""Batch question answering for evaluation and report jobs.
+
+``run_batch`` answers a list of questions in one pass instead of one
+request per question:
+
+- the distinct questions are embedded together in a single batched call,
+  which primes the query-vector cache used by routing and chunk search;
+- retrievals are shared across the batch, so a query that several
+  questions (or refinement rounds) issue hits the vector store once, and a
+  caller asking for a query that is already in flight waits for it;
+- questions run on a worker pool (``BATCH_QUERY_PARALLELISM``) while LLM
+  calls are limited by ``BATCH_LLM_CONCURRENCY``, so retrieval for one
+  question overlaps generation for another without overloading Ollama;
+- results are yielded as each question finishes, not in input order.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional
+
+from clara_engine import CLaRaEngine, _get_llm, response_to_dict
+from processor import embed_queries, get_retriever
+from utils import env_int
+
+logger = logging.getLogger(__name__)
+
+MEMO_ENTRIES = 4096
+
+_llm_slots: Optional[threading.BoundedSemaphore] = None
+_llm_slots_lock = threading.Lock()
+
+
+def default_parallelism() -> int:
+    return max(1, env_int("BATCH_QUERY_PARALLELISM", 4))
+
+
+def max_batch_questions() -> int:
+    return env_int("MAX_BATCH_QUESTIONS", 10000)
+
+
+def _get_llm_slots() -> threading.BoundedSemaphore:
+    """One limit shared by every batch, so concurrent batches do not stack up."""
+    global _llm_slots
+    if _llm_slots is None:
+        with _llm_slots_lock:
+            if _llm_slots is None:
+                _llm_slots = threading.BoundedSemaphore(max(1, env_int("BATCH_LLM_CONCURRENCY", 2)))
+    return _llm_slots
+
+
+class ThrottledLLM:
+    """Wraps an LLM so at most N ``invoke`` calls run at once."""
+
+    def __init__(self, llm, slots: threading.BoundedSemaphore):
+        self._llm = llm
+        self._slots = slots
+
+    def __getattr__(self, name):
+        return getattr(self._llm, name)
+
+    def invoke(self, prompt, *args, **kwargs):
+        with self._slots:
+            return self._llm.invoke(prompt, *args, **kwargs)
+
+
+class SharedRetriever:
+    """Memoises ``invoke(query)`` for the lifetime of one batch."""
+
+    def __init__(self, retriever):
+        self._retriever = retriever
+        self._results: "OrderedDict[str, Future]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.shared = 0
+
+    def __getattr__(self, name):
+        return getattr(self._retriever, name)
+
+    def invoke(self, query, *args, **kwargs):
+        if args or kwargs:
+            return self._retriever.invoke(query, *args, **kwargs)
+        with self._lock:
+            self.lookups += 1
+            future = self._results.get(query)
+            owner = future is None
+            if owner:
+                future = self._results[query] = Future()
+                while len(self._results) > MEMO_ENTRIES:
+                    self._results.popitem(last=False)
+            else:
+                self.shared += 1
+        if owner:
+            try:
+                future.set_result(self._retriever.invoke(query))
+            except Exception as exc:
+                future.set_exception(exc)
+        # Callers get their own list; the documents themselves are shared read-only.
+        return list(future.result())
+
+
+def _answer(engine: CLaRaEngine, question: str, max_iterations: int, max_hops: int, detailed: bool):
+    start = time.perf_counter()
+    response = engine.answer(question, max_iterations=max_iterations, max_hops=max_hops)
+    answer = response_to_dict(response) if detailed else response.final_answer
+    return answer, time.perf_counter() - start
+
+
+def run_batch(
+    questions: List[str],
+    max_iterations: int = 3,
+    max_hops: int = 3,
+    detailed: bool = False,
+    parallelism: Optional[int] = None,
+) -> Iterator[dict]:
+    """Answer ``questions`` and return an iterator of result records.
+
+    Set-up (retriever, LLM, batched embedding) happens before this returns,
+    so configuration errors surface before any result is streamed. Each
+    record has ``type`` ``"result"`` with the question's ``index``, and a
+    final ``"summary"`` record closes the stream.
+    """
+    parallelism = parallelism or default_parallelism()
+    positions: Dict[str, List[int]] = OrderedDict()
+    empty = []
+    for index, question in enumerate(questions):
+        text = question.strip()
+        if text:
+            positions.setdefault(text, []).append(index)
+        else:
+            empty.append(index)
+
+    retriever = SharedRetriever(get_retriever())
+    engine = CLaRaEngine(llm=ThrottledLLM(_get_llm(), _get_llm_slots()), retriever=retriever)
+    start = time.perf_counter()
+    embed_queries(list(positions))
+    logger.info(
+        f"Batch of {len(questions)} questions ({len(positions)} distinct) embedded in "
+        f"{time.perf_counter() - start:.2f}s; answering with parallelism={parallelism}"
+    )
+    return _stream(
+        engine, retriever, positions, empty, len(questions),
+        (max_iterations, max_hops, detailed), parallelism, start,
+    )
+
+
+def _stream(engine, retriever, positions, empty, total, options, parallelism, start):
+    errors = len(empty)
+    for index in empty:
+        yield {"type": "result", "index": index, "question": "", "error": "Question cannot be empty"}
+
+    pool = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="batch-query")
+    try:
+        futures = {
+            pool.submit(_answer, engine, question, *options): question
+            for question in positions
+        }
+        for future in as_completed(futures):
+            question = futures[future]
+            try:
+                answer, seconds = future.result()
+                outcome = {"answer": answer, "seconds": round(seconds, 3)}
+            except Exception as exc:
+                logger.error(f"Batch question failed: {question!r}: {exc}")
+                outcome = {"error": str(exc)}
+                errors += len(positions[question])
+            for index in positions[question]:
+                yield {"type": "result", "index": index, "question": question, **outcome}
+    finally:
+        # A client that disconnects closes the generator: drop the unstarted work.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    yield {
+        "type": "summary",
+        "questions": total,
+        "distinct": len(positions),
+        "errors": errors,
+        "seconds": round(time.perf_counter() - start, 3),
+        "parallelism": parallelism,
+        "retrievals": retriever.lookups,
+        "shared_retrievals": retriever.shared,
+    }
@@ -0,0 +1,165 @@
+"""
+Import-time and cold-start guard.
+
+Measures, each in a fresh interpreter:
+
+- how long ``import server`` takes (``-X importtime``), and which modules
+  dominate it
+- whether any heavy dependency (torch, sentence-transformers, Chroma,
+  LangChain, Ollama client) was loaded by the import
+- time from process start to the first successful ``/api/health``
+
+Exits non-zero when a heavy module is imported eagerly or a limit is
+exceeded, so it can run in CI:
+
+    python bench_import.py
+    python bench_import.py --max-import-seconds 0.5 --max-health-seconds 2 --output import.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = (
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "chromadb",
+    "langchain_core",
+    "langchain_chroma",
+    "langchain_huggingface",
+    "langchain_ollama",
+    "langchain_community",
+)
+
+
+def _env(workdir: str) -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_DIR, env.get("PYTHONPATH")]))
+    return env
+
+
+def measure_import(module: str, workdir: str) -> dict:
+    """Import ``module`` in a new interpreter; returns timings and loaded modules."""
+    code = (
+        f"import sys, json; import {module}; "
+        "print(json.dumps(sorted(sys.modules)))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=workdir, env=_env(workdir), capture_output=True, text=True, check=True,
+    )
+    entries = []  # (name, nesting depth, cumulative microseconds)
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, raw_name = line.split("|")
+        name = raw_name.strip()
+        entries.append((name, len(raw_name) - len(raw_name.lstrip()), int(cumulative_us)))
+    position = next(i for i, (name, depth, _) in enumerate(entries) if name == module and depth == 1)
+    total_us = entries[position][2]
+    # -X importtime lists a module's imports just before it, one level deeper.
+    direct = []
+    for name, depth, us in reversed(entries[:position]):
+        if depth == 1:
+            break
+        if depth == 3:
+            direct.append((name, us))
+    direct.sort(key=lambda item: item[1], reverse=True)
+    loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {
+        "seconds": total_us / 1e6,
+        "slowest": [{"module": name, "seconds": round(us / 1e6, 4)} for name, us in direct[:10]],
+        "heavy_modules": sorted({name.split(".")[0] for name in loaded} & set(HEAVY_MODULES)),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_health(workdir: str, timeout: float = 60.0) -> float:
+    """Seconds from spawning uvicorn to the first 200 from /api/health."""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/api/health"
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=_env(workdir), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited with code {proc.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"/api/health did not answer within {timeout:g}s")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Guard server import time and cold start.")
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--runs", type=int, default=3, help="Repetitions (the median is reported)")
+    parser.add_argument("--max-import-seconds", type=float, default=1.0)
+    parser.add_argument("--max-health-seconds", type=float, default=3.0)
+    parser.add_argument("--skip-health", action="store_true", help="Only measure the import")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="clara_import_")
+    try:
+        imports = [measure_import(args.module, workdir) for _ in range(args.runs)]
+        results = {
+            "import_seconds": round(statistics.median(r["seconds"] for r in imports), 4),
+            "slowest_imports": imports[-1]["slowest"],
+            "heavy_modules": imports[-1]["heavy_modules"],
+        }
+        if not args.skip_health:
+            results["first_health_seconds"] = round(
+                statistics.median(measure_first_health(workdir) for _ in range(args.runs)), 4
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    failures = []
+    if results["heavy_modules"]:
+        failures.append(f"heavy modules imported eagerly: {', '.join(results['heavy_modules'])}")
+    if results["import_seconds"] > args.max_import_seconds:
+        failures.append(f"import took {results['import_seconds']}s (limit {args.max_import_seconds}s)")
+    health = results.get("first_health_seconds")
+    if health is not None and health > args.max_health_seconds:
+        failures.append(f"first /api/health after {health}s (limit {args.max_health_seconds}s)")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
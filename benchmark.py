@@ -0,0 +1,344 @@
+"""
+Non-interactive benchmark suite.
+
+Generates a synthetic PDF/DOCX corpus in a scratch directory, swaps the
+CLaRa LLM for ``fake_llm.FakeLLM`` and measures:
+
+- ingestion throughput (files/s, chunks/s) and delete latency
+- retrieval latency per search type
+- end-to-end latency (p50/p95/p99) through /api/query and /api/clara-query
+
+Results are written as JSON and can be compared against a previous run:
+
+    python benchmark.py --docs 50 --output bench.json
+    python benchmark.py --docs 50 --compare bench.json --max-regression 0.2
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SEARCH_TYPES = ("similarity", "mmr", "similarity_score_threshold")
+
+VOCABULARY = (
+    "policy account invoice refund contract service customer warranty delivery "
+    "schedule budget report quarter revenue region office training safety audit "
+    "security network storage backup release support incident review approval "
+    "vendor payment shipment inventory compliance licence project milestone"
+).split()
+BOILERPLATE = (
+    "This document is provided for internal use only and may not be distributed "
+    "without written approval. All figures are subject to change without notice."
+)
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.fmean(ordered), 6),
+        "p50": round(pick(0.50), 6),
+        "p95": round(pick(0.95), 6),
+        "p99": round(pick(0.99), 6),
+        "max": round(ordered[-1], 6),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Synthetic corpus
+# ---------------------------------------------------------------------------
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages) -> None:
+    """Write a minimal text PDF (Helvetica, one content stream per page)."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for lines in pages:
+        body = "BT /F1 10 Tf 14 TL 40 800 Td " + " ".join(
+            f"({_pdf_escape(line)}) '" for line in lines
+        ) + " ET"
+        stream = body.encode("latin-1", errors="replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_docx(path: str, pages) -> bool:
+    try:
+        import docx
+    except ImportError:
+        return False
+    document = docx.Document()
+    for lines in pages:
+        for line in lines:
+            document.add_paragraph(line)
+    document.save(path)
+    return True
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(VOCABULARY) for _ in range(rng.randint(8, 16))]
+    return " ".join(words).capitalize() + "."
+
+
+def generate_corpus(directory: str, docs: int, pages: int, seed: int = 7):
+    """Create ``docs`` files and return (paths, questions with expected sources)."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths, questions = [], []
+    docx_available = True
+    for i in range(docs):
+        code_name = f"{rng.choice(VOCABULARY)}-{rng.randint(100, 999)}"
+        doc_pages = []
+        for page in range(pages):
+            lines = [BOILERPLATE] if page == 0 else []
+            lines += [_sentence(rng) for _ in range(30)]
+            if page == pages // 2:
+                lines.insert(5, f"The code name of project {i} is {code_name}.")
+            doc_pages.append(lines)
+
+        use_docx = docx_available and i % 4 == 3
+        path = os.path.join(directory, f"bench_{i:05d}.{'docx' if use_docx else 'pdf'}")
+        if use_docx and not write_docx(path, doc_pages):
+            docx_available = False
+            path = path[:-5] + ".pdf"
+        if not path.endswith(".docx"):
+            write_pdf(path, doc_pages)
+        paths.append(path)
+        questions.append({
+            "question": f"What is the code name of project {i}?",
+            "source": os.path.basename(path),
+            "answer": code_name,
+        })
+    return paths, questions
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------------
+
+def bench_ingestion(paths):
+    import processor
+    from utils import load_file_index
+
+    timings = []
+    start = time.perf_counter()
+    for path in paths:
+        t0 = time.perf_counter()
+        processor.process_file(path)
+        timings.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    chunks = sum(load_file_index().values())
+    return {
+        "files": len(paths),
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "files_per_second": round(len(paths) / elapsed, 3) if elapsed else None,
+        "chunks_per_second": round(chunks / elapsed, 3) if elapsed else None,
+        "per_file": percentiles(timings),
+    }
+
+
+def bench_delete(paths, sample: int):
+    import processor
+    from delete_file import delete_file
+
+    timings = []
+    for path in paths[:sample]:
+        t0 = time.perf_counter()
+        delete_file(os.path.basename(path))
+        timings.append(time.perf_counter() - t0)
+        processor.process_file(path)  # restore the corpus for later stages
+    return percentiles(timings)
+
+
+def bench_retrieval(questions, rounds: int):
+    import processor
+
+    results = {}
+    for search_type in SEARCH_TYPES:
+        retriever = processor.get_retriever({"search_type": search_type})
+        timings, hits = [], 0
+        for _ in range(rounds):
+            for item in questions:
+                t0 = time.perf_counter()
+                docs = retriever.invoke(item["question"])
+                timings.append(time.perf_counter() - t0)
+                hits += any(d.metadata.get("source_file") == item["source"] for d in docs)
+        results[search_type] = {
+            "latency": percentiles(timings),
+            "source_hit_rate": round(hits / (len(questions) * rounds), 4) if questions else None,
+        }
+    return results
+
+
+def bench_end_to_end(questions, ttft: float, tokens_per_second: float):
+    import clara_engine
+    from fake_llm import FakeLLM
+    from fastapi.testclient import TestClient
+    import server
+
+    clara_engine._llm = clara_engine.InstrumentedLLM(FakeLLM(ttft, tokens_per_second))
+    clara_engine._clara_engine = None
+    client = TestClient(server.app)
+
+    results = {}
+    for endpoint, body in (
+        ("/api/query", lambda q: {"question": q}),
+        ("/api/clara-query", lambda q: {"question": q, "detailed": True}),
+    ):
+        timings, errors = [], 0
+        for item in questions:
+            t0 = time.perf_counter()
+            response = client.post(endpoint, json=body(item["question"]))
+            timings.append(time.perf_counter() - t0)
+            errors += response.status_code != 200
+        results[endpoint] = {"latency": percentiles(timings), "errors": errors}
+    return results
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def _flatten(prefix, value, out):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            _flatten(f"{prefix}.{key}" if prefix else key, child, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out[prefix] = value
+    return out
+
+
+def compare(current: dict, baseline: dict, max_regression: float) -> int:
+    """Print latency/throughput deltas; return the number of regressions."""
+    now = _flatten("", current["results"], {})
+    before = _flatten("", baseline["results"], {})
+    regressions = 0
+    print(f"\nComparison against {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')})")
+    for key in sorted(now.keys() & before.keys()):
+        old, new = before[key], now[key]
+        if not old:
+            continue
+        lower_is_better = any(part in key for part in ("p50", "p95", "p99", "mean", "max", "seconds"))
+        higher_is_better = "per_second" in key or "hit_rate" in key
+        if not (lower_is_better or higher_is_better):
+            continue
+        change = (new - old) / old
+        worse = change > max_regression if lower_is_better else change < -max_regression
+        regressions += worse
+        marker = "REGRESSION" if worse else ""
+        print(f"  {key:60s} {old:>12.4f} -> {new:>12.4f} ({change:+.1%}) {marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval and CLaRa answering.")
+    parser.add_argument("--docs", type=int, default=20, help="Number of synthetic documents")
+    parser.add_argument("--pages", type=int, default=3, help="Pages per document")
+    parser.add_argument("--questions", type=int, default=10, help="Questions per endpoint")
+    parser.add_argument("--retrieval-rounds", type=int, default=3)
+    parser.add_argument("--delete-sample", type=int, default=5)
+    parser.add_argument("--llm-ttft", type=float, default=0.05, help="Fake LLM time to first token (s)")
+    parser.add_argument("--llm-tps", type=float, default=0.0, help="Fake LLM tokens/second (0 = instant)")
+    parser.add_argument("--workdir", help="Scratch directory (default: a new temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    workdir = args.workdir or tempfile.mkdtemp(prefix="clara_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    os.environ.setdefault("EMBEDDING_DEVICE", "auto")
+    sys.path.insert(0, REPO_DIR)
+    # processor and friends use paths relative to the working directory.
+    os.chdir(workdir)
+
+    try:
+        paths, questions = generate_corpus(
+            os.path.join(workdir, "uploads"), args.docs, args.pages
+        )
+        sample = random.Random(11).sample(questions, min(args.questions, len(questions)))
+
+        results = {"ingestion": bench_ingestion(paths)}
+        results["delete"] = bench_delete(paths, args.delete_sample)
+        results["retrieval"] = bench_retrieval(sample, args.retrieval_rounds)
+        results["end_to_end"] = bench_end_to_end(sample, args.llm_ttft, args.llm_tps)
+    finally:
+        os.chdir(REPO_DIR)
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "params": vars(args),
+        },
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"\nResults written to {output}")
+
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        if regressions:
+            print(f"\n{regressions} metric(s) regressed by more than {args.max_regression:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Bulk and archive uploads.
+
+A batch accepts any mix of supported documents and ``.zip`` / ``.tar`` /
+``.tar.gz`` / ``.tgz`` archives. Archive members are streamed one at a time
+straight into ``uploads/`` (zip members through ``ZipFile.open``, tar
+archives in streaming ``r|*`` mode), never extracted into memory as a
+whole. Each file is hashed while it is written; content already seen in the
+batch or already indexed is dropped instead of being ingested again, and
+the rest are queued on the ingestion pool, which bounds concurrency.
+
+Besides the per-file ``MAX_UPLOAD_MB`` limit, a batch keeps a running total
+of the bytes it has written, archive members included, so a small archive
+that expands past ``MAX_BULK_UPLOAD_MB`` is cut off there; the remaining
+files are reported as skipped.
+"""
+
+import logging
+import os
+import tarfile
+import zipfile
+from typing import Iterator, Tuple
+
+import ingest_queue
+from loaders import is_supported
+from upload_store import UploadTooLarge, UploadWriter, max_upload_bytes
+from utils import env_float, load_file_meta
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz")
+
+
+def is_archive(name: str) -> bool:
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def max_bulk_upload_bytes() -> int:
+    return int(env_float("MAX_BULK_UPLOAD_MB", 2048) * 1024 * 1024)
+
+
+def iter_archive(fileobj, name: str) -> Iterator[Tuple[str, object]]:
+    """Yield ``(member name, readable stream)`` for regular archive members."""
+    if name.lower().endswith(".zip"):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                with archive.open(info) as stream:
+                    yield info.filename, stream
+        return
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            stream = archive.extractfile(member)
+            if stream is not None:
+                yield member.name, stream
+
+
+class BatchUpload:
+    """Writes the files of one batch into ``dest_dir`` and queues them."""
+
+    def __init__(self, dest_dir: str):
+        self.dest_dir = dest_dir
+        self.queue = ingest_queue.get_queue()
+        self.batch = self.queue.create_batch()
+        self.max_bytes = max_upload_bytes()
+        self.max_total = max_bulk_upload_bytes()
+        self.total = 0  # bytes written so far, extracted archive members included
+        self._seen = {}  # sha256 -> stored name
+        self._indexed = {
+            meta["sha256"]: name for name, meta in load_file_meta().items() if meta.get("sha256")
+        }
+        self._names = set()
+
+    def _skip(self, name: str, reason: str, **extra) -> None:
+        self.batch.skipped.append({"file": name, "reason": reason, **extra})
+
+    def _over_limit(self) -> bool:
+        return self.total > self.max_total
+
+    def _skip_over_limit(self, name: str) -> None:
+        self._skip(
+            name, f"batch exceeds the {self.max_total / (1024 * 1024):g} MB bulk upload limit"
+        )
+
+    def _unique_name(self, name: str) -> str:
+        """Different files with the same base name inside one batch get a suffix."""
+        stem, ext = os.path.splitext(name)
+        candidate, counter = name, 2
+        while candidate in self._names:
+            candidate = f"{stem} ({counter}){ext}"
+            counter += 1
+        self._names.add(candidate)
+        return candidate
+
+    def begin(self, original_name: str):
+        """Start writing one file; returns a writer or None if it is skipped."""
+        name = os.path.basename(original_name.replace("\\", "/"))
+        if not name or name.startswith("."):
+            return None
+        if not is_supported(name):
+            self._skip(original_name, "unsupported file type")
+            return None
+        return UploadWriter(name, self.max_bytes)
+
+    def finish(self, writer: UploadWriter, original_name: str) -> None:
+        """Dedup by content hash, then move into place and queue ingestion."""
+        sha256 = writer.sha256
+        if sha256 in self._seen:
+            writer.abort()
+            self._skip(original_name, "duplicate in batch", same_as=self._seen[sha256])
+            return
+        if sha256 in self._indexed:
+            writer.abort()
+            self._skip(original_name, "already indexed", same_as=self._indexed[sha256])
+            return
+        stored = writer.commit(self.dest_dir, self._unique_name(writer.name))
+        self._seen[sha256] = stored.name
+        job = ingest_queue.submit(stored.path, sha256=sha256, source=f"batch:{self.batch.id}")
+        self.batch.job_ids.append(job.id)
+
+    def add_stream(self, original_name: str, stream) -> None:
+        if self._over_limit():
+            self._skip_over_limit(original_name)
+            return
+        writer = self.begin(original_name)
+        if writer is None:
+            return
+        try:
+            for data in iter(lambda: stream.read(1024 * 1024), b""):
+                self.total += len(data)
+                if self._over_limit():
+                    writer.abort()
+                    self._skip_over_limit(original_name)
+                    return
+                writer.write(data)
+        except UploadTooLarge as exc:
+            writer.abort()
+            self._skip(original_name, str(exc))
+            return
+        except BaseException:
+            writer.abort()
+            raise
+        self.finish(writer, original_name)
+
+    def add_archive(self, fileobj, name: str) -> None:
+        if self._over_limit():
+            self._skip_over_limit(name)
+            return
+        try:
+            for member_name, stream in iter_archive(fileobj, name):
+                if self._over_limit():
+                    # Stop extracting; the rest of the archive is not read.
+                    self._skip_over_limit(f"{name}: remaining members")
+                    return
+                self.add_stream(member_name, stream)
+        except (zipfile.BadZipFile, tarfile.TarError) as exc:
+            self._skip(name, f"unreadable archive: {exc}")
@@ -0,0 +1,146 @@
+"""Size-capped in-process caches.
+
+``ByteLRU`` is a thread-safe LRU mapping whose capacity is expressed in bytes
+(as measured by ``sizeof``) rather than entries. Every cache registers itself
+so ``stats()`` can report sizes, hit rates and evictions, and its cap can be
+overridden with ``CACHE_<NAME>_MB`` (``0`` disables the cache).
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_registry: Dict[str, "ByteLRU"] = {}
+_registry_lock = threading.Lock()
+
+
+def _cap_bytes(name: str, default_mb: float) -> int:
+    raw = os.getenv(f"CACHE_{name.upper()}_MB")
+    try:
+        mb = float(raw) if raw not in (None, "") else default_mb
+    except ValueError:
+        logger.warning(f"Invalid CACHE_{name.upper()}_MB={raw!r}; using {default_mb}")
+        mb = default_mb
+    return max(0, int(mb * 1024 * 1024))
+
+
+class ByteLRU:
+    """LRU cache bounded by the total ``sizeof`` of its values."""
+
+    def __init__(
+        self,
+        name: str,
+        default_mb: float,
+        sizeof: Callable[[Any], int] = len,
+        on_evict: Optional[Callable[[Any, Any], None]] = None,
+    ):
+        self.name = name
+        self.max_bytes = _cap_bytes(name, default_mb)
+        self._sizeof = sizeof
+        self._on_evict = on_evict
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = self.misses = self.evictions = 0
+        with _registry_lock:
+            _registry[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def put(self, key, value) -> bool:
+        """Insert ``value``; returns False (and keeps nothing) if it is larger
+        than the whole cache, in which case the caller still owns it."""
+        size = self._sizeof(value)
+        with self._lock:
+            self._drop(key, evicted=False)
+            if size > self.max_bytes:
+                return False
+            self._data[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._data:
+                oldest = next(iter(self._data))
+                self._drop(oldest, evicted=True)
+            return True
+
+    def _drop(self, key, evicted: bool) -> None:
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry[1]
+        if evicted:
+            self.evictions += 1
+        if self._on_evict:
+            self._on_evict(key, entry[0])
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._drop(key, evicted=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._data):
+                self._drop(key, evicted=False)
+
+    def discard_where(self, predicate: Callable[[Any, Any], bool]) -> int:
+        """Remove every entry for which ``predicate(key, value)`` is true."""
+        with self._lock:
+            doomed = [key for key, (value, _) in self._data.items() if predicate(key, value)]
+            for key in doomed:
+                self._drop(key, evicted=False)
+            return len(doomed)
+
+    def keys(self) -> List[Any]:
+        with self._lock:
+            return list(self._data)
+
+    def values(self) -> List[Any]:
+        """Current values, without counting as lookups or refreshing recency."""
+        with self._lock:
+            return [value for value, _ in self._data.values()]
+
+    def items(self) -> List[tuple]:
+        """Current (key, value) pairs, without counting as lookups or refreshing recency."""
+        with self._lock:
+            return [(key, value) for key, (value, _) in self._data.items()]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+            }
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    with _registry_lock:
+        caches = dict(_registry)
+    return {name: cache.stats() for name, cache in sorted(caches.items())}
@@ -0,0 +1,145 @@
+"""In-memory snapshot of the indexed file catalog for ``/api/files``.
+
+The snapshot joins ``file_index.json`` and ``file_meta.json`` once and keeps
+the entries pre-sorted per sort key. It is rebuilt only when the catalog
+changes: a ``catalog`` event marks it stale, and the index/meta file
+modification times are checked as well so edits made by other processes
+are noticed. Listings page through the snapshot with keyset cursors and
+carry an ETag derived from the snapshot version and the query.
+"""
+
+import base64
+import bisect
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import events
+from utils import INDEX_FILE, META_FILE, load_file_index, load_file_meta
+
+SORT_KEYS = ("name", "date", "size")
+MAX_PAGE_SIZE = 5000
+
+
+def _sort_key(entry: Dict[str, Any], sort: str) -> Tuple:
+    if sort == "date":
+        return (entry["indexed_at"] or "", entry["name"])
+    if sort == "size":
+        return (entry["size"] if entry["size"] is not None else -1, entry["name"])
+    return (entry["name"],)
+
+
+def _encode_cursor(key: Tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple:
+    try:
+        return tuple(json.loads(base64.urlsafe_b64decode(cursor.encode("ascii"))))
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class Snapshot:
+    def __init__(self, version: Tuple, upload_dir: Optional[str]):
+        index = load_file_index()
+        meta = load_file_meta()
+        entries = []
+        for name, chunks in index.items():
+            info = meta.get(name, {})
+            size = info.get("size")
+            if size is None and upload_dir:
+                try:
+                    size = os.path.getsize(os.path.join(upload_dir, name))
+                except OSError:
+                    size = None
+            entries.append({
+                "name": name,
+                "chunks": chunks,
+                "dedup_ratio": info.get("dedup_ratio", 0.0),
+                "size": size,
+                "indexed_at": info.get("indexed_at"),
+            })
+        self.version = version
+        self.etag = hashlib.sha1(repr(version).encode("utf-8")).hexdigest()[:16]
+        self.total = len(entries)
+        self._sorted: Dict[str, Tuple[List[Dict], List[Tuple]]] = {}
+        for sort in SORT_KEYS:
+            ordered = sorted(entries, key=lambda e: _sort_key(e, sort))
+            self._sorted[sort] = (ordered, [_sort_key(e, sort) for e in ordered])
+
+    def page(
+        self,
+        sort: str = "name",
+        order: str = "asc",
+        prefix: str = "",
+        cursor: Optional[str] = None,
+        limit: int = 1000,
+    ) -> Dict[str, Any]:
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+        entries, keys = self._sorted[sort]
+        if prefix:
+            lowered = prefix.lower()
+            matched = [i for i, e in enumerate(entries) if e["name"].lower().startswith(lowered)]
+            entries = [entries[i] for i in matched]
+            keys = [keys[i] for i in matched]
+
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        position = _decode_cursor(cursor) if cursor else None
+        if order == "desc":
+            end = bisect.bisect_left(keys, position) if position is not None else len(keys)
+            start = max(0, end - limit)
+            page = entries[start:end][::-1]
+            more = start > 0
+        else:
+            start = bisect.bisect_right(keys, position) if position is not None else 0
+            page = entries[start:start + limit]
+            more = start + limit < len(entries)
+
+        return {
+            "files": page,
+            "total": len(entries),
+            "next_cursor": _encode_cursor(_sort_key(page[-1], sort)) if page and more else None,
+        }
+
+
+_snapshot: Optional[Snapshot] = None
+_generation = 0
+_lock = threading.Lock()
+
+
+def _on_event(event: dict) -> None:
+    global _generation
+    if event["type"] == "catalog":
+        _generation += 1
+
+
+events.add_listener(_on_event)
+
+
+def _mtime(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def get_snapshot(upload_dir: Optional[str] = None) -> Snapshot:
+    """Return the current snapshot, rebuilding it if the catalog changed."""
+    global _snapshot
+    version = (_generation, _mtime(INDEX_FILE), _mtime(META_FILE))
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    with _lock:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = Snapshot(version, upload_dir)
+        return _snapshot
+
+
+def listing_etag(snapshot: Snapshot, **params) -> str:
+    query = hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+    return f'W/"{snapshot.etag}-{query}"'
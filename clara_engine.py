@@ -11,13 +11,16 @@ Advanced RAG system with:
 
 import logging
 import os
-from typing import List, Dict, Any, Tuple
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass, field
-try:
-    from langchain_ollama import OllamaLLM
-except ImportError:
-    from langchain_community.llms import Ollama as OllamaLLM
 from langchain_core.prompts import PromptTemplate
+
+import answer_cache
+import metrics
+import sessions
+import tracing
 from processor import get_retriever
 
 logger = logging.getLogger(__name__)
@@ -26,24 +29,73 @@ _llm = None
 _clara_engine = None
 
 
+@contextmanager
+def _stage(name: str, **attributes):
+    """Time a pipeline stage in metrics and record it as a trace span."""
+    with metrics.stage(name), tracing.span(name, **attributes) as span:
+        yield span
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4) if text else 0
+
+
+class InstrumentedLLM:
+    """Wraps an LLM to record per-call latency and token counts."""
+
+    def __init__(self, llm):
+        self._llm = llm
+
+    def __getattr__(self, name):
+        return getattr(self._llm, name)
+
+    def invoke(self, prompt, *args, **kwargs):
+        with tracing.span("llm", prompt_chars=len(str(prompt))) as span:
+            start = time.perf_counter()
+            info = {}
+            generate = getattr(self._llm, "generate", None)
+            if generate is not None and not args and not kwargs and isinstance(prompt, str):
+                generation = generate([prompt]).generations[0][0]
+                text = generation.text
+                info = generation.generation_info or {}
+            else:
+                text = self._llm.invoke(prompt, *args, **kwargs)
+            prompt_tokens = info.get("prompt_eval_count") or _estimate_tokens(str(prompt))
+            completion_tokens = info.get("eval_count") or _estimate_tokens(text)
+            metrics.record_llm_call(time.perf_counter() - start, prompt_tokens, completion_tokens)
+            if span is not None:
+                span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        return text
+
+
 def _get_llm():
     global _llm
     if _llm is None:
+        try:
+            from langchain_ollama import OllamaLLM
+        except ImportError:
+            from langchain_community.llms import Ollama as OllamaLLM
+
         model_name = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
         num_gpu = int(os.getenv("OLLAMA_NUM_GPU", "1"))
         temperature = float(os.getenv("OLLAMA_TEMPERATURE", "0.1"))
+        # e.g. point at ollama_stub.py for GPU-free load tests
+        extra = {"base_url": os.getenv("OLLAMA_BASE_URL")} if os.getenv("OLLAMA_BASE_URL") else {}
         try:
             _llm = OllamaLLM(
                 model=model_name,
                 num_gpu=num_gpu,
                 temperature=temperature,
+                **extra,
             )
         except TypeError:
             # Compatibility with older Ollama wrappers that do not accept num_gpu.
             _llm = OllamaLLM(
                 model=model_name,
                 temperature=temperature,
+                **extra,
             )
+        _llm = InstrumentedLLM(_llm)
         logger.info(f"CLaRa LLM initialized: model={model_name}, num_gpu={num_gpu}")
     return _llm
 
@@ -58,6 +110,17 @@ class RetrievedEvidence:
     metadata: Dict[str, Any] = field(default_factory=dict)
 
 
+def _evidence_sources(evidence: List[RetrievedEvidence]) -> List[str]:
+    """All files backing the evidence, including deduplicated copies."""
+    sources = set()
+    for e in evidence:
+        sources.add(e.source)
+        also_in = e.metadata.get("also_in") if e.metadata else None
+        if also_in:
+            sources.update(s.strip() for s in also_in.split(",") if s.strip())
+    return sorted(sources)
+
+
 @dataclass
 class ReasoningStep:
     """A single step in multi-hop reasoning"""
@@ -78,6 +141,9 @@ class CLaRaResponse:
     clarifications_needed: List[str]
     evidence_map: Dict[str, List[str]]  # claim -> source mappings
     confidence_score: float
+    trace: Optional[Dict[str, Any]] = None
+    session: Optional[Dict[str, Any]] = None
+    cache: Optional[Dict[str, Any]] = None
 
 
 class QueryAnalyzer:
@@ -180,7 +246,10 @@ Only output the refined query, nothing else."""
             logger.info(f"CLaRa Retrieval iteration {iteration + 1}: {current_query}")
             
             # Retrieve documents
-            docs = self.retriever.invoke(current_query)
+            with _stage("retrieval", iteration=iteration + 1, query=current_query) as span:
+                docs = self.retriever.invoke(current_query)
+                if span is not None:
+                    span.set(evidence_count=len(docs))
             
             # Convert to evidence objects
             for idx, doc in enumerate(docs):
@@ -209,11 +278,12 @@ Only output the refined query, nothing else."""
                     logger.info("No gaps identified, stopping iteration")
                     break
                 
-                current_query = self._refine_query(
-                    original_query, 
-                    findings_summary, 
-                    gaps
-                )
+                with _stage("refinement", iteration=iteration + 1, gaps=len(gaps)):
+                    current_query = self._refine_query(
+                        original_query, 
+                        findings_summary, 
+                        gaps
+                    )
         
         return all_evidence
     
@@ -302,7 +372,10 @@ NEXT_QUERY: [suggested next search query, or 'none' if complete]
             if hop == 0:
                 evidence = initial_evidence
             else:
-                docs = self.retriever.invoke(current_query)
+                with _stage("retrieval", hop=hop + 1, query=current_query) as span:
+                    docs = self.retriever.invoke(current_query)
+                    if span is not None:
+                        span.set(evidence_count=len(docs))
                 evidence = [
                     RetrievedEvidence(
                         content=doc.page_content,
@@ -328,15 +401,20 @@ NEXT_QUERY: [suggested next search query, or 'none' if complete]
             
             # Perform reasoning
             try:
-                reasoning_output = self.llm.invoke(
-                    self.prompt.format(
-                        question=question,
-                        step_number=hop + 1,
-                        current_query=current_query,
-                        evidence=evidence_text,
-                        previous_steps=previous_steps_text
-                    )
+                prompt = self.prompt.format(
+                    question=question,
+                    step_number=hop + 1,
+                    current_query=current_query,
+                    evidence=evidence_text,
+                    previous_steps=previous_steps_text
                 )
+                with _stage(
+                    "hop",
+                    hop=hop + 1,
+                    evidence_count=len(evidence),
+                    prompt_chars=len(prompt),
+                ):
+                    reasoning_output = self.llm.invoke(prompt)
                 
                 # Parse reasoning output
                 answer, confidence, next_query, gaps = self._parse_reasoning(reasoning_output)
@@ -390,7 +468,7 @@ class EvidenceTracker:
         
         for step in reasoning_steps:
             claim = step.intermediate_answer[:100]  # Use first 100 chars as key
-            sources = list(set([e.source for e in step.evidence]))
+            sources = _evidence_sources(step.evidence)
             evidence_map[f"Step {step.step_number}"] = sources
         
         return evidence_map
@@ -414,9 +492,9 @@ Provide a complete, well-structured answer that:
 
 Final Answer:"""
     
-    def __init__(self):
-        self.llm = _get_llm()
-        self.retriever = get_retriever()
+    def __init__(self, llm=None, retriever=None):
+        self.llm = llm or _get_llm()
+        self.retriever = retriever or get_retriever()
         self.query_analyzer = QueryAnalyzer(self.llm)
         self.iterative_retriever = IterativeRetriever(self.retriever, self.llm)
         self.multi_hop_reasoner = MultiHopReasoner(self.llm, self.retriever)
@@ -431,7 +509,8 @@ Final Answer:"""
         question: str, 
         max_iterations: int = 3,
         max_hops: int = 3,
-        enable_clarification: bool = True
+        enable_clarification: bool = True,
+        session: Optional["sessions.Session"] = None
     ) -> CLaRaResponse:
         """
         Main CLaRa answering pipeline
@@ -441,18 +520,84 @@ Final Answer:"""
             max_iterations: Maximum retrieval iterations
             max_hops: Maximum reasoning hops
             enable_clarification: Whether to suggest clarifications
+            session: Conversation whose evidence is searched first (caller holds its lock)
+
+        Without a session, answers to similar earlier questions are served
+        from ``answer_cache``.
         """
+        use_cache = session is None and answer_cache.enabled()
+        with metrics.query_scope() as llm_usage, metrics.stage("total"), tracing.start_trace(
+            "clara.answer",
+            question=question,
+            max_iterations=max_iterations,
+            max_hops=max_hops,
+        ) as trace:
+            cached = None
+            if use_cache:
+                with _stage("answer_cache") as span:
+                    cached = answer_cache.lookup(question, max_iterations, max_hops)
+                    if span is not None:
+                        span.set(hit=cached is not None)
+            if cached is not None:
+                trace.set(answer_cache="hit", similarity=cached.cache["similarity"])
+                response = cached
+            else:
+                generation = answer_cache.generation()
+                started = time.perf_counter()
+                response = self._run_pipeline(question, max_iterations, max_hops, enable_clarification, session)
+                if use_cache:
+                    answer_cache.store(
+                        question,
+                        max_iterations,
+                        max_hops,
+                        response,
+                        seconds=time.perf_counter() - started,
+                        llm_seconds=llm_usage[1],
+                        started_generation=generation,
+                    )
+            if session is not None:
+                evidence = [e for step in response.reasoning_steps for e in step.evidence]
+                session.add_turn(question, response.final_answer, response.session["evidence_source"], evidence)
+                response.session.update(session.summary())
+                sessions.record(response.session["evidence_source"])
+                trace.set(evidence_source=response.session["evidence_source"])
+            trace.set(
+                evidence_count=sum(len(s.evidence) for s in response.reasoning_steps),
+                confidence=response.confidence_score,
+            )
+        response.trace = trace.to_dict()
+        return response
+
+    def _run_pipeline(
+        self,
+        question: str,
+        max_iterations: int,
+        max_hops: int,
+        enable_clarification: bool,
+        session: Optional["sessions.Session"] = None
+    ) -> CLaRaResponse:
         logger.info(f"CLaRa processing: {question}")
+
+        # Step 0: Follow-ups are answered from the session's evidence when it covers them
+        search_query, history = question, ""
+        if session is not None:
+            session.drop_stale()
+            search_query, history = session.search_query(question), session.history()
+            if session.evidence:
+                response = self._answer_from_session(question, search_query, history, session)
+                if response is not None:
+                    return response
         
         # Step 1: Analyze query
-        analysis = self.query_analyzer.analyze(question)
+        with _stage("analysis"):
+            analysis = self.query_analyzer.analyze(question)
         logger.info(f"Query analysis: {analysis}")
         
         clarifications = analysis["clarifications"] if enable_clarification else []
         
         # Step 2: Iterative retrieval with refinement
         evidence = self.iterative_retriever.retrieve_with_refinement(
-            question, 
+            search_query, 
             max_iterations=max_iterations
         )
         logger.info(f"Retrieved {len(evidence)} pieces of evidence across iterations")
@@ -466,12 +611,14 @@ Final Answer:"""
             )
         else:
             # Simple single-step reasoning
+            with _stage("simple_answer", evidence_count=len(evidence[:5])):
+                simple_answer = self._simple_answer(question, evidence, history)
             reasoning_steps = [
                 ReasoningStep(
                     step_number=1,
                     query=question,
                     evidence=evidence,
-                    intermediate_answer=self._simple_answer(question, evidence),
+                    intermediate_answer=simple_answer,
                     confidence=0.8,
                     identified_gaps=[]
                 )
@@ -481,7 +628,8 @@ Final Answer:"""
         evidence_map = self.evidence_tracker.build_evidence_map(reasoning_steps)
         
         # Step 5: Synthesize final answer
-        final_answer = self._synthesize_answer(question, reasoning_steps)
+        with _stage("synthesis", steps=len(reasoning_steps)):
+            final_answer = self._synthesize_answer(question, reasoning_steps)
         
         # Step 6: Calculate overall confidence
         avg_confidence = sum(s.confidence for s in reasoning_steps) / len(reasoning_steps)
@@ -492,16 +640,56 @@ Final Answer:"""
             total_iterations=len(set(e.retrieval_step for e in evidence)),
             clarifications_needed=clarifications,
             evidence_map=evidence_map,
-            confidence_score=avg_confidence
+            confidence_score=avg_confidence,
+            session={"evidence_source": "index"} if session is not None else None
+        )
+
+    def _answer_from_session(
+        self,
+        question: str,
+        search_query: str,
+        history: str,
+        session: "sessions.Session"
+    ) -> Optional[CLaRaResponse]:
+        """Answer from evidence gathered in earlier turns, or None if it is not enough."""
+        from processor import embed_query
+
+        with _stage("session_search", evidence_count=len(session.evidence)) as span:
+            evidence = session.relevant_evidence(embed_query(search_query), sessions.min_score(), limit=5)
+            if span is not None:
+                span.set(matched=len(evidence))
+        if len(evidence) < sessions.min_evidence():
+            logger.info(f"Session evidence insufficient ({len(evidence)} relevant); searching the index")
+            return None
+
+        with _stage("simple_answer", evidence_count=len(evidence)):
+            answer = self._simple_answer(question, evidence, history)
+        step = ReasoningStep(
+            step_number=1,
+            query=search_query,
+            evidence=evidence,
+            intermediate_answer=answer,
+            confidence=0.8,
+            identified_gaps=[]
+        )
+        return CLaRaResponse(
+            final_answer=answer,
+            reasoning_steps=[step],
+            total_iterations=0,
+            clarifications_needed=[],
+            evidence_map=self.evidence_tracker.build_evidence_map([step]),
+            confidence_score=step.confidence,
+            session={"evidence_source": "session"}
         )
     
-    def _simple_answer(self, question: str, evidence: List[RetrievedEvidence]) -> str:
+    def _simple_answer(self, question: str, evidence: List[RetrievedEvidence], history: str = "") -> str:
         """Generate simple answer for non-multi-hop questions"""
         context = "\n\n".join([f"[{e.source}] {e.content}" for e in evidence[:5]])
+        conversation = f"Conversation so far:\n{history}\n\n" if history else ""
         
         prompt = f"""Answer the question based on the provided context.
 
-Context:
+{conversation}Context:
 {context}
 
 Question: {question}
@@ -542,11 +730,42 @@ def get_clara_engine() -> CLaRaEngine:
     return _clara_engine
 
 
+def reset_clara_engine() -> None:
+    """Drop the engine so the next query binds to a freshly opened vector store."""
+    global _clara_engine
+    _clara_engine = None
+
+
+def response_to_dict(response: CLaRaResponse) -> Dict[str, Any]:
+    """Detailed JSON-friendly form of a CLaRa response."""
+    return {
+        "answer": response.final_answer,
+        "reasoning_steps": [
+            {
+                "step": s.step_number,
+                "query": s.query,
+                "answer": s.intermediate_answer,
+                "confidence": s.confidence,
+                "sources": _evidence_sources(s.evidence)
+            }
+            for s in response.reasoning_steps
+        ],
+        "total_iterations": response.total_iterations,
+        "confidence": response.confidence_score,
+        "clarifications": response.clarifications_needed,
+        "evidence_map": response.evidence_map,
+        "trace": response.trace,
+        "session": response.session,
+        "cache": response.cache
+    }
+
+
 def answer_with_clara(
     question: str, 
     max_iterations: int = 3,
     max_hops: int = 3,
-    detailed_response: bool = False
+    detailed_response: bool = False,
+    session_id: Optional[str] = None
 ) -> str | Dict[str, Any]:
     """
     Answer using CLaRa engine
@@ -556,35 +775,31 @@ def answer_with_clara(
         max_iterations: Max retrieval iterations
         max_hops: Max reasoning hops
         detailed_response: If True, return full CLaRaResponse details
+        session_id: Conversation to continue (created on first use)
     
     Returns:
         String answer or detailed response dict
     """
     try:
-        response = get_clara_engine().answer(
-            question, 
-            max_iterations=max_iterations,
-            max_hops=max_hops
-        )
+        session = sessions.get_or_create(session_id) if session_id else None
+        if session is None:
+            response = get_clara_engine().answer(
+                question, 
+                max_iterations=max_iterations,
+                max_hops=max_hops
+            )
+        else:
+            with session.lock:
+                response = get_clara_engine().answer(
+                    question,
+                    max_iterations=max_iterations,
+                    max_hops=max_hops,
+                    session=session
+                )
+                sessions.save(session)
         
         if detailed_response:
-            return {
-                "answer": response.final_answer,
-                "reasoning_steps": [
-                    {
-                        "step": s.step_number,
-                        "query": s.query,
-                        "answer": s.intermediate_answer,
-                        "confidence": s.confidence,
-                        "sources": list(set(e.source for e in s.evidence))
-                    }
-                    for s in response.reasoning_steps
-                ],
-                "total_iterations": response.total_iterations,
-                "confidence": response.confidence_score,
-                "clarifications": response.clarifications_needed,
-                "evidence_map": response.evidence_map
-            }
+            return response_to_dict(response)
         else:
             # Return just the answer for simple usage
             return response.final_answer
@@ -0,0 +1,379 @@
+"""Multi-worker coordination: one elected writer, many readers.
+
+With ``MULTI_WORKER=true`` several server processes (for example
+``uvicorn server:app --workers 4``) share one data directory. Exactly one of
+them, the process holding an exclusive lock on ``worker_state/writer.lock``,
+is the writer. It runs the file watcher and the ingestion queue, and it is
+the only process that writes the vector store, text store and index files.
+The other workers only serve reads from those files:
+
+- uploads are saved by whichever worker received them and handed to the
+  writer through ``worker_state/spool/``. Job progress comes back through
+  per-job state files in ``worker_state/jobs/`` and is re-published as local
+  events, so ``/api/jobs`` and ``/api/events`` work on every worker;
+- deletes and maintenance are forwarded the same way, and the calling worker
+  waits for the result;
+- after every catalog change the writer bumps ``worker_state/generation``.
+  Readers poll it, reopen the vector store and drop cached text maps, so
+  new documents become searchable without a restart.
+
+When the writer exits, the OS releases its lock and the next reader to poll
+takes over. Without ``MULTI_WORKER`` this module is inert and the process
+is always the writer.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import events
+from utils import env_flag, env_float
+
+logger = logging.getLogger(__name__)
+
+STATE_TTL_SECONDS = 24 * 3600
+
+
+MULTI_WORKER = env_flag("MULTI_WORKER")
+STATE_DIR = os.getenv("WORKER_STATE_DIR", "worker_state")
+POLL_SECONDS = env_float("WORKER_POLL_SECONDS", 1.0)
+
+LOCK_FILE = os.path.join(STATE_DIR, "writer.lock")
+GENERATION_FILE = os.path.join(STATE_DIR, "generation")
+SPOOL_DIR = os.path.join(STATE_DIR, "spool")
+JOBS_DIR = os.path.join(STATE_DIR, "jobs")
+RESULTS_DIR = os.path.join(STATE_DIR, "results")
+BATCHES_DIR = os.path.join(STATE_DIR, "batches")
+
+_role = "writer"
+_lock_handle = None
+_generation: Optional[str] = None
+_handlers: Dict[str, Callable[..., Any]] = {}
+_on_promote: Optional[Callable[[], None]] = None
+_relayed: "OrderedDict[str, int]" = OrderedDict()
+_jobs_scanned_at = 0
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+def enabled() -> bool:
+    return MULTI_WORKER
+
+
+def is_writer() -> bool:
+    return not MULTI_WORKER or _role == "writer"
+
+
+def role() -> str:
+    return _role if MULTI_WORKER else "single"
+
+
+def status() -> Dict[str, Any]:
+    return {"role": role(), "pid": os.getpid(), "generation": _generation}
+
+
+# --- shared state files ------------------------------------------------------
+
+
+def _write_json(path: str, data: dict) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_generation() -> Optional[str]:
+    try:
+        with open(GENERATION_FILE, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def notify_changed() -> None:
+    """Tell reader workers that the index changed (writer only)."""
+    global _generation
+    if not MULTI_WORKER or _role != "writer":
+        return
+    _generation = str(time.time_ns())
+    tmp_path = f"{GENERATION_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(_generation)
+    os.replace(tmp_path, GENERATION_FILE)
+
+
+def spool_ingest(job: dict, delay: float = 0.0) -> None:
+    """Hand an ingestion job to the writer (reader side)."""
+    _write_json(os.path.join(JOBS_DIR, f"{job['id']}.json"), {"job": job})
+    task = {"action": "ingest", "id": job["id"], "job": job, "delay": delay}
+    _write_json(os.path.join(SPOOL_DIR, f"{time.time_ns()}-{job['id']}.json"), task)
+
+
+def call(action: str, timeout: float = 60.0, **params) -> Any:
+    """Run a registered handler in the writer process and wait for its result."""
+    if is_writer():
+        return _handlers[action](**params)
+    task_id = uuid.uuid4().hex
+    _write_json(
+        os.path.join(SPOOL_DIR, f"{time.time_ns()}-{task_id}.json"),
+        {"action": action, "id": task_id, "params": params},
+    )
+    result_path = os.path.join(RESULTS_DIR, f"{task_id}.json")
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = _read_json(result_path)
+        if result is not None:
+            os.remove(result_path)
+            if "error" in result:
+                raise RuntimeError(result["error"])
+            return result.get("result")
+        time.sleep(0.05)
+    raise TimeoutError(f"The writer worker did not answer {action!r} within {timeout:g}s")
+
+
+def register(action: str, handler: Callable[..., Any]) -> None:
+    """Make ``handler`` callable from reader workers through ``call``."""
+    _handlers[action] = handler
+
+
+def read_job(job_id: str) -> Optional[dict]:
+    state = _read_json(os.path.join(JOBS_DIR, f"{job_id}.json"))
+    if state and state.get("alias_of"):
+        state = _read_json(os.path.join(JOBS_DIR, f"{state['alias_of']}.json"))
+    return state.get("job") if state else None
+
+
+def list_jobs(limit: int = 100) -> List[dict]:
+    try:
+        entries = sorted(os.scandir(JOBS_DIR), key=lambda e: e.stat().st_mtime_ns, reverse=True)
+    except OSError:
+        return []
+    jobs = []
+    for entry in entries:
+        state = _read_json(entry.path) if entry.name.endswith(".json") else None
+        if state and "job" in state:
+            jobs.append(state["job"])
+            if len(jobs) >= limit:
+                break
+    return jobs
+
+
+def record_batch(batch: dict) -> None:
+    if MULTI_WORKER:
+        _write_json(os.path.join(BATCHES_DIR, f"{batch['id']}.json"), batch)
+
+
+def read_batch(batch_id: str) -> Optional[dict]:
+    if not MULTI_WORKER:
+        return None
+    return _read_json(os.path.join(BATCHES_DIR, f"{os.path.basename(batch_id)}.json"))
+
+
+# --- writer side -------------------------------------------------------------
+
+
+def _on_event(event: dict) -> None:
+    if not MULTI_WORKER or _role != "writer":
+        return
+    if event["type"] == "catalog":
+        notify_changed()
+    elif event["type"] == "job":
+        import ingest_queue
+
+        job = ingest_queue.get_queue().get(event["data"]["job_id"])
+        if job is not None:
+            _write_json(
+                os.path.join(JOBS_DIR, f"{job.id}.json"),
+                {"job": job.to_dict(), "event_id": event["id"], "event": event["data"]},
+            )
+
+
+events.add_listener(_on_event)
+
+
+def _run_task(task: dict) -> None:
+    result_path = os.path.join(RESULTS_DIR, f"{task['id']}.json")
+    try:
+        handler = _handlers[task["action"]]
+        _write_json(result_path, {"result": handler(**task.get("params", {}))})
+    except Exception as exc:
+        logger.error(f"Forwarded {task['action']!r} failed: {exc}")
+        _write_json(result_path, {"error": str(exc)})
+
+
+def _drain_spool() -> None:
+    import ingest_queue
+
+    for name in sorted(os.listdir(SPOOL_DIR)):
+        path = os.path.join(SPOOL_DIR, name)
+        if not name.endswith(".json"):
+            continue
+        task = _read_json(path)
+        os.remove(path)
+        if task is None:
+            continue
+        if task["action"] == "ingest":
+            spooled = task["job"]
+            job = ingest_queue.get_queue().submit(
+                spooled["path"],
+                sha256=spooled.get("sha256"),
+                source=spooled["source"],
+                delay=task.get("delay", 0.0),
+                job_id=spooled["id"],
+            )
+            if job.id != spooled["id"]:
+                # Merged into a job that was already queued for the same file.
+                _write_json(os.path.join(JOBS_DIR, f"{spooled['id']}.json"), {"alias_of": job.id})
+        else:
+            threading.Thread(target=_run_task, args=(task,), name=f"spool-{task['action']}", daemon=True).start()
+
+
+def _prune_state() -> None:
+    cutoff = time.time() - STATE_TTL_SECONDS
+    for directory in (JOBS_DIR, RESULTS_DIR, BATCHES_DIR):
+        for entry in os.scandir(directory):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+# --- reader side -------------------------------------------------------------
+
+
+def refresh_read_path() -> None:
+    """Reopen the vector store and forget cached text so writer changes show up."""
+    import processor
+    import text_store
+
+    processor.reset_vector_store()
+    text_store.clear_maps()
+    clara_engine = sys.modules.get("clara_engine")
+    if clara_engine is not None:
+        clara_engine.reset_clara_engine()
+
+
+def _sync() -> None:
+    global _generation, _jobs_scanned_at
+
+    generation = _read_generation()
+    if generation != _generation:
+        _generation = generation
+        refresh_read_path()
+        logger.info(f"Index changed by the writer (generation {generation}); read path refreshed")
+        events.publish("catalog", action="refreshed")
+
+    newest = _jobs_scanned_at
+    for entry in os.scandir(JOBS_DIR):
+        try:
+            mtime = entry.stat().st_mtime_ns
+        except OSError:
+            continue
+        if mtime < _jobs_scanned_at or not entry.name.endswith(".json"):
+            continue
+        newest = max(newest, mtime)
+        state = _read_json(entry.path)
+        if not state or "event" not in state or _relayed.get(entry.name) == state["event_id"]:
+            continue
+        _relayed[entry.name] = state["event_id"]
+        _relayed.move_to_end(entry.name)
+        while len(_relayed) > 5000:
+            _relayed.popitem(last=False)
+        events.publish("job", **state["event"])
+    _jobs_scanned_at = newest
+
+
+# --- election ----------------------------------------------------------------
+
+
+def _try_lock() -> bool:
+    global _lock_handle
+    handle = open(LOCK_FILE, "a+")
+    try:
+        if os.name == "nt":
+            import msvcrt
+
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    _lock_handle = handle
+    return True
+
+
+def _promote() -> None:
+    global _role
+    _role = "writer"
+    logger.info(f"Worker {os.getpid()} is now the writer")
+    # Anything opened as a reader may predate the previous writer's last changes.
+    refresh_read_path()
+    if _on_promote is not None:
+        _on_promote()
+
+
+def _loop() -> None:
+    ticks = 0
+    while not _stop.wait(POLL_SECONDS):
+        ticks += 1
+        try:
+            if _role == "writer":
+                _drain_spool()
+                if ticks % 600 == 0:
+                    _prune_state()
+            elif _try_lock():
+                _promote()
+                _drain_spool()
+            else:
+                _sync()
+        except Exception as exc:
+            logger.error(f"Worker coordination error: {exc}")
+
+
+def start(on_promote: Optional[Callable[[], None]] = None) -> None:
+    """Elect the writer and start the coordination loop (no-op unless MULTI_WORKER)."""
+    global _role, _on_promote, _generation, _jobs_scanned_at, _thread
+    if not MULTI_WORKER or _thread is not None:
+        return
+    for directory in (STATE_DIR, SPOOL_DIR, JOBS_DIR, RESULTS_DIR, BATCHES_DIR):
+        os.makedirs(directory, exist_ok=True)
+    _on_promote = on_promote
+    _role = "writer" if _try_lock() else "reader"
+    _generation = _read_generation()
+    _jobs_scanned_at = time.time_ns()
+    if _role == "writer":
+        notify_changed()
+    logger.info(f"Worker {os.getpid()} started as {_role}")
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="worker-coordinator", daemon=True)
+    _thread.start()
+
+
+def stop() -> None:
+    global _lock_handle, _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        _thread = None
+    if _lock_handle is not None:
+        _lock_handle.close()  # releases the lock
+        _lock_handle = None
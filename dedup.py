@@ -0,0 +1,364 @@
+"""Exact and near-duplicate chunk detection across documents.
+
+Every stored ("canonical") chunk is fingerprinted with a content hash and a
+MinHash signature whose bands are indexed for LSH lookups. At ingestion time a
+chunk that matches a canonical chunk (same hash, or estimated Jaccard
+similarity above the threshold) is not embedded or stored again; instead a
+link row records its file and offsets so every source stays available for
+attribution.
+"""
+
+import hashlib
+import logging
+import random
+import re
+import sqlite3
+import struct
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+DEFAULT_THRESHOLD = 0.8  # MinHash similarity at which a chunk counts as a duplicate
+_MERSENNE_PRIME = (1 << 61) - 1
+
+_rng = random.Random(1)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+_SIGNATURE_FORMAT = f"<{NUM_PERM}Q"
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text.lower()).strip()
+
+
+def _shingle_hashes(normalized: str) -> set:
+    words = normalized.split(" ")
+    if len(words) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {
+            " ".join(words[i:i + SHINGLE_SIZE])
+            for i in range(len(words) - SHINGLE_SIZE + 1)
+        }
+    return {
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+        for s in shingles
+    }
+
+
+def fingerprint(text: str) -> Tuple[str, Tuple[int, ...]]:
+    """Return the exact content hash and MinHash signature of ``text``."""
+    normalized = _normalize(text)
+    content_hash = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+    hashes = _shingle_hashes(normalized)
+    signature = tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+    return content_hash, signature
+
+
+def _band_keys(signature: Tuple[int, ...]) -> List[str]:
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(struct.pack(f"<{ROWS_PER_BAND}Q", *rows), digest_size=8)
+        keys.append(f"{band}:{digest.hexdigest()}")
+    return keys
+
+
+def _similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+
+@dataclass
+class DedupPlan:
+    """Outcome of checking one file's chunks against the canonical set."""
+    unique: List[int] = field(default_factory=list)
+    duplicates: List[Tuple[int, str]] = field(default_factory=list)  # chunk index -> canonical id
+    fingerprints: List[Tuple[str, Tuple[int, ...]]] = field(default_factory=list)
+
+    @property
+    def ratio(self) -> float:
+        total = len(self.unique) + len(self.duplicates)
+        return len(self.duplicates) / total if total else 0.0
+
+
+class ChunkDeduplicator:
+    """SQLite-backed canonical chunk registry with MinHash LSH lookups."""
+
+    def __init__(self, db_path: str, threshold: float = DEFAULT_THRESHOLD, read_only: bool = False):
+        self.db_path = db_path
+        self.threshold = threshold
+        # Reader workers only look up links; the writer owns the schema.
+        self.read_only = read_only
+        if read_only:
+            return
+        with self._connect() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS chunks (
+                    chunk_id TEXT PRIMARY KEY,
+                    source_file TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    signature BLOB NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS chunks_hash ON chunks(content_hash);
+                CREATE INDEX IF NOT EXISTS chunks_file ON chunks(source_file);
+                CREATE TABLE IF NOT EXISTS bands (
+                    band_key TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS bands_key ON bands(band_key);
+                CREATE INDEX IF NOT EXISTS bands_chunk ON bands(chunk_id);
+                CREATE TABLE IF NOT EXISTS links (
+                    canonical_id TEXT NOT NULL,
+                    source_file TEXT NOT NULL,
+                    doc_id TEXT NOT NULL,
+                    start INTEGER NOT NULL,
+                    "end" INTEGER NOT NULL,
+                    page INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS links_canonical ON links(canonical_id);
+                CREATE INDEX IF NOT EXISTS links_file ON links(source_file);
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        if self.read_only:
+            conn = sqlite3.connect(f"{Path(self.db_path).resolve().as_uri()}?mode=ro", uri=True, timeout=30)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            if not self.read_only:
+                conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _find_canonical(self, conn, content_hash: str, signature) -> str | None:
+        row = conn.execute(
+            "SELECT chunk_id FROM chunks WHERE content_hash = ? LIMIT 1", (content_hash,)
+        ).fetchone()
+        if row:
+            return row[0]
+
+        keys = _band_keys(signature)
+        placeholders = ",".join("?" * len(keys))
+        candidates = conn.execute(
+            f"SELECT DISTINCT c.chunk_id, c.signature FROM bands b "
+            f"JOIN chunks c ON c.chunk_id = b.chunk_id WHERE b.band_key IN ({placeholders})",
+            keys,
+        ).fetchall()
+        best_id, best_score = None, self.threshold
+        for chunk_id, blob in candidates:
+            score = _similarity(signature, struct.unpack(_SIGNATURE_FORMAT, blob))
+            if score >= best_score:
+                best_id, best_score = chunk_id, score
+        return best_id
+
+    def partition(self, chunks) -> DedupPlan:
+        """Split chunks into ones to store and duplicates of canonical chunks.
+
+        Chunks must carry a ``chunk_id`` in metadata. Chunks without text-store
+        offsets are always kept, since a link needs offsets to resolve.
+        """
+        plan = DedupPlan()
+        local_hashes: Dict[str, str] = {}
+        local_bands: Dict[str, List[Tuple[str, Tuple[int, ...]]]] = {}
+
+        with self._connect() as conn:
+            for idx, chunk in enumerate(chunks):
+                content_hash, signature = fingerprint(chunk.page_content)
+                plan.fingerprints.append((content_hash, signature))
+                if "doc_id" not in chunk.metadata:
+                    plan.unique.append(idx)
+                    continue
+
+                canonical = local_hashes.get(content_hash)
+                if canonical is None:
+                    keys = _band_keys(signature)
+                    for key in keys:
+                        for other_id, other_sig in local_bands.get(key, []):
+                            if _similarity(signature, other_sig) >= self.threshold:
+                                canonical = other_id
+                                break
+                        if canonical:
+                            break
+                if canonical is None:
+                    canonical = self._find_canonical(conn, content_hash, signature)
+
+                if canonical is not None:
+                    plan.duplicates.append((idx, canonical))
+                    continue
+
+                chunk_id = chunk.metadata["chunk_id"]
+                plan.unique.append(idx)
+                local_hashes[content_hash] = chunk_id
+                for key in _band_keys(signature):
+                    local_bands.setdefault(key, []).append((chunk_id, signature))
+        return plan
+
+    def record(self, file_name: str, chunks, plan: DedupPlan) -> List[int]:
+        """Persist canonical chunks and duplicate links after vectors are stored.
+
+        Runs in one write transaction, so each link is checked against the
+        canonical chunks as they are now: ``partition`` ran earlier, and with
+        several ingestion workers the canonical chunk's file may have been
+        deleted since. Returns the indices of those duplicates; the caller
+        must store them as this file's own chunks. Near-duplicates within
+        the file are stored once and get no link to the file itself.
+        """
+        own = {chunks[idx].metadata["chunk_id"] for idx in plan.unique}
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for idx in plan.unique:
+                meta = chunks[idx].metadata
+                if "doc_id" not in meta:
+                    continue
+                content_hash, signature = plan.fingerprints[idx]
+                self._insert_canonical(conn, meta["chunk_id"], file_name, content_hash, signature)
+
+            wanted = sorted({cid for _, cid in plan.duplicates} - own)
+            existing = set()
+            for start in range(0, len(wanted), 500):
+                batch = wanted[start:start + 500]
+                existing.update(
+                    row[0] for row in conn.execute(
+                        f"SELECT chunk_id FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})",
+                        batch,
+                    )
+                )
+            links, missing = [], []
+            for idx, canonical_id in plan.duplicates:
+                if canonical_id in own:
+                    continue
+                if canonical_id not in existing:
+                    missing.append(idx)
+                    continue
+                meta = chunks[idx].metadata
+                links.append(
+                    (canonical_id, file_name, meta["doc_id"], meta["start"], meta["end"], meta.get("page"))
+                )
+            conn.executemany(
+                'INSERT INTO links (canonical_id, source_file, doc_id, start, "end", page) '
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                links,
+            )
+        return missing
+
+    def _insert_canonical(self, conn, chunk_id, file_name, content_hash, signature) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO chunks (chunk_id, source_file, content_hash, signature) "
+            "VALUES (?, ?, ?, ?)",
+            (chunk_id, file_name, content_hash, struct.pack(_SIGNATURE_FORMAT, *signature)),
+        )
+        conn.executemany(
+            "INSERT INTO bands (band_key, chunk_id) VALUES (?, ?)",
+            [(key, chunk_id) for key in _band_keys(signature)],
+        )
+
+    def linked_sources(self, chunk_ids: Iterable[str]) -> Dict[str, List[str]]:
+        """Return, per canonical chunk id, the other files that contain it."""
+        chunk_ids = list(chunk_ids)
+        if not chunk_ids:
+            return {}
+        placeholders = ",".join("?" * len(chunk_ids))
+        linked: Dict[str, List[str]] = {}
+        with self._connect() as conn:
+            for canonical_id, source_file in conn.execute(
+                f"SELECT DISTINCT canonical_id, source_file FROM links "
+                f"WHERE canonical_id IN ({placeholders})",
+                chunk_ids,
+            ):
+                linked.setdefault(canonical_id, []).append(source_file)
+        return linked
+
+    def linked_files(self) -> List[str]:
+        """Files that have at least one chunk stored as a link."""
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute("SELECT DISTINCT source_file FROM links")]
+
+    def canonical_owners(self, files: Iterable[str]) -> List[str]:
+        """Files that own canonical chunks linked from ``files``."""
+        files = list(files)
+        if not files:
+            return []
+        placeholders = ",".join("?" * len(files))
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT DISTINCT c.source_file FROM links l "
+                f"JOIN chunks c ON c.chunk_id = l.canonical_id "
+                f"WHERE l.source_file IN ({placeholders})",
+                files,
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def heirs_for(self, file_name: str) -> Dict[str, dict]:
+        """For each canonical chunk of ``file_name`` still linked from another
+        file, the link that should inherit the vector when the file is removed."""
+        heirs: Dict[str, dict] = {}
+        with self._connect() as conn:
+            for row in conn.execute(
+                'SELECT l.rowid, l.canonical_id, l.source_file, l.doc_id, l.start, l."end", l.page '
+                "FROM links l JOIN chunks c ON c.chunk_id = l.canonical_id "
+                "WHERE c.source_file = ? AND l.source_file != ? ORDER BY l.rowid",
+                (file_name, file_name),
+            ):
+                rowid, canonical_id, source_file, doc_id, start, end, page = row
+                heirs.setdefault(canonical_id, {
+                    "rowid": rowid,
+                    "source_file": source_file,
+                    "doc_id": doc_id,
+                    "start": start,
+                    "end": end,
+                    "page": page,
+                })
+        return heirs
+
+    def remove_file(self, file_name: str, promoted: Dict[str, str] = None) -> None:
+        """Drop a file's canonical chunks and links.
+
+        ``promoted`` maps old canonical ids to the ids of the vectors re-added
+        for their heirs (see ``heirs_for``); remaining links are re-pointed.
+        """
+        promoted = promoted or {}
+        heirs = self.heirs_for(file_name) if promoted else {}
+        with self._connect() as conn:
+            conn.execute("DELETE FROM links WHERE source_file = ?", (file_name,))
+            for old_id, new_id in promoted.items():
+                heir = heirs.get(old_id)
+                row = conn.execute(
+                    "SELECT content_hash, signature FROM chunks WHERE chunk_id = ?", (old_id,)
+                ).fetchone()
+                if heir is None or row is None:
+                    continue
+                content_hash, blob = row
+                self._insert_canonical(
+                    conn, new_id, heir["source_file"], content_hash,
+                    struct.unpack(_SIGNATURE_FORMAT, blob),
+                )
+                conn.execute("DELETE FROM links WHERE rowid = ?", (heir["rowid"],))
+                conn.execute(
+                    "UPDATE links SET canonical_id = ? WHERE canonical_id = ?", (new_id, old_id)
+                )
+            conn.execute(
+                "DELETE FROM bands WHERE chunk_id IN "
+                "(SELECT chunk_id FROM chunks WHERE source_file = ?)",
+                (file_name,),
+            )
+            conn.execute("DELETE FROM chunks WHERE source_file = ?", (file_name,))
+            conn.execute(
+                "DELETE FROM links WHERE canonical_id NOT IN (SELECT chunk_id FROM chunks)"
+            )
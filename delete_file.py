@@ -1,11 +1,54 @@
 import logging
+import uuid
 
-from processor import get_vector_store
+import doc_router
+import events
+import text_store
+from processor import get_deduplicator, get_document_index, get_vector_store
 from utils import remove_from_index
 
 logger = logging.getLogger(__name__)
 
 
+def _promote_heirs(vectordb, heirs: dict) -> dict:
+    """Re-add vectors of deduplicated chunks under a file that still links them.
+
+    Returns a mapping of old canonical chunk id -> new chunk id.
+    """
+    if not heirs:
+        return {}
+    data = vectordb._collection.get(ids=list(heirs), include=["embeddings"])
+    embeddings = data.get("embeddings")
+    if embeddings is None:
+        embeddings = []
+
+    promoted = {}
+    ids, vectors, metadatas = [], [], []
+    for old_id, vec in zip(data.get("ids", []), embeddings):
+        heir = heirs[old_id]
+        new_id = str(uuid.uuid4())
+        meta = {
+            "source_file": heir["source_file"],
+            "doc_id": heir["doc_id"],
+            "start": heir["start"],
+            "end": heir["end"],
+            "chunk_id": new_id,
+        }
+        if heir["page"] is not None:
+            meta["page"] = heir["page"]
+        promoted[old_id] = new_id
+        ids.append(new_id)
+        vectors.append(list(vec))
+        metadatas.append(meta)
+
+    if ids:
+        vectordb._collection.add(
+            ids=ids, embeddings=vectors, metadatas=metadatas, documents=[""] * len(ids)
+        )
+        logger.info(f"Promoted {len(ids)} shared chunks to their remaining sources")
+    return promoted
+
+
 def delete_file(file_name: str) -> int:
     """Delete all vector chunks belonging to one source file.
 
@@ -21,9 +64,18 @@ def delete_file(file_name: str) -> int:
         if meta and meta.get("source_file") == file_name
     ]
 
+    deduplicator = get_deduplicator()
+    if deduplicator is not None:
+        promoted = _promote_heirs(vectordb, deduplicator.heirs_for(file_name))
+        deduplicator.remove_file(file_name, promoted)
+
+    text_store.remove_document(text_store.doc_id_for(file_name))
+    doc_router.remove_document(get_document_index(), file_name)
+
     if not ids_to_delete:
         logger.warning(f"No vectors found for {file_name}")
         remove_from_index(file_name)
+        events.publish("catalog", action="deleted", file=file_name)
         return 0
 
     try:
@@ -33,5 +85,6 @@ def delete_file(file_name: str) -> int:
         vectordb._collection.delete(ids=ids_to_delete)
 
     remove_from_index(file_name)
+    events.publish("catalog", action="deleted", file=file_name)
     logger.info(f"Removed {len(ids_to_delete)} chunks for {file_name}")
     return len(ids_to_delete)
@@ -0,0 +1,129 @@
+"""Document-level routing index.
+
+Alongside the chunk collection we keep a small collection holding one
+centroid embedding per file and one per section (PDF page, or a fixed run of
+chunks for formats without pages). Queries are first matched against this
+index to pick the top-M files, and the chunk search is then restricted to them.
+"""
+
+import logging
+import math
+from collections import OrderedDict
+from typing import Dict, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_INDEX_COLLECTION = "document_index"
+CHUNKS_PER_SECTION = 20
+
+
+def _centroid(vectors: Sequence[Sequence[float]]) -> List[float]:
+    dim = len(vectors[0])
+    total = [0.0] * dim
+    for vec in vectors:
+        for i, value in enumerate(vec):
+            total[i] += value
+    norm = math.sqrt(sum(v * v for v in total)) or 1.0
+    return [v / norm for v in total]
+
+
+def _section_key(meta: Dict, position: int):
+    page = meta.get("page")
+    if isinstance(page, int):
+        return f"p{page}"
+    return f"c{position // CHUNKS_PER_SECTION}"
+
+
+def index_document(doc_index, file_name: str, doc_id: str, metadatas, embeddings) -> int:
+    """Store file and section centroids for one ingested file.
+
+    Returns the number of routing entries written.
+    """
+    if not embeddings:
+        return 0
+
+    sections: "OrderedDict[str, list]" = OrderedDict()
+    for position, (meta, vec) in enumerate(zip(metadatas, embeddings)):
+        sections.setdefault(_section_key(meta or {}, position), []).append(vec)
+
+    ids = [f"{doc_id}:doc"]
+    vectors = [_centroid(embeddings)]
+    metas = [{"source_file": file_name, "level": "doc"}]
+    for key, vecs in sections.items():
+        ids.append(f"{doc_id}:sec:{key}")
+        vectors.append(_centroid(vecs))
+        metas.append({"source_file": file_name, "level": "section", "section": key})
+
+    doc_index._collection.upsert(
+        ids=ids,
+        embeddings=vectors,
+        metadatas=metas,
+        documents=[""] * len(ids),
+    )
+    return len(ids)
+
+
+def remove_document(doc_index, file_name: str) -> None:
+    try:
+        doc_index._collection.delete(where={"source_file": file_name})
+    except Exception as exc:
+        logger.warning(f"Could not remove routing entries for {file_name}: {exc}")
+
+
+def file_count(doc_index) -> int:
+    """Number of files in the routing index (section entries not counted)."""
+    return len(doc_index._collection.get(where={"level": "doc"}, include=[])["ids"])
+
+
+def route(doc_index, query_embedding: List[float], top_m: int) -> List[str]:
+    """Return up to ``top_m`` source files, ranked by their best matching
+    file or section centroid.
+
+    The query window grows until it holds ``top_m`` distinct files, so the
+    many sections of one long document cannot crowd out the others.
+    """
+    total = doc_index._collection.count()
+    window = top_m * 4
+    while True:
+        n_results = min(total, window)
+        if n_results == 0:
+            return []
+        result = doc_index._collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            include=["metadatas"],
+        )
+        files: List[str] = []
+        for meta in (result.get("metadatas") or [[]])[0]:
+            name = (meta or {}).get("source_file")
+            if name and name not in files:
+                files.append(name)
+                if len(files) >= top_m:
+                    return files
+        if n_results >= total:
+            return files
+        window *= 4
+
+
+def rebuild(vectordb, doc_index) -> int:
+    """Build the routing index from chunk embeddings already in the vector store."""
+    data = vectordb._collection.get(include=["metadatas", "embeddings"])
+    embeddings = data.get("embeddings")
+    if embeddings is None:
+        embeddings = []
+    grouped: Dict[str, tuple] = {}
+    for meta, vec in zip(data.get("metadatas") or [], embeddings):
+        name = (meta or {}).get("source_file")
+        if not name:
+            continue
+        metas, vecs = grouped.setdefault(name, ([], []))
+        metas.append(meta)
+        vecs.append(list(vec))
+
+    from text_store import doc_id_for
+
+    written = 0
+    for name, (metas, vecs) in grouped.items():
+        written += index_document(doc_index, name, doc_id_for(name), metas, vecs)
+    logger.info(f"Rebuilt document routing index for {len(grouped)} files ({written} entries)")
+    return written
@@ -0,0 +1,92 @@
+"""In-process event broker for server-sent events.
+
+Ingestion workers and catalog changes ``publish`` events from any thread;
+each ``/api/events`` connection ``subscribe``s with its own asyncio queue.
+Recent events are kept in a ring buffer so a reconnecting ``EventSource``
+can resume from ``Last-Event-ID`` without missing progress.
+
+Event types:
+
+- ``job``: ingestion progress (``queued``, ``running``, ``parsed``,
+  ``embedding``, ``done``, ``skipped``, ``failed``)
+- ``catalog``: a file was indexed or deleted
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HISTORY = 500
+SUBSCRIBER_QUEUE = 1000
+
+_ids = itertools.count(1)
+_history: deque = deque(maxlen=HISTORY)
+_subscribers: Dict[int, Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = {}
+_listeners: List[Callable[[dict], None]] = []
+_lock = threading.Lock()
+
+
+def _deliver(queue: asyncio.Queue, event: dict) -> None:
+    if queue.full():
+        # A stalled client loses its oldest events rather than growing memory.
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+def publish(event_type: str, **data) -> dict:
+    """Record an event and fan it out to every subscriber (thread-safe)."""
+    with _lock:
+        event = {"id": next(_ids), "type": event_type, "time": time.time(), "data": data}
+        _history.append(event)
+        subscribers = list(_subscribers.values())
+        listeners = list(_listeners)
+    for listener in listeners:
+        try:
+            listener(event)
+        except Exception as exc:
+            logger.warning(f"Event listener failed: {exc}")
+    for loop, queue in subscribers:
+        try:
+            loop.call_soon_threadsafe(_deliver, queue, event)
+        except RuntimeError:
+            pass  # loop already closed; the subscriber is going away
+    return event
+
+
+def add_listener(listener: Callable[[dict], None]) -> None:
+    """Call ``listener(event)`` synchronously in the publishing thread."""
+    with _lock:
+        _listeners.append(listener)
+
+
+def subscribe(last_event_id: Optional[int] = None) -> Tuple[int, asyncio.Queue, List[dict]]:
+    """Register the calling event loop; returns (token, queue, missed events)."""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE)
+    loop = asyncio.get_running_loop()
+    with _lock:
+        token = id(queue)
+        _subscribers[token] = (loop, queue)
+        missed = [e for e in _history if last_event_id is not None and e["id"] > last_event_id]
+    return token, queue, missed
+
+
+def unsubscribe(token: int) -> None:
+    with _lock:
+        _subscribers.pop(token, None)
+
+
+def subscriber_count() -> int:
+    with _lock:
+        return len(_subscribers)
+
+
+def format_sse(event: dict) -> str:
+    payload = json.dumps({"type": event["type"], "time": event["time"], **event["data"]})
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
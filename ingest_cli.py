@@ -0,0 +1,378 @@
+"""
+Offline bulk ingestion.
+
+Builds or extends the index from a directory tree or a file list without
+running the server, for example on a batch machine whose data directory is
+shipped afterwards:
+
+    python ingest_cli.py /data/library
+    python ingest_cli.py --list files.txt --workers 8 --batch-size 1024 --data-dir /srv/clara
+
+Files are placed in ``uploads/`` (hard-linked when possible), parsed in a
+process pool, embedded across files in large batches and written to the
+vector store in bulk. Progress is checkpointed to ``ingest_checkpoint.jsonl``
+in the data directory; running the same command again after an interruption
+rolls back the files that were being written and continues with the rest.
+A throughput summary is printed at the end (and written with ``--output``).
+
+Stop the server, or point ``--data-dir`` at another directory, while this
+runs: both would write the same stores.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("ingest_cli")
+
+CHECKPOINT_FILE = "ingest_checkpoint.jsonl"
+PROGRESS_SECONDS = 10.0
+
+
+def collect_files(paths: List[str], list_file: Optional[str] = None) -> List[str]:
+    """Absolute paths of the supported files under ``paths`` and in ``list_file``."""
+    from loaders import is_supported
+
+    candidates = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                candidates.extend(os.path.join(root, name) for name in sorted(names) if is_supported(name))
+        else:
+            candidates.append(path)
+    if list_file:
+        with (sys.stdin if list_file == "-" else open(list_file, "r", encoding="utf-8")) as f:
+            candidates.extend(line.strip() for line in f if line.strip())
+    return list(dict.fromkeys(os.path.abspath(path) for path in candidates))
+
+
+class Checkpoint:
+    """Append-only progress log.
+
+    ``writing`` lines are appended before a file's data is written and
+    ``done`` lines once it is committed to the index files, so a file with
+    only a ``writing`` line was interrupted and has to be rolled back.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Dict[str, List[int]] = {}  # source path -> [size, mtime_ns]
+        self.interrupted = set()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line
+                    if "writing" in record:
+                        self.interrupted.add(record["writing"])
+                    elif "done" in record:
+                        self.interrupted.discard(record["file_name"])
+                        self.done[record["done"]] = record["stat"]
+        except FileNotFoundError:
+            pass
+        self._file = open(path, "a", encoding="utf-8")
+
+    def is_done(self, source: str, stat: os.stat_result) -> bool:
+        return self.done.get(source) == [stat.st_size, stat.st_mtime_ns]
+
+    def writing(self, file_name: str) -> None:
+        self._append({"writing": file_name})
+        self._file.flush()
+
+    def commit(self, records: List[dict]) -> None:
+        for record in records:
+            self._append(record)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _append(self, record: dict) -> None:
+        self._file.write(json.dumps(record) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _place(source: str, dest: str) -> None:
+    """Hard-link (or copy) ``source`` to ``dest``, replacing it atomically."""
+    if os.path.exists(dest) and os.path.samefile(source, dest):
+        return  # linked by an earlier run (renaming onto the same inode would be a no-op)
+    tmp_path = f"{dest}.{os.getpid()}.part"
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copy2(source, tmp_path)
+    os.replace(tmp_path, dest)
+
+
+def _init_worker() -> None:
+    # Each worker parses whole files; no nested pool for page ranges.
+    os.environ["PARSE_WORKERS"] = "1"
+
+
+def _parse(source: str, dest: str, indexed_sha256: Optional[str]):
+    """Worker process: place the file in uploads/ and extract its pages.
+
+    Returns ``(sha256, pages, seconds)``; ``pages`` is None when the content
+    matches what is already indexed.
+    """
+    import loaders
+    from utils import file_sha256
+
+    started = time.perf_counter()
+    if source != dest:
+        _place(source, dest)
+    sha256 = file_sha256(dest)
+    if sha256 == indexed_sha256:
+        return sha256, None, time.perf_counter() - started
+    return sha256, loaders.load_pages(dest, sha256), time.perf_counter() - started
+
+
+class BulkIngest:
+    def __init__(self, checkpoint: Checkpoint, batch_size: int, commit_every: int):
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.group = []  # (source, prepared) not embedded yet
+        self.group_chunks = 0
+        self.written: Dict[str, tuple] = {}  # file name -> (source, chunk count, meta), not committed
+        self.committed: List[dict] = []
+        self.stats = {
+            "files": 0, "indexed": 0, "unchanged": 0, "already_done": 0, "failed": 0,
+            "pages": 0, "chunks": 0, "stored_chunks": 0, "duplicate_chunks": 0,
+            "parse_seconds": 0.0, "embed_seconds": 0.0, "write_seconds": 0.0,
+        }
+        self.failures: List[dict] = []
+
+    def fail(self, source: str, error: str, roll_back: bool = False) -> None:
+        logger.error(f"{source}: {error}")
+        self.stats["failed"] += 1
+        self.failures.append({"file": source, "error": error})
+        if roll_back:
+            _roll_back([os.path.basename(source)])
+
+    def unchanged(self, source: str) -> None:
+        self.stats["unchanged"] += 1
+        self._record(source, "unchanged")
+
+    def add(self, source: str, dest: str, sha256: str, pages: List[str]) -> None:
+        import processor
+
+        self.checkpoint.writing(os.path.basename(dest))
+        try:
+            prepared = processor.prepare_file(dest, sha256, pages=pages)
+        except Exception as exc:
+            self.fail(source, str(exc), roll_back=True)
+            return
+        self.group.append((source, prepared))
+        self.group_chunks += len(prepared.plan.unique)
+        if self.group_chunks >= self.batch_size:
+            self.write_group()
+
+    def write_group(self) -> None:
+        """Embed the pending files' chunks together and store them in bulk."""
+        import processor
+
+        group, self.group, self.group_chunks = self.group, [], 0
+        if not group:
+            return
+        chunks = [chunk for _, prepared in group for chunk in prepared.unique_chunks]
+        try:
+            started = time.perf_counter()
+            embeddings = processor.embed_documents([c.page_content for c in chunks]) if chunks else []
+            self.stats["embed_seconds"] += time.perf_counter() - started
+
+            started = time.perf_counter()
+            processor.store_chunks(processor.get_vector_store(), chunks, embeddings)
+            offset = 0
+            for source, prepared in group:
+                count = len(prepared.plan.unique)
+                meta = processor.finish_file(prepared, embeddings[offset:offset + count])
+                offset += count
+                self.written[prepared.file_name] = (source, len(prepared.chunks), meta)
+                self.stats["pages"] += prepared.pages
+                self.stats["chunks"] += len(prepared.chunks)
+                self.stats["stored_chunks"] += len(prepared.plan.unique)  # may include re-homed duplicates
+                self.stats["duplicate_chunks"] += len(prepared.plan.duplicates)
+            self.stats["write_seconds"] += time.perf_counter() - started
+        except Exception as exc:
+            for source, prepared in group:
+                self.written.pop(prepared.file_name, None)
+                self.fail(source, str(exc), roll_back=True)
+            return
+        if len(self.written) >= self.commit_every:
+            self.commit()
+
+    def commit(self) -> None:
+        """Add the written files to the index files, then checkpoint them."""
+        from utils import update_file_entries
+
+        if self.written:
+            update_file_entries({name: (chunks, meta) for name, (_, chunks, meta) in self.written.items()})
+            self.stats["indexed"] += len(self.written)
+            for source, _, _ in self.written.values():
+                self._record(source, "indexed")
+            self.written = {}
+        self.checkpoint.commit(self.committed)
+        self.committed = []
+
+    def _record(self, source: str, status: str) -> None:
+        stat = os.stat(source)
+        self.committed.append({
+            "done": source,
+            "file_name": os.path.basename(source),
+            "stat": [stat.st_size, stat.st_mtime_ns],
+            "status": status,
+        })
+
+
+def _roll_back(file_names) -> None:
+    from delete_file import delete_file
+
+    for file_name in file_names:
+        try:
+            delete_file(file_name)
+        except Exception as exc:
+            logger.error(f"Could not roll back {file_name}: {exc}")
+
+
+def run(files: List[str], workers: int, batch_size: int, commit_every: int, checkpoint_path: str) -> dict:
+    import processor
+    from utils import load_file_index, load_file_meta
+
+    started = time.perf_counter()
+    checkpoint = Checkpoint(checkpoint_path)
+    index = load_file_index()
+    interrupted = [name for name in checkpoint.interrupted if name not in index]
+    if interrupted:
+        logger.info(f"Rolling back {len(interrupted)} file(s) interrupted by the previous run")
+        _roll_back(interrupted)
+    meta = load_file_meta()
+    os.makedirs(processor.UPLOAD_FOLDER, exist_ok=True)
+    upload_dir = os.path.abspath(processor.UPLOAD_FOLDER)
+    for name in os.listdir(upload_dir):
+        if name.endswith(".part"):
+            os.remove(os.path.join(upload_dir, name))  # placement cut short by the previous run
+
+    ingest = BulkIngest(checkpoint, batch_size, commit_every)
+    ingest.stats["files"] = len(files)
+    todo, owners = [], {}
+    for source in files:
+        name = os.path.basename(source)
+        try:
+            stat = os.stat(source)
+        except OSError as exc:
+            ingest.fail(source, str(exc))
+            continue
+        if owners.setdefault(name, source) != source:
+            ingest.fail(source, f"another file named {name} is already part of this import ({owners[name]})")
+        elif checkpoint.is_done(source, stat):
+            ingest.stats["already_done"] += 1
+        else:
+            indexed_sha256 = meta.get(name, {}).get("sha256") if index.get(name) else None
+            todo.append((source, os.path.join(upload_dir, name), indexed_sha256))
+    logger.info(
+        f"{len(files)} files: {len(todo)} to process, {ingest.stats['already_done']} done in a previous run"
+    )
+
+    finished, reported_at = 0, time.perf_counter()
+    # Spawned so workers never inherit locks held by the parent's threads.
+    pool = ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, mp_context=multiprocessing.get_context("spawn")
+    )
+    pending = {}
+    try:
+        queue = iter(todo)
+        while True:
+            while len(pending) < workers * 2:
+                item = next(queue, None)
+                if item is None:
+                    break
+                pending[pool.submit(_parse, *item)] = item
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                source, dest, _ = pending.pop(future)
+                finished += 1
+                try:
+                    sha256, pages, seconds = future.result()
+                except Exception as exc:
+                    ingest.fail(source, str(exc))
+                    continue
+                ingest.stats["parse_seconds"] += seconds
+                if pages is None:
+                    ingest.unchanged(source)
+                else:
+                    ingest.add(source, dest, sha256, pages)
+            if time.perf_counter() - reported_at >= PROGRESS_SECONDS:
+                reported_at = time.perf_counter()
+                elapsed = reported_at - started
+                logger.info(
+                    f"{finished}/{len(todo)} files parsed, {ingest.stats['chunks']} chunks written "
+                    f"({finished / elapsed:.1f} files/s)"
+                )
+        ingest.write_group()
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; keeping the files already written. Run the same command to resume.")
+        ingest.stats["interrupted"] = True
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        ingest.commit()
+        checkpoint.close()
+
+    elapsed = time.perf_counter() - started
+    stats = ingest.stats
+    stats["seconds"] = round(elapsed, 3)
+    stats["files_per_second"] = round((stats["indexed"] + stats["unchanged"]) / elapsed, 2) if elapsed else 0.0
+    stats["chunks_per_second"] = round(stats["chunks"] / elapsed, 1) if elapsed else 0.0
+    for key in ("parse_seconds", "embed_seconds", "write_seconds"):
+        stats[key] = round(stats[key], 3)
+    stats["workers"] = workers
+    stats["batch_size"] = batch_size
+    stats["failures"] = ingest.failures[:100]
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a directory tree or file list without the server.")
+    parser.add_argument("paths", nargs="*", help="Files or directories (searched recursively)")
+    parser.add_argument("--list", help="File with one path per line ('-' for stdin)")
+    parser.add_argument("--data-dir", default=".", help="Directory holding uploads/, chroma_store/ and the index files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Parsing processes")
+    parser.add_argument("--batch-size", type=int, default=512, help="Chunks embedded and written per batch")
+    parser.add_argument("--commit-every", type=int, default=200, help="Files per index update and checkpoint")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE, help="Progress file, relative to --data-dir")
+    parser.add_argument("--output", help="Write the summary as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    files = collect_files(args.paths, args.list)
+    if not files:
+        parser.error("no supported files given")
+    output = os.path.abspath(args.output) if args.output else None
+    os.makedirs(args.data_dir, exist_ok=True)
+    os.chdir(args.data_dir)
+
+    stats = run(files, max(1, args.workers), max(1, args.batch_size), max(1, args.commit_every), args.checkpoint)
+    print(json.dumps(stats, indent=2))
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2)
+    if stats.get("interrupted"):
+        sys.exit(130)
+    if stats["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Crash-safe record of unfinished ingestion jobs.
+
+Every job is appended to ``ingest_journal.jsonl`` when it is queued and
+when it starts running, and is marked finished when it completes. The
+file is only appended to while jobs are active, and it is truncated once
+none are left. After a crash, a kill or a shutdown that could not drain
+in time, ``unfinished()`` replays it:
+
+- jobs that were ``running`` may have left partial vectors, so they are
+  rolled back before being queued again;
+- jobs that were only ``queued`` are queued again as they are.
+
+``claim_unfinished()`` takes those jobs over without touching the records
+of jobs this process has journaled since it started.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict
+
+JOURNAL_FILE = os.getenv("INGEST_JOURNAL", "ingest_journal.jsonl")
+
+_active: Dict[str, dict] = {}
+_lock = threading.Lock()
+
+
+def _append(record: dict) -> None:
+    with open(JOURNAL_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+
+
+def record(job, status: str) -> None:
+    """Journal ``job`` as ``queued`` or ``running``."""
+    entry = {
+        "job_id": job.id,
+        "file_name": job.file_name,
+        "path": job.path,
+        "source": job.source,
+        "status": status,
+        "time": time.time(),
+    }
+    with _lock:
+        _active[job.id] = entry
+        _append(entry)
+
+
+def finish(job_id: str) -> None:
+    with _lock:
+        if _active.pop(job_id, None) is None:
+            return
+        if _active:
+            _append({"job_id": job_id, "status": "finished"})
+        else:
+            # Nothing in flight: compact the journal to nothing.
+            open(JOURNAL_FILE, "w").close()
+
+
+def unfinished() -> Dict[str, dict]:
+    """Jobs journaled by a previous run that never finished, by job id."""
+    entries: Dict[str, dict] = {}
+    try:
+        with open(JOURNAL_FILE, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a crash
+                if entry.get("status") == "finished":
+                    entries.pop(entry["job_id"], None)
+                else:
+                    entries[entry["job_id"]] = entry
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def claim_unfinished() -> Dict[str, dict]:
+    """Return a previous run's unfinished jobs and mark them finished.
+
+    Jobs journaled by this process are neither returned nor touched, so
+    uploads accepted while recovery runs keep their records.
+    """
+    with _lock:
+        entries = {job_id: entry for job_id, entry in unfinished().items() if job_id not in _active}
+        if entries:
+            if _active:
+                for job_id in entries:
+                    _append({"job_id": job_id, "status": "finished"})
+            else:
+                open(JOURNAL_FILE, "w").close()
+    return entries
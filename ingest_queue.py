@@ -0,0 +1,420 @@
+"""Ingestion job queue.
+
+Uploads and the file watcher submit files here instead of spawning ad-hoc
+threads. A bounded worker pool (``INGEST_WORKERS``, default 2) runs
+``process_file``; each submission gets a job id whose state can be polled
+via ``GET /api/jobs/{id}``. A file that already has a queued or running job
+is not queued twice, and a file whose content hash matches what is already
+indexed is skipped, so an upload and the watcher event for the same file
+only ingest it once.
+
+Every job is recorded in ``ingest_journal`` until it finishes. On shutdown
+``drain`` stops taking new work, lets running jobs finish within
+``INGEST_DRAIN_SECONDS`` and then cancels the rest at the next embedding
+batch, rolling back what they wrote; jobs that did not complete stay in the
+journal and ``resume_interrupted`` queues them again on the next start.
+
+In multi-worker mode (see ``coordinator``) only the writer process runs
+jobs; reader workers get a ``SpooledQueue`` that forwards submissions to
+the writer and reads job state back from the shared state directory.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+import coordinator
+import events
+import ingest_journal
+import metrics
+import profiling
+from utils import env_float, env_int, file_sha256, load_file_index, load_file_meta
+
+logger = logging.getLogger(__name__)
+
+JOB_HISTORY = 1000
+ACTIVE_STATES = ("queued", "running")
+CANCEL_GRACE_SECONDS = 10.0
+
+
+class IngestCancelled(Exception):
+    """Raised inside a running job when the queue is shutting down."""
+
+
+@dataclass
+class Job:
+    id: str
+    file_name: str
+    path: str
+    source: str
+    sha256: Optional[str] = None
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    chunks: Optional[int] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def emit(self, stage: str, **data) -> None:
+        events.publish("job", job_id=self.id, file=self.file_name, source=self.source, stage=stage, **data)
+
+
+@dataclass
+class Batch:
+    id: str
+    created_at: float = field(default_factory=time.time)
+    job_ids: List[str] = field(default_factory=list)
+    skipped: List[dict] = field(default_factory=list)  # rejected before queueing
+
+
+class IngestQueue:
+    def __init__(self, workers: int):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ingest")
+        self._init_state()
+
+    def _init_state(self) -> None:
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: Dict[str, Job] = {}  # file name -> queued/running job
+        self._batches: "OrderedDict[str, Batch]" = OrderedDict()
+        self._aliases: Dict[str, str] = {}  # requested job id -> job it was merged into
+        self._lock = threading.Lock()
+        self._closing = False
+        self._cancel = threading.Event()
+
+    def submit(
+        self, path: str, sha256: str = None, source: str = "api", delay: float = 0.0, job_id: str = None
+    ) -> Job:
+        file_name = os.path.basename(path)
+        with self._lock:
+            existing = self._active.get(file_name)
+            if existing is not None and existing.status == "queued":
+                # Not started yet: it will pick up the latest content anyway.
+                if sha256:
+                    existing.sha256 = sha256
+                if job_id:
+                    self._aliases[job_id] = existing.id
+                return existing
+            job = Job(id=job_id or uuid.uuid4().hex, file_name=file_name, path=path, source=source, sha256=sha256)
+            self._jobs[job.id] = job
+            self._active[file_name] = job
+            self._trim()
+            ingest_journal.record(job, "queued")
+            if self._closing:
+                # Shutting down: the journal entry makes the next start pick it up.
+                job.status = "deferred"
+        job.emit(job.status)
+        if job.status == "queued":
+            self._pool.submit(self._run, job, existing, delay)
+        return job
+
+    def _trim(self) -> None:
+        while len(self._jobs) > JOB_HISTORY:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.status in ACTIVE_STATES:
+                break
+            self._jobs.pop(oldest_id)
+        while len(self._batches) > JOB_HISTORY:
+            self._batches.popitem(last=False)
+        while len(self._aliases) > JOB_HISTORY:
+            self._aliases.pop(next(iter(self._aliases)))
+
+    def create_batch(self) -> Batch:
+        batch = Batch(id=uuid.uuid4().hex)
+        with self._lock:
+            self._batches[batch.id] = batch
+            self._trim()
+        return batch
+
+    def record_batch(self, batch: Batch) -> None:
+        """Share a finished batch with the other workers (multi-worker mode)."""
+        coordinator.record_batch(asdict(batch))
+
+    def batch_status(self, batch_id: str) -> Optional[dict]:
+        """Aggregate progress of the jobs in a batch."""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+        if batch is None:
+            stored = coordinator.read_batch(batch_id)
+            if stored is None:
+                return None
+            batch = Batch(**stored)
+        jobs = [job for job in map(self.get, batch.job_ids) if job is not None]
+        counts = {}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        finished = sum(1 for job in jobs if job.status not in ACTIVE_STATES)
+        return {
+            "batch_id": batch.id,
+            "created_at": batch.created_at,
+            "total": len(batch.job_ids),
+            "finished": finished,
+            "progress": round(finished / len(jobs), 4) if jobs else 1.0,
+            "complete": finished == len(jobs),
+            "counts": counts,
+            "chunks": sum(job.chunks or 0 for job in jobs),
+            "jobs": [job.to_dict() for job in jobs],
+            "skipped": batch.skipped,
+        }
+
+    def _run(self, job: Job, previous: Optional[Job], delay: float) -> None:
+        from processor import process_file
+
+        if previous is not None:
+            # A newer upload of a file that is being ingested right now: wait for it.
+            while previous.status in ACTIVE_STATES:
+                time.sleep(0.2)
+        if delay:
+            time.sleep(delay)
+        if self._closing:
+            job.status = "deferred"
+            job.emit("deferred")
+            self._release(job)
+            return
+
+        job.status, job.started_at = "running", time.time()
+        ingest_journal.record(job, "running")
+        job.emit("running")
+        writing = False
+        try:
+            if not os.path.exists(job.path):
+                raise FileNotFoundError(f"File not found: {job.path}")
+            job.sha256 = job.sha256 or file_sha256(job.path)
+            indexed = load_file_index().get(job.file_name)
+            if indexed and load_file_meta().get(job.file_name, {}).get("sha256") == job.sha256:
+                job.status, job.chunks = "skipped", indexed
+                job.emit("skipped", chunks=indexed)
+                logger.info(f"{job.file_name} is unchanged; skipping ingestion")
+                return
+            writing = True
+            with profiling.ingest_scope(job.file_name):
+                process_file(job.path, file_hash=job.sha256, progress=self._progress(job))
+            job.chunks = load_file_index().get(job.file_name, 0)
+            job.status = "done"
+            job.emit("done", chunks=job.chunks)
+            metrics.INGEST_FILES.inc(status="ok")
+            logger.info(f"Successfully processed: {job.file_name}")
+        except IngestCancelled:
+            job.status = "interrupted"
+            if _roll_back(job.file_name):
+                # Nothing of it is left in the index: next start ingests it from scratch.
+                ingest_journal.record(job, "queued")
+            job.emit("interrupted")
+            logger.warning(f"Ingestion of {job.file_name} interrupted by shutdown; it will resume on restart")
+        except Exception as exc:
+            job.status, job.error = "failed", str(exc)
+            if writing:
+                _roll_back(job.file_name)
+            job.emit("failed", error=job.error)
+            metrics.INGEST_FILES.inc(status="error")
+            logger.error(f"Error processing file {job.path}: {exc}")
+        finally:
+            job.finished_at = time.time()
+            if job.status != "interrupted":
+                ingest_journal.finish(job.id)
+            self._release(job)
+
+    def _progress(self, job: Job):
+        """``job.emit`` that aborts the job at the next batch once cancelled."""
+        def progress(stage: str, **data) -> None:
+            if self._cancel.is_set():
+                raise IngestCancelled(job.file_name)
+            job.emit(stage, **data)
+
+        return progress
+
+    def _release(self, job: Job) -> None:
+        with self._lock:
+            if self._active.get(job.file_name) is job:
+                self._active.pop(job.file_name)
+
+    def wait(self, job: Job) -> Job:
+        """Block until ``job`` leaves the queued/running states."""
+        while job.status in ACTIVE_STATES and not (self._closing and job.status == "queued"):
+            time.sleep(0.2)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(self._aliases.get(job_id, job_id))
+
+    def jobs(self, limit: int = 100) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())[-limit:][::-1]
+
+    def active_files(self) -> set:
+        with self._lock:
+            return set(self._active)
+
+    def depth(self) -> int:
+        with self._lock:
+            return len(self._active)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
+
+    def drain(self, timeout: float) -> Dict[str, int]:
+        """Stop taking work, let running jobs finish within ``timeout`` and
+        cancel whatever is still running after that.
+
+        Jobs that never started stay journaled as ``queued``; cancelled jobs
+        are rolled back and journaled again, so the next start resumes both.
+        """
+        with self._lock:
+            self._closing = True
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        deadline = time.monotonic() + max(0.0, timeout)
+        while self._running() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        if self._running():
+            logger.warning(f"Ingestion still running after {timeout:g}s; cancelling {len(self._running())} job(s)")
+            self._cancel.set()
+            deadline = time.monotonic() + CANCEL_GRACE_SECONDS
+            while self._running() and time.monotonic() < deadline:
+                time.sleep(0.1)
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {status: sum(1 for job in jobs if job.status == status)
+                  for status in ("running", "interrupted", "deferred")}
+        counts["deferred"] += sum(1 for job in jobs if job.status == "queued")
+        logger.info(f"Ingestion queue drained: {counts}")
+        return counts
+
+    def _running(self) -> List[Job]:
+        with self._lock:
+            return [job for job in self._active.values() if job.status == "running"]
+
+    def resume_interrupted(self, entries: Optional[Dict[str, dict]] = None) -> int:
+        """Queue again the jobs a previous run journaled but never finished.
+
+        ``entries`` are the jobs already claimed with
+        ``ingest_journal.claim_unfinished()``; they are claimed here if not.
+        Returns the number of files queued. Files that are still indexed
+        completed before the interruption; they go through the usual
+        unchanged-content check, so a restart does not re-ingest them.
+        """
+        if entries is None:
+            entries = ingest_journal.claim_unfinished()
+        if not entries:
+            return 0
+        index = load_file_index()
+        paths = {}
+        for entry in entries.values():
+            if entry["status"] == "running" and entry["file_name"] not in index:
+                _roll_back(entry["file_name"])
+            paths[entry["file_name"]] = entry["path"]
+        resumed = 0
+        for file_name, path in paths.items():
+            if os.path.exists(path):
+                self.submit(path, source="resume")
+                resumed += 1
+            else:
+                logger.info(f"Not resuming {file_name}: the file is gone")
+        logger.info(f"Resumed {resumed} interrupted ingestion job(s)")
+        return resumed
+
+
+def _roll_back(file_name: str) -> bool:
+    """Remove whatever a half-finished ingestion of ``file_name`` wrote."""
+    from delete_file import delete_file
+
+    try:
+        delete_file(file_name)
+        return True
+    except Exception as exc:
+        logger.error(f"Could not roll back partial ingestion of {file_name}: {exc}")
+        return False
+
+
+class SpooledQueue(IngestQueue):
+    """Reader-worker queue: the writer runs the jobs, this side tracks them."""
+
+    def __init__(self):
+        self._pool = None  # jobs run in the writer process
+        self._init_state()
+
+    def submit(
+        self, path: str, sha256: str = None, source: str = "api", delay: float = 0.0, job_id: str = None
+    ) -> Job:
+        job = Job(
+            id=job_id or uuid.uuid4().hex,
+            file_name=os.path.basename(path),
+            path=path,
+            source=source,
+            sha256=sha256,
+        )
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        coordinator.spool_ingest(job.to_dict(), delay=delay)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        state = coordinator.read_job(job_id)
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if state is None:
+            return job
+        state["id"] = job_id
+        return Job(**state)
+
+    def jobs(self, limit: int = 100) -> List[Job]:
+        return [Job(**state) for state in coordinator.list_jobs(limit)]
+
+    def wait(self, job: Job) -> Job:
+        """Block until the writer reports ``job`` as no longer queued/running."""
+        while job.status in ACTIVE_STATES:
+            time.sleep(0.2)
+            job = self.get(job.id) or job
+        return job
+
+    def active_files(self) -> set:
+        return set()
+
+    def shutdown(self, wait: bool = True) -> None:
+        pass
+
+    def drain(self, timeout: float) -> Dict[str, int]:
+        return {}
+
+    def resume_interrupted(self, entries: Optional[Dict[str, dict]] = None) -> int:
+        return 0
+
+
+_queue: Optional[IngestQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_queue() -> IngestQueue:
+    """The ingestion queue for this process's role (rebuilt after a promotion)."""
+    global _queue
+    writer = coordinator.is_writer()
+    if _queue is None or isinstance(_queue, SpooledQueue) == writer:
+        with _queue_lock:
+            if _queue is None or isinstance(_queue, SpooledQueue) == writer:
+                if writer:
+                    workers = env_int("INGEST_WORKERS", 2)
+                    _queue = IngestQueue(workers)
+                else:
+                    _queue = SpooledQueue()
+                metrics.INGEST_QUEUE_DEPTH.set_function(_queue.depth)
+    return _queue
+
+
+def submit(path: str, sha256: str = None, source: str = "api", delay: float = 0.0) -> Job:
+    return get_queue().submit(path, sha256=sha256, source=source, delay=delay)
+
+
+def drain(timeout: Optional[float] = None) -> Dict[str, int]:
+    """Drain this process's queue for shutdown (no-op if it was never used)."""
+    if timeout is None:
+        timeout = env_float("INGEST_DRAIN_SECONDS", 30)
+    return _queue.drain(timeout) if _queue is not None else {}
@@ -0,0 +1,236 @@
+"""Document loaders keyed by file extension.
+
+Each loader returns one text entry per page. Extracted page text is cached on
+disk by (file hash, page) so re-ingesting an unchanged file (for example after
+a chunking change) skips parsing entirely. Large PDFs are split into page
+ranges and extracted in parallel across a process pool.
+"""
+
+import html
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from typing import Callable, Dict, List
+
+from utils import env_int, file_sha256
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_DIR = "page_cache"
+
+# extension -> (page_count(path), extract_pages(path, start, end) -> list[str])
+LOADERS: Dict[str, tuple] = {}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def register_loader(*extensions: str, page_count: Callable[[str], int] = None):
+    """Register ``extract(path, start, end)`` for the given extensions.
+
+    ``page_count`` defaults to treating the whole file as a single page.
+    """
+    def decorator(extract):
+        for ext in extensions:
+            LOADERS[ext.lower()] = (page_count or (lambda path: 1), extract)
+        return extract
+    return decorator
+
+
+def supported_extensions() -> tuple:
+    return tuple(LOADERS)
+
+
+def is_supported(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in LOADERS
+
+
+def _pdf_page_count(path: str) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+@register_loader(".pdf", page_count=_pdf_page_count)
+def _extract_pdf(path: str, start: int, end: int) -> List[str]:
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+@register_loader(".docx")
+def _extract_docx(path: str, start: int, end: int) -> List[str]:
+    import docx2txt
+
+    return [docx2txt.process(path) or ""]
+
+
+@register_loader(".txt", ".md")
+def _extract_text(path: str, start: int, end: int) -> List[str]:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return [f.read()]
+
+
+class _HTMLTextExtractor(HTMLParser):
+    SKIP_TAGS = {"script", "style", "head"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6"}:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+@register_loader(".html", ".htm")
+def _extract_html(path: str, start: int, end: int) -> List[str]:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        parser = _HTMLTextExtractor()
+        parser.feed(f.read())
+    text = html.unescape("".join(parser.parts))
+    return [re.sub(r"\n\s*\n+", "\n\n", text).strip()]
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked: workers start lazily, possibly after torch,
+            # watchdog and the ingest threads hold locks a fork would copy.
+            _pool = ProcessPoolExecutor(
+                max_workers=env_int("PARSE_WORKERS", os.cpu_count() or 2),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _extract_ranges(ext: str, path: str, pages: List[int]) -> Dict[int, str]:
+    """Extract the given pages, splitting contiguous ranges across the pool."""
+    _, extract = LOADERS[ext]
+    per_task = max(1, env_int("PARSE_PAGES_PER_TASK", 16))
+
+    ranges = []
+    for page in pages:
+        if ranges and ranges[-1][1] == page and ranges[-1][1] - ranges[-1][0] < per_task:
+            ranges[-1][1] = page + 1
+        else:
+            ranges.append([page, page + 1])
+
+    if len(ranges) <= 1 or env_int("PARSE_WORKERS", os.cpu_count() or 2) <= 1:
+        results = [extract(path, start, end) for start, end in ranges]
+    else:
+        pool = _get_pool()
+        futures = [pool.submit(extract, path, start, end) for start, end in ranges]
+        results = [f.result() for f in futures]
+
+    extracted = {}
+    for (start, _), texts in zip(ranges, results):
+        for offset, text in enumerate(texts):
+            extracted[start + offset] = text
+    return extracted
+
+
+def _cache_dir(file_hash: str) -> str:
+    return os.path.join(PAGE_CACHE_DIR, file_hash)
+
+
+def _read_cached(file_hash: str):
+    cache_dir = _cache_dir(file_hash)
+    manifest = os.path.join(cache_dir, "meta.json")
+    if not os.path.exists(manifest):
+        return None, {}
+    try:
+        with open(manifest, "r", encoding="utf-8") as f:
+            page_count = json.load(f)["pages"]
+    except Exception:
+        return None, {}
+
+    cached = {}
+    for page in range(page_count):
+        page_path = os.path.join(cache_dir, f"{page}.txt")
+        if os.path.exists(page_path):
+            with open(page_path, "r", encoding="utf-8") as f:
+                cached[page] = f.read()
+    return page_count, cached
+
+
+def _write_cached(file_hash: str, page_count: int, pages: Dict[int, str]) -> None:
+    cache_dir = _cache_dir(file_hash)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for page, text in pages.items():
+            page_path = os.path.join(cache_dir, f"{page}.txt")
+            with open(f"{page_path}.tmp", "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(f"{page_path}.tmp", page_path)
+        with open(os.path.join(cache_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"pages": page_count}, f)
+    except Exception as exc:
+        logger.warning(f"Could not write page cache for {file_hash}: {exc}")
+
+
+def load_pages(path: str, file_hash: str = None) -> List[str]:
+    """Return the text of each page of ``path``, using the page cache."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in LOADERS:
+        raise ValueError(f"Unsupported file type: {path}")
+
+    file_hash = file_hash or file_sha256(path)
+    page_count, pages = _read_cached(file_hash)
+    if page_count is None:
+        page_count = LOADERS[ext][0](path)
+
+    missing = [page for page in range(page_count) if page not in pages]
+    if missing:
+        extracted = _extract_ranges(ext, path, missing)
+        _write_cached(file_hash, page_count, extracted)
+        pages.update(extracted)
+    else:
+        logger.info(f"Page cache hit for {os.path.basename(path)} ({page_count} pages)")
+
+    return [pages.get(page, "") for page in range(page_count)]
+
+
+def load_documents(path: str, file_hash: str = None) -> list:
+    """Load ``path`` as one LangChain document per page."""
+    return documents_from_pages(path, load_pages(path, file_hash))
+
+
+def documents_from_pages(path: str, pages: List[str]) -> list:
+    """Wrap already extracted page texts of ``path`` as LangChain documents."""
+    from langchain_core.documents import Document
+
+    ext = os.path.splitext(path)[1].lower()
+    documents = []
+    for page, text in enumerate(pages):
+        metadata = {"source": path}
+        if ext == ".pdf":
+            metadata["page"] = page
+        documents.append(Document(page_content=text, metadata=metadata))
+    return documents
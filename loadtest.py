@@ -0,0 +1,248 @@
+"""
+HTTP load generator for a running server.
+
+Replays a question set against the query endpoints (and ``GET /api/files``)
+at stepped concurrency levels and reports throughput, latency percentiles
+and error rates per step, plus the knee point: the highest concurrency that
+still adds throughput without latency or errors blowing up. Uploads can be
+kept in flight during every step to measure query latency under ingestion.
+
+    python loadtest.py --base-url http://localhost:8000 --levels 1,2,4,8,16 --duration 30
+    python loadtest.py --questions questions.json --upload sample.pdf --output load.json
+
+Pair with ``ollama_stub.py`` to load-test without a GPU.
+"""
+
+import argparse
+import itertools
+import json
+import mimetypes
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+
+from benchmark import percentiles
+
+ENDPOINTS = {
+    "query": ("POST", "/api/query", lambda q: {"question": q}),
+    "clara-query": ("POST", "/api/clara-query", lambda q: {"question": q, "detailed": False}),
+    "debug-query": ("POST", "/api/debug-query", lambda q: {"question": q}),
+    "files": ("GET", "/api/files", None),
+}
+
+DEFAULT_QUESTIONS = [
+    "What is this document about?",
+    "Summarize the main points.",
+    "What are the key dates mentioned?",
+    "Who is responsible for approvals?",
+    "Compare the budget and the revenue figures.",
+    "What does the policy say about refunds?",
+]
+
+
+def load_questions(path: str | None):
+    """Read questions from a JSON list (strings or {"question": ...}) or a text file."""
+    if not path:
+        return list(DEFAULT_QUESTIONS)
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            data = json.load(f)
+            return [item["question"] if isinstance(item, dict) else str(item) for item in data]
+        return [line.strip() for line in f if line.strip()]
+
+
+def _request(method: str, url: str, body: bytes | None, headers: dict, timeout: float):
+    req = urllib.request.Request(url, data=body, method=method, headers=headers)
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as exc:
+        status = exc.code
+    except Exception as exc:
+        return time.perf_counter() - start, None, type(exc).__name__
+    return time.perf_counter() - start, status, None
+
+
+def _multipart(path: str):
+    boundary = uuid.uuid4().hex
+    name = os.path.basename(path)
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    with open(path, "rb") as f:
+        payload = f.read()
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{name}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + payload + f"\r\n--{boundary}--\r\n".encode()
+    return body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+class StepRecorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}  # endpoint -> list of (latency, status, error)
+
+    def add(self, endpoint: str, latency: float, status, error) -> None:
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((latency, status, error))
+
+    def summary(self, elapsed: float) -> dict:
+        per_endpoint = {}
+        all_latencies, total, failures = [], 0, 0
+        for endpoint, samples in sorted(self.samples.items()):
+            ok = [lat for lat, status, error in samples if error is None and status and status < 400]
+            errors = {}
+            for _, status, error in samples:
+                if error is not None or not status or status >= 400:
+                    key = error or str(status)
+                    errors[key] = errors.get(key, 0) + 1
+            per_endpoint[endpoint] = {
+                "requests": len(samples),
+                "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else None,
+                "latency": percentiles(ok),
+                "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+                "errors": errors,
+            }
+            if endpoint == "upload":
+                continue  # background traffic, reported separately
+            all_latencies += ok
+            total += len(samples)
+            failures += len(samples) - len(ok)
+        return {
+            "requests": total,
+            "throughput_rps": round(len(all_latencies) / elapsed, 3) if elapsed else None,
+            "latency": percentiles(all_latencies),
+            "error_rate": round(failures / total, 4) if total else 0.0,
+            "endpoints": per_endpoint,
+        }
+
+
+def run_step(base_url, endpoints, questions, concurrency, duration, timeout, uploads, upload_interval):
+    recorder = StepRecorder()
+    stop = threading.Event()
+    work = itertools.cycle([(e, q) for q in questions for e in endpoints])
+    work_lock = threading.Lock()
+
+    def worker():
+        while not stop.is_set():
+            with work_lock:
+                endpoint, question = next(work)
+            method, path, make_body = ENDPOINTS[endpoint]
+            body, headers = None, {}
+            if make_body is not None:
+                body = json.dumps(make_body(question)).encode("utf-8")
+                headers = {"Content-Type": "application/json"}
+            latency, status, error = _request(method, base_url + path, body, headers, timeout)
+            recorder.add(endpoint, latency, status, error)
+
+    def uploader():
+        for path in itertools.cycle(uploads):
+            if stop.is_set():
+                return
+            body, headers = _multipart(path)
+            latency, status, error = _request("POST", base_url + "/api/upload", body, headers, timeout)
+            recorder.add("upload", latency, status, error)
+            stop.wait(upload_interval)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    if uploads:
+        threads.append(threading.Thread(target=uploader, daemon=True))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    stop.wait(duration)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=timeout)
+    elapsed = time.perf_counter() - start
+
+    summary = recorder.summary(elapsed)
+    summary["concurrency"] = concurrency
+    summary["seconds"] = round(elapsed, 3)
+    return summary
+
+
+def find_knee(steps, min_gain: float, max_latency_growth: float, max_error_rate: float):
+    """Return (concurrency, reason): the last level before scaling stops paying off."""
+    if not steps:
+        return None, "no steps"
+    knee = steps[0]
+    for previous, step in zip(steps, steps[1:]):
+        if step["error_rate"] > max_error_rate:
+            return knee["concurrency"], f"error rate {step['error_rate']:.1%} at {step['concurrency']}"
+        prev_rps, rps = previous["throughput_rps"] or 0, step["throughput_rps"] or 0
+        if prev_rps and (rps - prev_rps) / prev_rps < min_gain:
+            return knee["concurrency"], f"throughput gain below {min_gain:.0%} at {step['concurrency']}"
+        prev_p95, p95 = previous["latency"].get("p95"), step["latency"].get("p95")
+        if prev_p95 and p95 and p95 / prev_p95 > max_latency_growth:
+            return knee["concurrency"], f"p95 latency grew {p95 / prev_p95:.1f}x at {step['concurrency']}"
+        knee = step
+    return knee["concurrency"], "no knee within tested levels"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stepped-concurrency load test for the HTTP API.")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--endpoints", default="query,clara-query,debug-query,files",
+                        help=f"Comma-separated subset of: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--questions", help="JSON list or text file with one question per line")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per concurrency level")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout (s)")
+    parser.add_argument("--upload", nargs="*", default=[], help="Files to keep uploading during each step")
+    parser.add_argument("--upload-interval", type=float, default=5.0, help="Seconds between uploads")
+    parser.add_argument("--min-gain", type=float, default=0.1,
+                        help="Throughput gain per step below which the knee is reached")
+    parser.add_argument("--max-latency-growth", type=float, default=2.0,
+                        help="p95 growth factor per step beyond which the knee is reached")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--output", default="loadtest_results.json")
+    args = parser.parse_args()
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = [e for e in endpoints if e not in ENDPOINTS]
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(unknown)}")
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+    questions = load_questions(args.questions)
+    base_url = args.base_url.rstrip("/")
+
+    steps = []
+    for level in levels:
+        print(f"Concurrency {level}: running for {args.duration:.0f}s...", flush=True)
+        step = run_step(
+            base_url, endpoints, questions, level, args.duration,
+            args.timeout, args.upload, args.upload_interval,
+        )
+        steps.append(step)
+        latency = step["latency"]
+        print(
+            f"  {step['throughput_rps']} req/s, p50={latency.get('p50')}s "
+            f"p95={latency.get('p95')}s p99={latency.get('p99')}s, errors={step['error_rate']:.1%}",
+            flush=True,
+        )
+
+    knee, reason = find_knee(steps, args.min_gain, args.max_latency_growth, args.max_error_rate)
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "base_url": base_url,
+            "params": vars(args),
+        },
+        "steps": steps,
+        "knee": {"concurrency": knee, "reason": reason},
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nKnee: concurrency {knee} ({reason})")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Index maintenance: orphan cleanup, compaction and backup pruning.
+
+Reconciles the uploads folder, ``file_index.json`` and the vector store:
+
+- vectors whose file is missing from the index or from uploads/ (for example
+  after a missed delete event or a crash mid-``process_file``) are removed in
+  bulk, together with their stored text, routing and dedup entries;
+- index entries whose file is gone from uploads/ are dropped;
+- indexed files without any vectors are dropped from the index so
+  ``/api/process-uploads`` picks them up again.
+
+Afterwards the SQLite files are vacuumed, old ``chroma_store_backup_*`` /
+``chroma_store_fresh_*`` directories left by ``_rotate_vector_store`` are
+pruned, and so are ``page_cache/<sha256>`` directories whose content hash no
+indexed file has any more.
+
+Usage: python maintenance.py [--dry-run] [--keep-backups N]
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from typing import Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+BACKUP_BASE_DIR = "chroma_store"
+_PAGE_SIZE = 5000
+# Page cache entries are written before the file is indexed; younger ones
+# may belong to an ingestion in progress.
+STALE_PAGE_CACHE_SECONDS = 3600
+
+
+def _dir_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _vector_sources(collection) -> Dict[str, int]:
+    """Count vectors per source_file, paging through the collection."""
+    counts: Dict[str, int] = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=_PAGE_SIZE, offset=offset)
+        metadatas = page.get("metadatas") or []
+        for meta in metadatas:
+            name = (meta or {}).get("source_file")
+            if name:
+                counts[name] = counts.get(name, 0) + 1
+        if len(metadatas) < _PAGE_SIZE:
+            return counts
+        offset += _PAGE_SIZE
+
+
+def remove_files(vectordb, doc_index, deduplicator, files: List[str]) -> None:
+    """Remove many files from the vector store, routing index, dedup registry,
+    text store and index files, deleting vectors in bulk."""
+    import doc_router
+    import text_store
+    from delete_file import _promote_heirs
+    from utils import remove_from_index
+
+    orphaned = set(files)
+    for name in files:
+        if deduplicator is not None:
+            heirs = {
+                old_id: heir
+                for old_id, heir in deduplicator.heirs_for(name).items()
+                if heir["source_file"] not in orphaned
+            }
+            deduplicator.remove_file(name, _promote_heirs(vectordb, heirs))
+        text_store.remove_document(text_store.doc_id_for(name))
+        remove_from_index(name)
+
+    for start in range(0, len(files), 500):
+        batch = files[start:start + 500]
+        vectordb._collection.delete(where={"source_file": {"$in": batch}})
+        doc_index._collection.delete(where={"source_file": {"$in": batch}})
+
+
+def _orphan_text_files(keep_files: Iterable[str]) -> List[str]:
+    """Stored texts of files not in ``keep_files`` (indexed or being ingested).
+
+    Only finished ``{doc_id}.txt`` files are candidates: the ``.tmp`` file an
+    ingestion is writing must survive until it renames it.
+    """
+    import text_store
+
+    keep = {f"{text_store.doc_id_for(name)}.txt" for name in keep_files}
+    return [
+        path
+        for path in glob.glob(os.path.join(text_store.TEXT_STORE_DIR, "*.txt"))
+        if os.path.basename(path) not in keep
+    ]
+
+
+def _indexed_hashes(file_meta: Dict[str, dict]) -> List[str]:
+    return [meta["sha256"] for meta in file_meta.values() if meta.get("sha256")]
+
+
+def _stale_page_cache(keep_hashes: Iterable[str]) -> List[str]:
+    """Page cache directories for content no indexed file has."""
+    from loaders import PAGE_CACHE_DIR
+
+    keep = set(keep_hashes)
+    cutoff = time.time() - STALE_PAGE_CACHE_SECONDS
+    stale = []
+    for path in glob.glob(os.path.join(PAGE_CACHE_DIR, "*")):
+        try:
+            if (
+                os.path.isdir(path)
+                and os.path.basename(path) not in keep
+                and os.path.getmtime(path) < cutoff
+            ):
+                stale.append(path)
+        except FileNotFoundError:
+            pass
+    return stale
+
+
+def _vacuum(db_path: str) -> None:
+    if not os.path.exists(db_path):
+        return
+    try:
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+    except sqlite3.Error as exc:
+        logger.warning(f"Could not vacuum {db_path}: {exc}")
+
+
+def _stale_backups(active_dir: str, keep: int) -> List[str]:
+    candidates = [
+        path
+        for pattern in (f"{BACKUP_BASE_DIR}_backup_*", f"{BACKUP_BASE_DIR}_fresh_*")
+        for path in glob.glob(pattern)
+        if os.path.isdir(path) and os.path.abspath(path) != os.path.abspath(active_dir)
+    ]
+    candidates.sort(key=os.path.getmtime, reverse=True)
+    return candidates[max(0, keep):]
+
+
+def run_maintenance(dry_run: bool = False, keep_backups: int = 1, busy: Iterable[str] = ()) -> dict:
+    """Reconcile uploads, index and vector store, then compact and prune.
+
+    ``busy`` names files currently being ingested; they are left alone.
+    Returns a report including reclaimed bytes and run time.
+    """
+    import processor
+    import text_store
+    from loaders import PAGE_CACHE_DIR
+    from reconcile import list_uploads
+    from utils import load_file_index, load_file_meta, remove_from_index
+
+    started = time.perf_counter()
+    busy = set(busy)
+    vectordb = processor.get_vector_store()
+    doc_index = processor.get_document_index()
+    deduplicator = processor.get_deduplicator()
+    active_dir = processor.VECTOR_DB_DIR
+
+    tracked_paths = [active_dir, text_store.TEXT_STORE_DIR, PAGE_CACHE_DIR]
+    tracked_paths += glob.glob(f"{BACKUP_BASE_DIR}_*")
+    size_before = sum(_dir_size(path) for path in tracked_paths if os.path.exists(path))
+
+    uploads = set(list_uploads(processor.UPLOAD_FOLDER))
+    index = load_file_index()
+    vector_counts = _vector_sources(vectordb._collection)
+    linked_files = set(deduplicator.linked_files()) if deduplicator is not None else set()
+
+    orphans = sorted(
+        ((set(vector_counts) - set(index)) | (set(index) - uploads) | (set(vector_counts) - uploads))
+        - busy
+    )
+    missing_vectors = sorted(
+        name
+        for name, chunks in index.items()
+        if name in uploads and name not in busy and chunks
+        and name not in vector_counts and name not in linked_files
+    )
+    unindexed = sorted(uploads - set(index) - set(orphans) - busy)
+    backups = _stale_backups(active_dir, keep_backups)
+
+    if not dry_run:
+        remove_files(vectordb, doc_index, deduplicator, orphans)
+        for name in missing_vectors:
+            remove_from_index(name)
+        stale_text = _orphan_text_files(load_file_index().keys() | busy)
+        for path in stale_text:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # removed meanwhile (re-ingested or deleted)
+        _vacuum(os.path.join(active_dir, "chroma.sqlite3"))
+        _vacuum(os.path.join(active_dir, "dedup.sqlite3"))
+        for path in backups:
+            shutil.rmtree(path, ignore_errors=True)
+        stale_pages = _stale_page_cache(_indexed_hashes(load_file_meta()))
+        for path in stale_pages:
+            shutil.rmtree(path, ignore_errors=True)
+    else:
+        stale_text = _orphan_text_files(set(index) | busy)
+        stale_pages = _stale_page_cache(_indexed_hashes(load_file_meta()))
+
+    size_after = sum(_dir_size(path) for path in tracked_paths if os.path.exists(path))
+    report = {
+        "dry_run": dry_run,
+        "orphaned_files": orphans,
+        "orphaned_vectors": sum(vector_counts.get(name, 0) for name in orphans),
+        "reindex_needed": missing_vectors,
+        "unindexed_uploads": unindexed,
+        "stale_text_files": len(stale_text),
+        "pruned_backups": backups,
+        "pruned_page_cache": len(stale_pages),
+        "bytes_before": size_before,
+        "bytes_after": size_after,
+        "reclaimed_bytes": max(0, size_before - size_after),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info(
+        f"Maintenance {'dry run ' if dry_run else ''}finished in {report['seconds']}s: "
+        f"{len(orphans)} orphaned files, {len(backups)} backups pruned, "
+        f"{report['reclaimed_bytes']} bytes reclaimed"
+    )
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Clean up and compact the document index.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    parser.add_argument(
+        "--keep-backups", type=int, default=1, help="Number of vector store backups to keep"
+    )
+    args = parser.parse_args()
+    print(json.dumps(run_maintenance(args.dry_run, args.keep_backups), indent=2))
@@ -0,0 +1,261 @@
+"""Lightweight in-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms are kept in memory and rendered by
+``render()`` for the ``/api/metrics`` endpoint. Set ``METRICS_ENABLED=false``
+to turn every observation into a no-op.
+
+``stage(name)`` times a pipeline stage and also makes the stage name
+available to nested code (for example LLM calls) via ``current_stage()``.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+from utils import env_flag
+
+ENABLED = env_flag("METRICS_ENABLED", True)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 15, 20, 30, 50, 100)
+
+_registry: List["_Metric"] = []
+_current_stage = contextvars.ContextVar("metrics_stage", default="other")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Callable[[], float] | None = None
+
+    def set(self, value: float, **labels) -> None:
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Compute the (unlabelled) value at scrape time."""
+        self._function = function
+
+    def value(self, **labels) -> float:
+        if self._function is not None:
+            return self._function()
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        if self._function is not None:
+            try:
+                lines.append(f"{self.name} {self._function()}")
+            except Exception:
+                pass
+            return lines
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., count, sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0, 0.0]
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[idx] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, state in self._values.items():
+                for idx, bound in enumerate(self.buckets):
+                    labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {state[idx]}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {state[-2]}")
+                plain = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_count{plain} {state[-2]}")
+                lines.append(f"{self.name}_sum{plain} {state[-1]}")
+        return lines
+
+
+def render() -> str:
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+def current_stage() -> str:
+    return _current_stage.get()
+
+
+STAGE_SECONDS = Histogram(
+    "clara_stage_seconds", "Duration of CLaRa pipeline stages", ("stage",)
+)
+LLM_CALL_SECONDS = Histogram(
+    "clara_llm_call_seconds", "Duration of individual LLM calls", ("stage",)
+)
+LLM_CALLS = Counter("clara_llm_calls_total", "Number of LLM calls", ("stage",))
+LLM_PROMPT_TOKENS = Counter(
+    "clara_llm_prompt_tokens_total", "Prompt tokens sent to the LLM", ("stage",)
+)
+LLM_COMPLETION_TOKENS = Counter(
+    "clara_llm_completion_tokens_total", "Completion tokens returned by the LLM", ("stage",)
+)
+LLM_CALLS_PER_QUERY = Histogram(
+    "clara_llm_calls_per_query", "LLM calls made while answering one question",
+    buckets=COUNT_BUCKETS,
+)
+RETRIEVAL_SECONDS = Histogram(
+    "retrieval_seconds", "Vector retrieval latency", ("search_type",)
+)
+RETRIEVAL_HITS = Histogram(
+    "retrieval_hits", "Chunks returned per retrieval", ("search_type",), buckets=COUNT_BUCKETS
+)
+INGEST_SECONDS = Histogram(
+    "ingest_file_seconds", "Time to ingest one file", buckets=DEFAULT_BUCKETS + (300, 600)
+)
+INGEST_CHUNKS = Counter("ingest_chunks_total", "Chunks produced by ingestion")
+INGEST_FILES = Counter("ingest_files_total", "Files ingested", ("status",))
+INGEST_THROUGHPUT = Gauge(
+    "ingest_chunks_per_second", "Chunk throughput of the most recent ingestion"
+)
+INGEST_QUEUE_DEPTH = Gauge("ingest_queue_depth", "Files waiting for or undergoing ingestion")
+ANSWER_CACHE_LOOKUPS = Counter(
+    "clara_answer_cache_lookups_total", "Answer cache lookups", ("result",)
+)
+ANSWER_CACHE_SAVED_LLM_SECONDS = Counter(
+    "clara_answer_cache_saved_llm_seconds_total", "LLM time the cached answers originally took"
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "HTTP request latency", ("method", "path", "status")
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+PROCESS_RSS = Gauge("process_resident_memory_bytes", "Resident memory of the server process")
+
+
+@contextmanager
+def stage(name: str):
+    """Time a CLaRa stage and expose it to nested LLM calls."""
+    token = _current_stage.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+        _current_stage.reset(token)
+
+
+_query_llm_calls = contextvars.ContextVar("metrics_query_llm_calls", default=None)
+
+
+@contextmanager
+def query_scope():
+    """Count the LLM calls (and their seconds) made while answering one question."""
+    counter = [0, 0.0]
+    token = _query_llm_calls.set(counter)
+    try:
+        yield counter
+    finally:
+        LLM_CALLS_PER_QUERY.observe(counter[0])
+        _query_llm_calls.reset(token)
+
+
+def record_llm_call(seconds: float, prompt_tokens: int, completion_tokens: int) -> None:
+    stage_name = current_stage()
+    LLM_CALL_SECONDS.observe(seconds, stage=stage_name)
+    LLM_CALLS.inc(stage=stage_name)
+    LLM_PROMPT_TOKENS.inc(prompt_tokens, stage=stage_name)
+    LLM_COMPLETION_TOKENS.inc(completion_tokens, stage=stage_name)
+    counter = _query_llm_calls.get()
+    if counter is not None:
+        counter[0] += 1
+        counter[1] += seconds
@@ -0,0 +1,66 @@
+"""Chunk retriever over the offset-based text store.
+
+Lives outside ``processor`` so that importing the ingestion code does not
+load LangChain's retriever machinery; ``processor.get_retriever`` imports
+it on first use.
+"""
+
+import time
+from typing import Any, Dict
+
+from langchain_core.retrievers import BaseRetriever
+
+import doc_router
+import metrics
+import tracing
+from processor import (
+    _attach_linked_sources,
+    embed_query,
+    get_deduplicator,
+    get_document_index,
+    hydrate_document,
+)
+
+
+class OffsetRetriever(BaseRetriever):
+    """Searches the chunk store and resolves chunk offsets to text.
+
+    When ``route_top_m`` is set, the query is first routed through the
+    document-level index and the chunk search is restricted to those files.
+    """
+
+    vectordb: Any
+    search_type: str = "similarity"
+    search_kwargs: Dict[str, Any] = {}
+    context_window: int = 0
+    route_top_m: int = 0
+
+    def _route(self, query: str) -> list:
+        doc_index = get_document_index()
+        if doc_index is None or doc_router.file_count(doc_index) <= self.route_top_m:
+            # No more files than we keep: nothing to prune.
+            return []
+        return doc_router.route(doc_index, embed_query(query), self.route_top_m)
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        search_kwargs = dict(self.search_kwargs)
+        if self.route_top_m > 0:
+            files = self._route(query)
+            deduplicator = get_deduplicator()
+            if files and deduplicator is not None:
+                # Content shared with other files is stored under its canonical owner.
+                files += [f for f in deduplicator.canonical_owners(files) if f not in files]
+            if files:
+                search_kwargs["filter"] = {"source_file": {"$in": files}}
+            tracing.annotate(routed_files=len(files))
+
+        start = time.perf_counter()
+        docs = self.vectordb.as_retriever(
+            search_type=self.search_type,
+            search_kwargs=search_kwargs,
+        ).invoke(query)
+        metrics.RETRIEVAL_SECONDS.observe(time.perf_counter() - start, search_type=self.search_type)
+        metrics.RETRIEVAL_HITS.observe(len(docs), search_type=self.search_type)
+        tracing.annotate(search_type=self.search_type, hits=len(docs))
+        _attach_linked_sources(docs)
+        return [hydrate_document(doc, self.context_window) for doc in docs]
@@ -0,0 +1,187 @@
+"""
+Ollama-compatible stand-in server for GPU-free load testing.
+
+Implements the parts of the Ollama HTTP API used by ``OllamaLLM``/``ChatOllama``
+(``/api/generate``, ``/api/chat``, streaming and non-streaming, plus
+``/api/tags``, ``/api/show`` and ``/api/version``). Responses come from
+``fake_llm.canned_response`` so they follow the AMBIGUOUS:/ANSWER:/CONFIDENCE:
+formats ``clara_engine`` parses.
+
+Usage:
+    python ollama_stub.py --port 11435 --ttft 0.3 --tps 40 --concurrency 2
+    OLLAMA_BASE_URL=http://localhost:11435 python server.py
+"""
+
+import argparse
+import json
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fake_llm import canned_response
+
+logger = logging.getLogger(__name__)
+
+
+class StubConfig:
+    def __init__(self, ttft: float, tokens_per_second: float, concurrency: int, model: str):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.model = model
+        # Like OLLAMA_NUM_PARALLEL: extra requests queue until a slot frees up.
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.active = 0
+        self.lock = threading.Lock()
+
+
+def _tokens(text: str):
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: StubConfig = None
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt % args)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            return {}
+
+    def _send_json(self, payload: dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, payload: dict) -> None:
+        data = json.dumps(payload).encode("utf-8") + b"\n"
+        self.wfile.write(b"%x\r\n" % len(data) + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": self.config.model, "model": self.config.model}]})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-stub"})
+        elif self.path in ("/", "/api/ps"):
+            self._send_json({"status": "ok", "active": self.config.active})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        payload = self._read_json()
+        if self.path == "/api/show":
+            self._send_json({"modelfile": "", "parameters": "", "details": {"family": "stub"}})
+        elif self.path == "/api/generate":
+            self._respond(payload, prompt=payload.get("prompt", ""), chat=False)
+        elif self.path == "/api/chat":
+            messages = payload.get("messages") or []
+            prompt = "\n".join(str(m.get("content", "")) for m in messages)
+            self._respond(payload, prompt=prompt, chat=True)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _frame(self, model: str, text: str, chat: bool, done: bool) -> dict:
+        frame = {"model": model, "created_at": _now(), "done": done}
+        if chat:
+            frame["message"] = {"role": "assistant", "content": text}
+        else:
+            frame["response"] = text
+        return frame
+
+    def _respond(self, payload: dict, prompt: str, chat: bool) -> None:
+        config = self.config
+        model = payload.get("model") or config.model
+        stream = payload.get("stream", True)
+        started = time.perf_counter_ns()
+        text = canned_response(prompt)
+        tokens = _tokens(text)
+        per_token = 1 / config.tokens_per_second if config.tokens_per_second > 0 else 0
+
+        with config.slots:
+            with config.lock:
+                config.active += 1
+            try:
+                time.sleep(config.ttft)
+                final_stats = {
+                    "done_reason": "stop",
+                    "prompt_eval_count": max(1, len(prompt) // 4),
+                    "eval_count": len(tokens),
+                }
+                if not stream:
+                    time.sleep(per_token * len(tokens))
+                    result = self._frame(model, text, chat, done=True)
+                    result.update(final_stats, total_duration=time.perf_counter_ns() - started)
+                    self._send_json(result)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in tokens:
+                    self._write_chunk(self._frame(model, token, chat, done=False))
+                    if per_token:
+                        time.sleep(per_token)
+                final = self._frame(model, "", chat, done=True)
+                final.update(final_stats, total_duration=time.perf_counter_ns() - started)
+                self._write_chunk(final)
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                logger.debug("Client disconnected during response")
+            finally:
+                with config.lock:
+                    config.active -= 1
+
+
+def serve(host: str, port: int, config: StubConfig) -> ThreadingHTTPServer:
+    handler = type("ConfiguredOllamaStubHandler", (OllamaStubHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Ollama-compatible stand-in server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--ttft", type=float, default=0.2, help="Time to first token (s)")
+    parser.add_argument("--tps", type=float, default=50.0, help="Tokens per second (0 = instant)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests generated in parallel")
+    parser.add_argument("--model", default="llama3.1:8b")
+    args = parser.parse_args()
+
+    httpd = serve(args.host, args.port, StubConfig(args.ttft, args.tps, args.concurrency, args.model))
+    logger.info(
+        f"Ollama stub listening on http://{args.host}:{args.port} "
+        f"(ttft={args.ttft}s, tps={args.tps}, concurrency={args.concurrency})"
+    )
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
@@ -2,36 +2,90 @@ import logging
 import os
 import shutil
 import sys
+import time
+import uuid
+from dataclasses import dataclass
 from datetime import datetime
 
 from dotenv import load_dotenv
-from langchain_community.document_loaders import Docx2txtLoader, PyPDFLoader
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-try:
-    from langchain_chroma import Chroma
-except ImportError:
-    from langchain_community.vectorstores import Chroma
-
-from utils import update_file_index
-
-load_dotenv()
+import cache
+import coordinator
+import doc_router
+import events
+import loaders
+import metrics
+import text_store
+import tracing
+from dedup import DEFAULT_THRESHOLD, ChunkDeduplicator, DedupPlan
+from utils import env_flag, env_float, env_int, file_sha256, load_file_index, update_file_index, update_file_meta
 
 logger = logging.getLogger(__name__)
 
 UPLOAD_FOLDER = "uploads"
 VECTOR_DB_DIR = "chroma_store"
 EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(VECTOR_DB_DIR, exist_ok=True)
+# Chroma rejects larger single writes (its SQLite backend caps the batch size).
+WRITE_BATCH_SIZE = 4096
 
 _embedding_model = None
 _vectordb = None
+_document_index = None
+_deduplicator = None
 _init_error = None
 
 
+def _chroma_class():
+    # LangChain, Chroma and the embedding stack load on first use rather than
+    # at import time, so importing this module (and the server) stays fast.
+    try:
+        from langchain_chroma import Chroma
+    except ImportError:
+        from langchain_community.vectorstores import Chroma
+    return Chroma
+
+
+class QueryCachingEmbeddings:
+    """Embedding model wrapper (LangChain ``Embeddings`` interface) that
+    remembers query vectors.
+
+    Routing and the chunk search both embed the same query, and refinement
+    loops repeat queries, so query vectors are cached by text.
+    ``embed_queries`` fills the cache for many queries with one batched call.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._vectors = cache.ByteLRU("query_embeddings", 16, sizeof=lambda vector: len(vector) * 8)
+
+    def __getattr__(self, name):
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def embed_documents(self, texts):
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text):
+        vector = self._vectors.get(text)
+        if vector is None:
+            vector = self.model.embed_query(text)
+            self._vectors.put(text, vector)
+        return vector
+
+    def embed_queries(self, texts) -> list:
+        missing = [text for text in dict.fromkeys(texts) if text not in self._vectors]
+        if missing:
+            if getattr(self.model, "query_encode_kwargs", None):
+                # Queries are encoded differently from documents; no batch shortcut.
+                vectors = [self.model.embed_query(text) for text in missing]
+            else:
+                vectors = self.model.embed_documents(missing)
+            for text, vector in zip(missing, vectors):
+                self._vectors.put(text, list(vector))
+        return [self.embed_query(text) for text in texts]
+
+
 def _get_embedding_dimension() -> int:
     if _embedding_model is None:
         raise RuntimeError("Embedding model is not initialized")
@@ -84,7 +138,7 @@ def _ensure_compatible_dimensions() -> None:
             f"collection={actual_dim}, embedding={expected_dim}"
         )
         _rotate_vector_store()
-        _vectordb = Chroma(
+        _vectordb = _chroma_class()(
             persist_directory=VECTOR_DB_DIR,
             embedding_function=_embedding_model,
         )
@@ -97,7 +151,7 @@ def _ensure_compatible_dimensions() -> None:
         if _is_dimension_mismatch_error(exc):
             logger.warning(f"Vector store dimension mismatch detected: {exc}")
             _rotate_vector_store()
-            _vectordb = Chroma(
+            _vectordb = _chroma_class()(
                 persist_directory=VECTOR_DB_DIR,
                 embedding_function=_embedding_model,
             )
@@ -125,11 +179,18 @@ def _reset_index_file() -> None:
 
 
 def _rotate_vector_store() -> None:
-    global VECTOR_DB_DIR
+    global VECTOR_DB_DIR, _document_index, _deduplicator
 
     if not os.path.exists(VECTOR_DB_DIR):
         return
+    if not coordinator.is_writer():
+        raise RuntimeError(
+            "Vector store dimensions do not match the embedding model; "
+            "only the writer worker may rotate the store"
+        )
 
+    _document_index = None
+    _deduplicator = None
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     backup_dir = f"{VECTOR_DB_DIR}_backup_{timestamp}"
 
@@ -157,28 +218,6 @@ def _rotate_vector_store() -> None:
         )
 
 
-def _env_int(name: str, default: int) -> int:
-    raw = os.getenv(name)
-    if raw is None or raw == "":
-        return default
-    try:
-        return int(raw)
-    except ValueError:
-        logger.warning(f"Invalid {name}={raw!r}; using {default}")
-        return default
-
-
-def _env_float(name: str, default: float) -> float:
-    raw = os.getenv(name)
-    if raw is None or raw == "":
-        return default
-    try:
-        return float(raw)
-    except ValueError:
-        logger.warning(f"Invalid {name}={raw!r}; using {default}")
-        return default
-
-
 def _detect_device() -> str:
     device = os.getenv("EMBEDDING_DEVICE", "cuda").strip().lower()
     if device == "auto":
@@ -201,29 +240,36 @@ def _initialize_vector_store() -> None:
     if _init_error is not None:
         raise RuntimeError(_init_error)
 
-    device = _detect_device()
     try:
-        if device == "cuda":
-            try:
-                import torch
-
-                if not torch.cuda.is_available():
+        load_dotenv()
+        os.makedirs(VECTOR_DB_DIR, exist_ok=True)
+        Chroma = _chroma_class()
+        if _embedding_model is None:
+            from langchain_huggingface import HuggingFaceEmbeddings
+
+            device = _detect_device()
+            if device == "cuda":
+                try:
+                    import torch
+
+                    if not torch.cuda.is_available():
+                        logger.warning(
+                            "EMBEDDING_DEVICE is set to CUDA but CUDA is not available. "
+                            "Falling back to CPU embeddings."
+                        )
+                        device = "cpu"
+                except Exception:
                     logger.warning(
-                        "EMBEDDING_DEVICE is set to CUDA but CUDA is not available. "
-                        "Falling back to CPU embeddings."
+                        "Could not validate CUDA availability. Falling back to CPU embeddings."
                     )
                     device = "cpu"
-            except Exception:
-                logger.warning(
-                    "Could not validate CUDA availability. Falling back to CPU embeddings."
-                )
-                device = "cpu"
 
-        _embedding_model = HuggingFaceEmbeddings(
-            model_name=EMBEDDING_MODEL_NAME,
-            model_kwargs={"device": device},
-            encode_kwargs={"normalize_embeddings": True},
-        )
+            _embedding_model = QueryCachingEmbeddings(HuggingFaceEmbeddings(
+                model_name=EMBEDDING_MODEL_NAME,
+                model_kwargs={"device": device},
+                encode_kwargs={"normalize_embeddings": True},
+            ))
+            logger.info(f"Embedding model loaded on {device.upper()}")
         try:
             _vectordb = Chroma(
                 persist_directory=VECTOR_DB_DIR,
@@ -240,7 +286,6 @@ def _initialize_vector_store() -> None:
                 )
             else:
                 raise
-        logger.info(f"Embedding model loaded on {device.upper()}")
         logger.info(f"Vector database initialized at {VECTOR_DB_DIR}")
     except Exception as exc:
         if isinstance(exc, ImportError) or "sentence_transformers" in str(exc):
@@ -267,40 +312,332 @@ def get_vector_store():
     return _vectordb
 
 
-def process_file(file_path: str) -> None:
+def reset_vector_store() -> None:
+    """Reopen the vector store on next use, keeping the embedding model.
+
+    Chroma keeps collection segments in memory per process, so a reader
+    worker only sees another process's writes after reopening. Requests
+    still holding the old handles finish on them. The deduplicator is
+    reopened too, so a reader promoted to writer gets a writable one.
+    """
+    global _vectordb, _document_index, _deduplicator
+    from chromadb.api.client import SharedSystemClient
+
+    SharedSystemClient.clear_system_cache()
+    _vectordb = None
+    _document_index = None
+    _deduplicator = None
+
+
+def get_document_index():
+    """Return the document-level routing collection, building it on first use.
+
+    Reader workers never create or rebuild it; they get None until the
+    writer has created it, and route nothing while it is empty.
+    """
+    global _document_index
+
+    vectordb = get_vector_store()
+    if _document_index is None:
+        writer = coordinator.is_writer()
+        if not writer and not _collection_exists(vectordb, doc_router.DOCUMENT_INDEX_COLLECTION):
+            return None
+        _document_index = _chroma_class()(
+            collection_name=doc_router.DOCUMENT_INDEX_COLLECTION,
+            persist_directory=VECTOR_DB_DIR,
+            embedding_function=_embedding_model,
+        )
+        if writer and _document_index._collection.count() == 0 and vectordb._collection.count() > 0:
+            doc_router.rebuild(vectordb, _document_index)
+    return _document_index
+
+
+def _collection_exists(vectordb, name: str) -> bool:
+    try:
+        vectordb._client.get_collection(name)
+    except Exception:
+        return False
+    return True
+
+
+def get_deduplicator() -> ChunkDeduplicator | None:
+    """Return the chunk deduplicator, or None when DEDUP_ENABLED is off."""
+    global _deduplicator
+
+    if not env_flag("DEDUP_ENABLED", True):
+        return None
+    if _deduplicator is None:
+        db_path = os.path.join(VECTOR_DB_DIR, "dedup.sqlite3")
+        writer = coordinator.is_writer()
+        if not writer and not os.path.exists(db_path):
+            return None  # readers wait for the writer to create it
+        os.makedirs(VECTOR_DB_DIR, exist_ok=True)
+        _deduplicator = ChunkDeduplicator(
+            db_path,
+            threshold=env_float("DEDUP_THRESHOLD", DEFAULT_THRESHOLD),
+            read_only=not writer,
+        )
+    return _deduplicator
+
+
+def _get_embeddings(vectordb, ids) -> dict:
+    if not ids:
+        return {}
+    data = vectordb._collection.get(ids=list(ids), include=["embeddings"])
+    embeddings = data.get("embeddings")
+    if embeddings is None:
+        embeddings = []
+    return {doc_id: list(vec) for doc_id, vec in zip(data.get("ids", []), embeddings)}
+
+
+def embed_query(text: str) -> list:
+    _initialize_vector_store()
+    return _embedding_model.embed_query(text)
+
+
+def embed_queries(texts) -> list:
+    """Embed many queries at once, priming the query-vector cache."""
+    _initialize_vector_store()
+    if isinstance(_embedding_model, QueryCachingEmbeddings):
+        return _embedding_model.embed_queries(list(texts))
+    return [_embedding_model.embed_query(text) for text in texts]
+
+
+def _split_into_offset_chunks(file_name: str, docs) -> list:
+    """Split loaded pages into chunks that reference the text store by offset."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=500,
+        chunk_overlap=100,
+        add_start_index=True,
+    )
+    doc_id, page_offsets = text_store.write_document(
+        file_name, [doc.page_content for doc in docs]
+    )
+
+    chunks = []
+    for page_offset, doc in zip(page_offsets, docs):
+        for chunk in splitter.split_documents([doc]):
+            start_index = chunk.metadata.pop("start_index", -1)
+            chunk.metadata["source_file"] = file_name
+            if start_index is None or start_index < 0:
+                # Splitter could not locate the chunk; keep its text inline.
+                chunks.append(chunk)
+                continue
+            start = page_offset + text_store.byte_offset(doc.page_content, start_index)
+            chunk.metadata["doc_id"] = doc_id
+            chunk.metadata["start"] = start
+            chunk.metadata["end"] = start + len(chunk.page_content.encode("utf-8"))
+            chunks.append(chunk)
+    return chunks
+
+
+def embed_documents(texts) -> list:
+    _initialize_vector_store()
+    return _embedding_model.embed_documents(list(texts))
+
+
+def store_chunks(vectordb, chunks, embeddings) -> None:
+    """Write chunk vectors; the text lives in the text store unless the chunk has no offsets."""
+    for offset in range(0, len(chunks), WRITE_BATCH_SIZE):
+        batch = chunks[offset:offset + WRITE_BATCH_SIZE]
+        vectordb._collection.add(
+            ids=[c.metadata["chunk_id"] for c in batch],
+            embeddings=embeddings[offset:offset + WRITE_BATCH_SIZE],
+            metadatas=[c.metadata for c in batch],
+            documents=["" if "doc_id" in c.metadata else c.page_content for c in batch],
+        )
+
+
+def _add_offset_chunks(vectordb, chunks, progress=None) -> list:
+    """Embed chunk text but persist only offsets for chunks backed by the text store.
+
+    Embeds in batches of ``EMBED_BATCH_SIZE`` so ``progress`` can report
+    ``embedding`` events. Returns the chunk embeddings.
+    """
+    if not chunks:
+        return []
+    batch_size = max(1, env_int("EMBED_BATCH_SIZE", 64))
+    embeddings = []
+    for offset in range(0, len(chunks), batch_size):
+        batch = chunks[offset:offset + batch_size]
+        embeddings.extend(_embedding_model.embed_documents([c.page_content for c in batch]))
+        if progress:
+            progress("embedding", done=len(embeddings), total=len(chunks))
+    store_chunks(vectordb, chunks, embeddings)
+    return embeddings
+
+
+@dataclass
+class PreparedFile:
+    """A parsed, split and deduplicated file whose vectors are not stored yet."""
+
+    path: str
+    file_name: str
+    file_hash: str
+    pages: int
+    chunks: list
+    plan: DedupPlan
+
+    @property
+    def unique_chunks(self) -> list:
+        return [self.chunks[idx] for idx in self.plan.unique]
+
+
+def prepare_file(file_path: str, file_hash: str | None = None, pages=None) -> PreparedFile:
+    """Replace any indexed version of the file, store its text and split it.
+
+    ``pages`` is the already extracted page text, if the caller parsed the
+    file itself (``ingest_cli`` parses in a process pool).
+    """
     file_name = os.path.basename(file_path)
-    print(f"Processing: {file_path}")
+    if file_name in load_file_index():
+        # Re-ingesting a file rewrites its stored text, so stale offsets must go.
+        from delete_file import delete_file
+
+        delete_file(file_name)
 
-    if file_path.endswith(".pdf"):
-        loader = PyPDFLoader(file_path)
-    elif file_path.endswith(".docx"):
-        loader = Docx2txtLoader(file_path)
+    file_hash = file_hash or file_sha256(file_path)
+    if pages is None:
+        docs = loaders.load_documents(file_path, file_hash)
     else:
-        print(f"Unsupported file type: {file_path}")
-        return
+        docs = loaders.documents_from_pages(file_path, pages)
+    chunks = _split_into_offset_chunks(file_name, docs)
+    for chunk in chunks:
+        chunk.metadata["chunk_id"] = str(uuid.uuid4())
 
-    docs = loader.load()
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-    chunks = splitter.split_documents(docs)
+    deduplicator = get_deduplicator()
+    if deduplicator is not None:
+        plan = deduplicator.partition(chunks)
+    else:
+        plan = DedupPlan(unique=list(range(len(chunks))))
+    return PreparedFile(file_path, file_name, file_hash, len(docs), chunks, plan)
 
-    for chunk in chunks:
-        chunk.metadata["source_file"] = file_name
 
+def finish_file(prepared: PreparedFile, embeddings) -> dict:
+    """Record dedup links and routing centroids for a file whose unique chunks
+    are stored with ``embeddings``.
+
+    Returns the ``file_meta.json`` fields for the file; the caller updates
+    the index and meta files (one file at a time or in bulk).
+    """
     vectordb = get_vector_store()
-    vectordb.add_documents(chunks)
+    chunks, plan = prepared.chunks, prepared.plan
+    embeddings = list(embeddings)
+    deduplicator = get_deduplicator()
+    if deduplicator is not None:
+        missing = deduplicator.record(prepared.file_name, chunks, plan)
+        if missing:
+            # Their canonical chunks' file was deleted meanwhile: keep them here.
+            logger.info(f"{prepared.file_name}: storing {len(missing)} chunks whose canonical copy was deleted")
+            orphaned = [chunks[idx] for idx in missing]
+            orphaned_embeddings = embed_documents([c.page_content for c in orphaned])
+            store_chunks(vectordb, orphaned, orphaned_embeddings)
+            deduplicator.record(
+                prepared.file_name, chunks, DedupPlan(unique=missing, fingerprints=plan.fingerprints)
+            )
+            dropped = set(missing)
+            plan.duplicates = [(idx, cid) for idx, cid in plan.duplicates if idx not in dropped]
+            plan.unique.extend(missing)
+            embeddings.extend(orphaned_embeddings)
+
+    # Duplicates still count towards this file's routing centroid.
+    canonical_embeddings = _get_embeddings(vectordb, {cid for _, cid in plan.duplicates})
+    unique_chunks = prepared.unique_chunks
+    route_metadatas = [c.metadata for c in unique_chunks]
+    route_embeddings = embeddings
+    for idx, canonical_id in plan.duplicates:
+        if canonical_id in canonical_embeddings:
+            route_metadatas.append(chunks[idx].metadata)
+            route_embeddings.append(canonical_embeddings[canonical_id])
+    doc_router.index_document(
+        get_document_index(),
+        prepared.file_name,
+        text_store.doc_id_for(prepared.file_name),
+        route_metadatas,
+        route_embeddings,
+    )
+    stat = os.stat(prepared.path)
+    return {
+        "dedup_ratio": round(plan.ratio, 4),
+        "sha256": prepared.file_hash,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "indexed_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def process_file(file_path: str, file_hash: str | None = None, progress=None) -> None:
+    """Index one file. ``progress(stage, **data)`` is called after parsing and
+    for each embedding batch."""
+    file_name = os.path.basename(file_path)
+    print(f"Processing: {file_path}")
+
+    if not loaders.is_supported(file_path):
+        print(f"Unsupported file type: {file_path}")
+        return
+
+    started = time.perf_counter()
+    prepared = prepare_file(file_path, file_hash)
+    chunks, plan = prepared.chunks, prepared.plan
+    if progress:
+        progress("parsed", pages=prepared.pages, chunks=len(chunks))
+
+    embeddings = _add_offset_chunks(get_vector_store(), prepared.unique_chunks, progress)
+    meta = finish_file(prepared, embeddings)
     update_file_index(file_name, len(chunks))
-    print(f"{file_name} added to vector store with {len(chunks)} chunks")
+    update_file_meta(file_name, **meta)
+    events.publish("catalog", action="indexed", file=file_name, chunks=len(chunks))
+
+    elapsed = time.perf_counter() - started
+    metrics.INGEST_SECONDS.observe(elapsed)
+    metrics.INGEST_CHUNKS.inc(len(chunks))
+    metrics.INGEST_THROUGHPUT.set(len(chunks) / elapsed if elapsed > 0 else 0)
+    print(
+        f"{file_name} added to vector store with {len(chunks)} chunks "
+        f"({len(plan.duplicates)} duplicates linked, dedup ratio {plan.ratio:.1%})"
+    )
+
+
+def hydrate_document(doc, context_window: int = 0):
+    """Fill ``page_content`` of an offset-only chunk from the text store."""
+    meta = doc.metadata or {}
+    doc_id = meta.get("doc_id")
+    if doc_id is None or (doc.page_content and not context_window):
+        return doc
+    doc.page_content = text_store.get_text(
+        doc_id, int(meta["start"]), int(meta["end"]), window=context_window
+    )
+    return doc
+
+
+def _attach_linked_sources(docs) -> None:
+    """Record other files containing a deduplicated chunk as ``also_in``."""
+    deduplicator = get_deduplicator()
+    if deduplicator is None:
+        return
+    chunk_ids = [doc.metadata.get("chunk_id") for doc in docs if doc.metadata.get("chunk_id")]
+    linked = deduplicator.linked_sources(chunk_ids)
+    for doc in docs:
+        sources = linked.get(doc.metadata.get("chunk_id"))
+        if sources:
+            doc.metadata["also_in"] = ", ".join(sorted(set(sources)))
 
 
 def get_retriever(overrides=None):
     """Get a retriever with optional configuration overrides."""
+    from offset_retriever import OffsetRetriever
+
     vectordb = get_vector_store()
 
     search_type = os.getenv("RETRIEVER_SEARCH_TYPE", "similarity")
-    k = _env_int("RETRIEVER_K", 15)
-    fetch_k = _env_int("RETRIEVER_FETCH_K", 20)
-    lambda_mult = _env_float("RETRIEVER_LAMBDA_MULT", 0.5)
-    score_threshold = _env_float("RETRIEVER_SCORE_THRESHOLD", 0.5)
+    k = env_int("RETRIEVER_K", 15)
+    fetch_k = env_int("RETRIEVER_FETCH_K", 20)
+    lambda_mult = env_float("RETRIEVER_LAMBDA_MULT", 0.5)
+    score_threshold = env_float("RETRIEVER_SCORE_THRESHOLD", 0.5)
+    context_window = env_int("RETRIEVER_CONTEXT_WINDOW", 0)
+    route_top_m = env_int("RETRIEVER_ROUTE_TOP_M", 8)
 
     if overrides:
         search_type = overrides.get("search_type", search_type)
@@ -308,23 +645,27 @@ def get_retriever(overrides=None):
         fetch_k = overrides.get("fetch_k", fetch_k)
         lambda_mult = overrides.get("lambda_mult", lambda_mult)
         score_threshold = overrides.get("score_threshold", score_threshold)
+        context_window = overrides.get("context_window", context_window)
+        route_top_m = overrides.get("route_top_m", route_top_m)
 
     logger.info(
         f"Retriever config: search_type={search_type}, k={k}, "
-        f"fetch_k={fetch_k}, lambda_mult={lambda_mult}, threshold={score_threshold}"
+        f"fetch_k={fetch_k}, lambda_mult={lambda_mult}, threshold={score_threshold}, "
+        f"context_window={context_window}, route_top_m={route_top_m}"
     )
 
     if search_type == "mmr":
-        return vectordb.as_retriever(
-            search_type="mmr",
-            search_kwargs={"k": k, "fetch_k": fetch_k, "lambda_mult": lambda_mult},
-        )
-    if search_type == "similarity_score_threshold":
-        return vectordb.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={"k": k, "score_threshold": score_threshold},
-        )
-    return vectordb.as_retriever(
-        search_type="similarity",
-        search_kwargs={"k": k},
+        search_kwargs = {"k": k, "fetch_k": fetch_k, "lambda_mult": lambda_mult}
+    elif search_type == "similarity_score_threshold":
+        search_kwargs = {"k": k, "score_threshold": score_threshold}
+    else:
+        search_type = "similarity"
+        search_kwargs = {"k": k}
+
+    return OffsetRetriever(
+        vectordb=vectordb,
+        search_type=search_type,
+        search_kwargs=search_kwargs,
+        context_window=context_window,
+        route_top_m=route_top_m,
     )
@@ -0,0 +1,307 @@
+"""On-demand profiling of live requests and ingestion threads.
+
+Three ways to capture a profile without restarting the server:
+
+- ``arm(count, mode, target)`` profiles the next N requests and/or watcher
+  ingestions.
+- A request carrying an ``X-Profile: sample|cprofile`` header (admin only)
+  is profiled on its own.
+- ``sample_window(seconds)`` samples every thread in the process for a short
+  window.
+
+``sample`` mode is a statistical sampler built on ``sys._current_frames()``;
+it yields flamegraph-ready collapsed stacks (``thread;outer;...;inner count``)
+and top functions. ``cprofile`` mode runs ``cProfile`` on the worker thread
+and yields top functions plus a downloadable ``pstats`` dump. Finished
+profiles are kept in memory (``PROFILE_KEEP``, default 20).
+"""
+
+import contextvars
+import cProfile
+import functools
+import inspect
+import io
+import itertools
+import logging
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from utils import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+MODES = ("sample", "cprofile")
+TARGETS = ("requests", "ingest", "all")
+SAMPLE_INTERVAL = env_float("PROFILE_SAMPLE_INTERVAL_MS", 5) / 1000
+TOP_N = 30
+
+_profiles: deque = deque(maxlen=env_int("PROFILE_KEEP", 20))
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_armed = {"requests": 0, "ingest": 0}
+_armed_mode = {"requests": "sample", "ingest": "sample"}
+
+# Set by the HTTP middleware to {"mode": header mode or None, "profile_id": None};
+# read by ``profiled`` in the worker thread, which takes an armed slot when no
+# mode was requested and fills in the id it stored.
+_requested = contextvars.ContextVar("profiling_requested", default=None)
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Sampler:
+    """Periodically record the stacks of selected threads (all by default)."""
+
+    def __init__(self, thread_ids: Optional[Iterable[int]] = None, interval: float = SAMPLE_INTERVAL):
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.thread_ids is not None and ident not in self.thread_ids):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self) -> "Sampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def top_functions(self, limit: int = TOP_N) -> List[Dict]:
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]  # drop the thread name
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+        overall = sum(self.stacks.values()) or 1
+        return [
+            {
+                "function": name,
+                "self_samples": own[name],
+                "total_samples": total[name],
+                "self_pct": round(100 * own[name] / overall, 2),
+                "total_pct": round(100 * total[name] / overall, 2),
+            }
+            for name, _ in own.most_common(limit)
+        ]
+
+
+def _cprofile_top(profile: cProfile.Profile, limit: int = TOP_N) -> List[Dict]:
+    stats = pstats.Stats(profile, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append({
+            "function": f"{name} ({os.path.basename(filename)}:{line})",
+            "calls": nc,
+            "self_seconds": round(tt, 6),
+            "total_seconds": round(ct, 6),
+        })
+    rows.sort(key=lambda row: row["self_seconds"], reverse=True)
+    return rows[:limit]
+
+
+def _store(label: str, mode: str, started: float, **data) -> Dict:
+    profile = {
+        "id": next(_ids),
+        "label": label,
+        "mode": mode,
+        "started_at": datetime.fromtimestamp(started, timezone.utc).isoformat(),
+        "duration_seconds": round(time.time() - started, 4),
+        **data,
+    }
+    with _lock:
+        _profiles.append(profile)
+    logger.info(f"Captured {mode} profile #{profile['id']} for {label}")
+    return profile
+
+
+@contextmanager
+def capture(label: str, mode: str = "sample", state: Optional[Dict] = None):
+    """Profile the code run by the current thread inside the block."""
+    started = time.time()
+    state = state if state is not None else {}
+    if mode == "cprofile":
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active on this thread.
+            mode = "sample"
+        else:
+            try:
+                yield
+            finally:
+                profile.disable()
+                stats = pstats.Stats(profile, stream=io.StringIO())
+                state["profile_id"] = _store(
+                    label, mode, started,
+                    top_functions=_cprofile_top(profile),
+                    pstats=marshal.dumps(stats.stats),
+                )["id"]
+            return
+
+    sampler = Sampler([threading.get_ident()]).start()
+    try:
+        yield
+    finally:
+        sampler.stop()
+        state["profile_id"] = _store(
+            label, mode, started,
+            samples=sampler.samples,
+            top_functions=sampler.top_functions(),
+            collapsed=sampler.collapsed(),
+        )["id"]
+
+
+def sample_window(seconds: float, interval: float = SAMPLE_INTERVAL) -> Dict:
+    """Sample every thread in the process (request workers, watcher ingestion, ...)."""
+    started = time.time()
+    sampler = Sampler(interval=interval).start()
+    time.sleep(seconds)
+    sampler.stop()
+    return _store(
+        "process window", "sample", started,
+        samples=sampler.samples,
+        top_functions=sampler.top_functions(),
+        collapsed=sampler.collapsed(),
+    )
+
+
+def arm(count: int, mode: str = "sample", target: str = "requests") -> Dict[str, int]:
+    """Profile the next ``count`` requests and/or ingestions."""
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    if target not in TARGETS:
+        raise ValueError(f"target must be one of {', '.join(TARGETS)}")
+    with _lock:
+        for key in (("requests", "ingest") if target == "all" else (target,)):
+            _armed[key] = max(0, count)
+            _armed_mode[key] = mode
+        return dict(_armed)
+
+
+def _take(target: str) -> Optional[str]:
+    with _lock:
+        if _armed[target] <= 0:
+            return None
+        _armed[target] -= 1
+        return _armed_mode[target]
+
+
+def request_scope(header_mode: Optional[str]):
+    """Called by the middleware for every request; returns a token for ``release``.
+
+    Armed slots are only taken by ``profiled`` endpoints, so unprofiled
+    requests (static files, health checks, admin calls) do not use them up.
+    """
+    if header_mode is not None and header_mode not in MODES:
+        raise ValueError(f"X-Profile must be one of {', '.join(MODES)}")
+    return _requested.set({"mode": header_mode, "profile_id": None})
+
+
+def release(token) -> Optional[int]:
+    """Clear the request's profiling state and return the stored profile id."""
+    if token is None:
+        return None
+    state = _requested.get()
+    _requested.reset(token)
+    return state["profile_id"] if state else None
+
+
+def profiled(func):
+    """Run an endpoint under ``capture`` when its request asked for it via
+    X-Profile or an armed request slot is left."""
+    label = func.__name__
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            state, mode = _selected()
+            if mode is None:
+                return await func(*args, **kwargs)
+            with capture(f"request {label}", mode, state):
+                return await func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        state, mode = _selected()
+        if mode is None:
+            return func(*args, **kwargs)
+        with capture(f"request {label}", mode, state):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _selected():
+    """The request's profiling state and mode (None when not profiled)."""
+    state = _requested.get()
+    if state is None:
+        return None, None  # called outside an HTTP request
+    if state["mode"] is None:
+        state["mode"] = _take("requests")
+    return state, state["mode"]
+
+
+@contextmanager
+def ingest_scope(file_name: str):
+    """Profile a watcher ingestion if ingestion profiling is armed."""
+    mode = _take("ingest")
+    if mode is None:
+        yield
+        return
+    with capture(f"ingest {file_name}", mode):
+        yield
+
+
+def list_profiles() -> List[Dict]:
+    with _lock:
+        return [
+            {k: v for k, v in profile.items() if k not in ("collapsed", "pstats", "top_functions")}
+            for profile in reversed(_profiles)
+        ]
+
+
+def get_profile(profile_id: int) -> Optional[Dict]:
+    with _lock:
+        for profile in _profiles:
+            if profile["id"] == profile_id:
+                return profile
+    return None
+
+
+def status() -> Dict:
+    with _lock:
+        return {"armed": dict(_armed), "modes": dict(_armed_mode), "stored": len(_profiles)}
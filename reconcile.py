@@ -0,0 +1,181 @@
+"""Startup reconciliation of the uploads folder against the catalog.
+
+The file watcher only sees changes while the server runs. On start the
+writer compares ``uploads/`` with ``file_index.json`` / ``file_meta.json``
+and queues only what changed while it was down:
+
+- files that are not indexed are queued for ingestion;
+- files whose size or modification time differs from the catalog are
+  hashed (in parallel, ``RECONCILE_WORKERS``), and queued when the hash
+  differs too. A file that was only touched keeps its index entry, and
+  its new modification time is recorded so it is not hashed again;
+- indexed files that are gone from ``uploads/`` are removed in bulk.
+
+Files that match on size and modification time are not read at all, so a
+scan of tens of thousands of unchanged files costs one ``stat`` each.
+With ``UPLOADS_RECURSIVE=true`` subdirectories of ``uploads/`` are
+included (here, in the watcher and in maintenance). Files are still keyed
+by name, so only the first of several files with the same name is used.
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+import events
+import ingest_queue
+from loaders import is_supported
+from upload_store import UPLOAD_TMP_DIR
+from utils import env_flag, env_int, file_sha256, load_file_index, load_file_meta, update_file_entries
+
+logger = logging.getLogger(__name__)
+
+STALE_PART_SECONDS = 3600
+
+
+def recursive() -> bool:
+    return env_flag("UPLOADS_RECURSIVE")
+
+
+def enabled() -> bool:
+    return env_flag("RECONCILE_ON_STARTUP", True)
+
+
+def list_uploads(upload_dir: str, recursive_scan: Optional[bool] = None) -> Dict[str, os.DirEntry]:
+    """Supported files in ``upload_dir``, by file name."""
+    if recursive_scan is None:
+        recursive_scan = recursive()
+    found: Dict[str, os.DirEntry] = {}
+    pending = [upload_dir]
+    while pending:
+        try:
+            entries = sorted(os.scandir(pending.pop()), key=lambda e: e.name)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive_scan:
+                    pending.append(entry.path)
+            elif entry.is_file() and is_supported(entry.name):
+                if entry.name in found:
+                    logger.warning(f"Ignoring {entry.path}: {found[entry.name].path} has the same name")
+                else:
+                    found[entry.name] = entry
+    return found
+
+
+def changed_files(files: Dict[str, os.DirEntry], workers: Optional[int] = None) -> dict:
+    """Compare ``files`` with the catalog.
+
+    Returns ``added`` and ``modified`` (file name -> (path, sha256 or None)),
+    ``touched`` (unchanged content, new mtime: file name -> meta fields),
+    and the number of ``unchanged`` and ``hashed`` files.
+    """
+    index = load_file_index()
+    meta = load_file_meta()
+    added, suspects, unchanged = {}, [], 0
+    for name, entry in files.items():
+        if not index.get(name):
+            added[name] = (entry.path, None)
+            continue
+        stat = entry.stat()
+        known = meta.get(name, {})
+        if known.get("size") is not None and known["size"] != stat.st_size:
+            suspects.append((name, entry.path, stat, False))
+        elif known.get("mtime_ns") == stat.st_mtime_ns:
+            unchanged += 1
+        else:
+            suspects.append((name, entry.path, stat, True))
+
+    modified, touched = {}, {}
+    workers = workers or max(1, env_int("RECONCILE_WORKERS", 8))
+    to_hash = [item for item in suspects if item[3]]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reconcile") as pool:
+        hashes = dict(zip((item[0] for item in to_hash), pool.map(lambda item: file_sha256(item[1]), to_hash)))
+    for name, path, stat, same_size in suspects:
+        sha256 = hashes.get(name)
+        indexed_sha256 = meta.get(name, {}).get("sha256")
+        if same_size and sha256 == indexed_sha256:
+            touched[name] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+            unchanged += 1
+        elif same_size and indexed_sha256 is None:
+            # Indexed before hashes were recorded: adopt the current content.
+            touched[name] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": sha256}
+            unchanged += 1
+        else:
+            modified[name] = (path, sha256)
+    return {
+        "added": added,
+        "modified": modified,
+        "touched": touched,
+        "unchanged": unchanged,
+        "hashed": len(to_hash),
+    }
+
+
+def _remove_deleted(names) -> None:
+    import processor
+    from maintenance import remove_files
+
+    remove_files(
+        processor.get_vector_store(), processor.get_document_index(), processor.get_deduplicator(), names
+    )
+    for name in names:
+        events.publish("catalog", action="deleted", file=name)
+
+
+def _clean_upload_tmp() -> int:
+    """Remove upload temp files abandoned by a crash (older than an hour)."""
+    cutoff = time.time() - STALE_PART_SECONDS
+    removed = 0
+    try:
+        entries = list(os.scandir(UPLOAD_TMP_DIR))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.name.endswith(".part") and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def reconcile(upload_dir: str, dry_run: bool = False, busy: Iterable[str] = ()) -> dict:
+    """Queue ingestion for new and modified uploads and remove deleted ones."""
+    started = time.perf_counter()
+    busy = set(busy)
+    files = {name: entry for name, entry in list_uploads(upload_dir).items() if name not in busy}
+    changes = changed_files(files)
+    deleted = sorted(name for name in load_file_index() if name not in files and name not in busy)
+    removed_parts = 0
+
+    if not dry_run:
+        if changes["touched"]:
+            index = load_file_index()
+            update_file_entries({name: (index[name], fields) for name, fields in changes["touched"].items()})
+        for path, sha256 in list(changes["added"].values()) + list(changes["modified"].values()):
+            ingest_queue.submit(path, sha256=sha256, source="reconcile")
+        if deleted:
+            _remove_deleted(deleted)
+        removed_parts = _clean_upload_tmp()
+
+    report = {
+        "dry_run": dry_run,
+        "files": len(files),
+        "added": sorted(changes["added"]),
+        "modified": sorted(changes["modified"]),
+        "deleted": deleted,
+        "unchanged": changes["unchanged"],
+        "hashed": changes["hashed"],
+        "stale_upload_parts": removed_parts,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info(
+        f"Reconciled {len(files)} uploads in {report['seconds']}s: {len(report['added'])} added, "
+        f"{len(report['modified'])} modified, {len(deleted)} deleted, {changes['hashed']} hashed"
+    )
+    return report
@@ -0,0 +1,144 @@
+"""Process resource accounting for ``/api/stats``.
+
+Reports resident memory (from ``/proc`` where available) next to the sizes
+of the components that usually explain it: the embedding model's
+parameters, the vector store and text store (on disk and mapped), the
+in-process caches, plus request/ingestion load and thread counts. Nothing
+here forces the embedding model or vector store to load.
+"""
+
+import os
+import re
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+import answer_cache
+import cache
+import coordinator
+import metrics
+import sessions
+
+_started = time.time()
+
+
+def _proc_status() -> Dict[str, int]:
+    """VmRSS/VmHWM/VmSize/RssAnon/RssFile in bytes (Linux only)."""
+    values = {}
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("VmRSS", "VmHWM", "VmSize", "RssAnon", "RssFile", "RssShmem"):
+                    values[key] = int(rest.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return values
+
+
+def rss_bytes() -> Optional[int]:
+    status = _proc_status()
+    if "VmRSS" in status:
+        return status["VmRSS"]
+    return None
+
+
+metrics.PROCESS_RSS.set_function(lambda: rss_bytes() or 0)
+
+
+def _peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _embedding_model_stats() -> Dict[str, Any]:
+    import processor
+
+    model = processor._embedding_model
+    if model is None:
+        return {"loaded": False}
+    info: Dict[str, Any] = {"loaded": True, "name": getattr(model, "model_name", type(model).__name__)}
+    client = getattr(model, "_client", None) or getattr(model, "client", None)
+    parameters = getattr(client, "parameters", None)
+    if callable(parameters):
+        count = size = 0
+        for param in parameters():
+            count += param.numel()
+            size += param.numel() * param.element_size()
+        info.update(parameters=count, parameter_bytes=size, device=str(getattr(client, "device", "")))
+    return info
+
+
+def _vector_store_stats() -> Dict[str, Any]:
+    import processor
+    import text_store
+
+    info: Dict[str, Any] = {
+        "disk_bytes": directory_size(processor.VECTOR_DB_DIR),
+        "text_store_disk_bytes": directory_size(text_store.TEXT_STORE_DIR),
+        "text_store_mapped_bytes": text_store.mapped_bytes(),
+        "loaded": processor._vectordb is not None,
+    }
+    if processor._vectordb is not None:
+        try:
+            info["chunks"] = processor._vectordb._collection.count()
+        except Exception as exc:
+            info["chunks_error"] = str(exc)
+    if processor._document_index is not None:
+        try:
+            info["routing_entries"] = processor._document_index._collection.count()
+        except Exception:
+            pass
+    return info
+
+
+def _thread_stats() -> Dict[str, Any]:
+    roles = Counter()
+    for thread in threading.enumerate():
+        # Collapse per-item names such as "ingest-report.pdf" or "AnyIO worker thread".
+        roles[re.split(r"[-_ ]\S*$", thread.name)[0] or thread.name] += 1
+    return {"total": threading.active_count(), "by_name": dict(roles.most_common())}
+
+
+def collect() -> Dict[str, Any]:
+    from loaders import PAGE_CACHE_DIR
+    from utils import load_file_index
+
+    status = _proc_status()
+    index = load_file_index()
+    return {
+        "uptime_seconds": round(time.time() - _started, 1),
+        "memory": {
+            "rss_bytes": status.get("VmRSS"),
+            "peak_rss_bytes": status.get("VmHWM") or _peak_rss_bytes(),
+            "virtual_bytes": status.get("VmSize"),
+            "anonymous_bytes": status.get("RssAnon"),
+            "file_backed_bytes": status.get("RssFile"),
+        },
+        "embedding_model": _embedding_model_stats(),
+        "vector_store": _vector_store_stats(),
+        "page_cache_disk_bytes": directory_size(PAGE_CACHE_DIR),
+        "caches": cache.stats(),
+        "sessions": sessions.stats(),
+        "answer_cache": answer_cache.stats(),
+        "files": {"count": len(index), "chunks": sum(index.values())},
+        "requests_in_flight": metrics.HTTP_IN_FLIGHT.value(),
+        "ingest_queue_depth": metrics.INGEST_QUEUE_DEPTH.value(),
+        "threads": _thread_stats(),
+        "worker": coordinator.status(),
+    }
@@ -0,0 +1,211 @@
+"""
+Retrieval quality/latency evaluation and configuration auto-tuner.
+
+Sweeps the ``get_retriever`` parameters (search type, k, fetch_k,
+lambda_mult, score threshold, routing top-m) over a labelled question set
+and reports, per configuration:
+
+- ``recall_at_k``: share of questions with at least one relevant chunk returned
+- ``mrr``: mean reciprocal rank of the first relevant chunk
+- latency percentiles and the mean number of chunks/characters returned
+
+It then recommends the cheapest configuration (fewest characters handed to
+the LLM, then lowest latency) that meets ``--target-recall``.
+
+The labelled set is a JSON list of ``{"question": ..., "relevant_chunks":
+[chunk_id, ...], "relevant_text": [snippet, ...]}``; a retrieved chunk is
+relevant if its ``chunk_id`` is listed or its text contains a snippet.
+Without ``--set`` a synthetic set is built from the indexed corpus by using
+a span of words from randomly sampled chunks as the question.
+
+    python retrieval_eval.py --questions 50 --target-recall 0.9
+    python retrieval_eval.py --set labelled.json --k 3,5,8 --search-types similarity,mmr
+"""
+
+import argparse
+import itertools
+import json
+import random
+import re
+import time
+
+from benchmark import percentiles
+
+
+def _int_list(value: str):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _float_list(value: str):
+    return [float(v) for v in value.split(",") if v.strip()]
+
+
+def synthetic_set(size: int, words: int = 12, seed: int = 13):
+    """Build questions from spans of randomly sampled indexed chunks."""
+    import processor
+    import text_store
+
+    collection = processor.get_vector_store()._collection
+    records = collection.get(include=["metadatas"])
+    candidates = [
+        (chunk_id, meta) for chunk_id, meta in zip(records["ids"], records["metadatas"])
+        if meta and meta.get("doc_id") is not None
+    ]
+    rng = random.Random(seed)
+    rng.shuffle(candidates)
+
+    labelled = []
+    for chunk_id, meta in candidates:
+        if len(labelled) >= size:
+            break
+        text = text_store.get_text(meta["doc_id"], int(meta["start"]), int(meta["end"]))
+        tokens = re.findall(r"\S+", text)
+        if len(tokens) < words:
+            continue
+        offset = rng.randint(0, len(tokens) - words)
+        snippet = " ".join(tokens[offset:offset + words])
+        labelled.append({
+            "question": snippet,
+            "relevant_chunks": [chunk_id],
+            "relevant_text": [snippet],
+            "source": meta.get("source_file"),
+        })
+    return labelled
+
+
+def _is_relevant(doc, item) -> bool:
+    if doc.metadata.get("chunk_id") in set(item.get("relevant_chunks") or ()):
+        return True
+    text = " ".join(doc.page_content.split())
+    return any(" ".join(snippet.split()) in text for snippet in item.get("relevant_text") or ())
+
+
+def configurations(args):
+    """Expand the CLI grids into get_retriever override dicts."""
+    for search_type in args.search_types.split(","):
+        search_type = search_type.strip()
+        for k, route_top_m in itertools.product(args.k, args.route_top_m):
+            base = {"search_type": search_type, "k": k, "route_top_m": route_top_m, "context_window": 0}
+            if search_type == "mmr":
+                for fetch_k, lambda_mult in itertools.product(args.fetch_k, args.lambda_mult):
+                    if fetch_k >= k:
+                        yield {**base, "fetch_k": fetch_k, "lambda_mult": lambda_mult}
+            elif search_type == "similarity_score_threshold":
+                for threshold in args.score_threshold:
+                    yield {**base, "score_threshold": threshold}
+            else:
+                yield base
+
+
+def evaluate(config: dict, labelled) -> dict:
+    import processor
+
+    retriever = processor.get_retriever(config)
+    hits, reciprocal_ranks, timings, returned, characters, errors = 0, [], [], [], [], 0
+    for item in labelled:
+        start = time.perf_counter()
+        try:
+            docs = retriever.invoke(item["question"])
+        except Exception:
+            errors += 1
+            docs = []
+        timings.append(time.perf_counter() - start)
+        returned.append(len(docs))
+        characters.append(sum(len(doc.page_content) for doc in docs))
+        rank = next((i for i, doc in enumerate(docs, start=1) if _is_relevant(doc, item)), None)
+        hits += rank is not None
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+    count = len(labelled) or 1
+    return {
+        "config": config,
+        "recall_at_k": round(hits / count, 4),
+        "mrr": round(sum(reciprocal_ranks) / count, 4),
+        "latency": percentiles(timings),
+        "mean_chunks": round(sum(returned) / count, 2),
+        "mean_characters": round(sum(characters) / count, 1),
+        "errors": errors,
+    }
+
+
+def recommend(results, target_recall: float):
+    """Cheapest configuration meeting the target recall (or the best recall)."""
+    passing = [r for r in results if r["recall_at_k"] >= target_recall and not r["errors"]]
+    if not passing:
+        return None
+    return min(passing, key=lambda r: (r["mean_characters"], r["latency"].get("p50", 0)))
+
+
+def _env_lines(config: dict):
+    names = {
+        "search_type": "RETRIEVER_SEARCH_TYPE",
+        "k": "RETRIEVER_K",
+        "fetch_k": "RETRIEVER_FETCH_K",
+        "lambda_mult": "RETRIEVER_LAMBDA_MULT",
+        "score_threshold": "RETRIEVER_SCORE_THRESHOLD",
+        "route_top_m": "RETRIEVER_ROUTE_TOP_M",
+    }
+    return [f"{names[key]}={value}" for key, value in config.items() if key in names]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate and tune retriever settings.")
+    parser.add_argument("--set", help="Labelled question set (JSON)")
+    parser.add_argument("--questions", type=int, default=50, help="Size of the synthetic set")
+    parser.add_argument("--words", type=int, default=12, help="Words per synthetic question")
+    parser.add_argument("--save-set", help="Write the (synthetic) labelled set here")
+    parser.add_argument("--search-types", default="similarity,mmr,similarity_score_threshold")
+    parser.add_argument("--k", type=_int_list, default=[3, 5, 8, 10, 15])
+    parser.add_argument("--fetch-k", type=_int_list, default=[20, 40])
+    parser.add_argument("--lambda-mult", type=_float_list, default=[0.5, 0.75])
+    parser.add_argument("--score-threshold", type=_float_list, default=[0.3, 0.5])
+    parser.add_argument("--route-top-m", type=_int_list, default=[0, 8])
+    parser.add_argument("--target-recall", type=float, default=0.9)
+    parser.add_argument("--output", default="retrieval_eval.json")
+    args = parser.parse_args()
+
+    if args.set:
+        with open(args.set, "r", encoding="utf-8") as f:
+            labelled = json.load(f)
+    else:
+        labelled = synthetic_set(args.questions, words=args.words)
+    if not labelled:
+        parser.error("No questions to evaluate (is anything indexed?)")
+    if args.save_set:
+        with open(args.save_set, "w", encoding="utf-8") as f:
+            json.dump(labelled, f, indent=2)
+
+    results = []
+    for config in configurations(args):
+        result = evaluate(config, labelled)
+        results.append(result)
+        print(
+            f"{json.dumps(config):100s} recall={result['recall_at_k']:.3f} "
+            f"mrr={result['mrr']:.3f} p50={result['latency'].get('p50')}s "
+            f"chunks={result['mean_chunks']}",
+            flush=True,
+        )
+
+    best = recommend(results, args.target_recall)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "questions": len(labelled),
+            "target_recall": args.target_recall,
+            "results": results,
+            "recommendation": best,
+        }, f, indent=2)
+
+    if best is None:
+        top = max(results, key=lambda r: r["recall_at_k"])
+        print(f"\nNo configuration reached recall {args.target_recall:.0%}; "
+              f"best was {top['recall_at_k']:.1%} with {json.dumps(top['config'])}")
+    else:
+        print(f"\nRecommended (recall {best['recall_at_k']:.1%}, mrr {best['mrr']:.3f}, "
+              f"{best['mean_chunks']} chunks, p50 {best['latency'].get('p50')}s):")
+        for line in _env_lines(best["config"]):
+            print(f"  {line}")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
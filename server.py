@@ -1,16 +1,45 @@
+import asyncio
+import json
 import os
+import threading
+import time
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 import logging
 
-from fastapi import FastAPI, File, HTTPException, UploadFile
-from fastapi.responses import FileResponse
+from fastapi import Depends, FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
-
+from dotenv import load_dotenv
+
+# Before the app modules: some of them read settings at import time.
+load_dotenv()
+
+import catalog
+import coordinator
+from bulk_upload import BatchUpload, is_archive, max_bulk_upload_bytes
+import events
+import ingest_journal
+import ingest_queue
+from loaders import is_supported, supported_extensions
 from processor import UPLOAD_FOLDER
-from clara_engine import answer_with_clara
-from utils import load_file_index
+import metrics
+import profiling
+import reconcile
+import resources
+import sessions
+import text_store
+from upload_store import UploadTooLarge, max_upload_bytes, save_stream
+from utils import env_int, load_file_index
+import warmup
 from watcher import start_file_watcher
 
 logging.basicConfig(level=logging.INFO)
@@ -24,6 +53,7 @@ app = FastAPI(title="Local Chat Ollama", version="0.1.0")
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 observer = None
+SSE_HEARTBEAT_SECONDS = 15
 
 
 class QueryRequest(BaseModel):
@@ -35,25 +65,170 @@ class CLaRaQueryRequest(BaseModel):
     max_iterations: int = Field(default=3, ge=1, le=8)
     max_hops: int = Field(default=3, ge=1, le=8)
     detailed: bool = True
+    session_id: Optional[str] = Field(default=None, min_length=1, max_length=sessions.MAX_SESSION_ID_LENGTH)
+
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str] = Field(min_length=1)
+    max_iterations: int = Field(default=3, ge=1, le=8)
+    max_hops: int = Field(default=3, ge=1, le=8)
+    detailed: bool = False
+    parallelism: Optional[int] = Field(default=None, ge=1, le=64)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    if not metrics.ENABLED or request.url.path == "/api/events":
+        # Long-lived event streams would skew latency and in-flight counts.
+        return await call_next(request)
+    metrics.HTTP_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            path=getattr(route, "path", "unmatched"),
+            status=status,
+        )
+        metrics.HTTP_IN_FLIGHT.dec()
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse uploads whose declared size is over MAX_UPLOAD_MB before the
+    body is read. Chunked bodies without a Content-Length are only checked
+    while being copied, after Starlette has received the whole body."""
+    if request.method == "POST" and request.url.path.startswith("/api/upload"):
+        limit = (
+            max_bulk_upload_bytes() if request.url.path == "/api/upload/bulk" else max_upload_bytes()
+        )
+        declared = request.headers.get("Content-Length")
+        # Allow some slack for the multipart envelope.
+        if declared and declared.isdigit() and int(declared) > limit + 64 * 1024:
+            return JSONResponse(
+                {"detail": f"Upload exceeds the {limit / (1024 * 1024):g} MB limit"},
+                status_code=413,
+            )
+    return await call_next(request)
+
+
+def require_admin(request: Request):
+    """Allow admin endpoints with a matching X-Admin-Token, or from localhost
+    when ADMIN_TOKEN is not configured."""
+    token = os.getenv("ADMIN_TOKEN")
+    if token:
+        if request.headers.get("X-Admin-Token") != token:
+            raise HTTPException(status_code=403, detail="Admin token required")
+        return
+    client_host = request.client.host if request.client else None
+    if client_host not in ("127.0.0.1", "::1", "localhost"):
+        raise HTTPException(status_code=403, detail="Admin endpoints are restricted to localhost")
+
+
+@app.middleware("http")
+async def select_profiled_requests(request: Request, call_next):
+    """Mark the request for profiling when armed or asked via X-Profile."""
+    header_mode = request.headers.get("X-Profile") or None
+    if header_mode:
+        try:
+            require_admin(request)
+        except HTTPException as exc:
+            return JSONResponse({"detail": exc.detail}, status_code=exc.status_code)
+    try:
+        token = profiling.request_scope(header_mode)
+    except ValueError as exc:
+        return JSONResponse({"detail": str(exc)}, status_code=400)
+    try:
+        response = await call_next(request)
+    finally:
+        profile_id = profiling.release(token)
+    if profile_id is not None:
+        response.headers["X-Profile-Id"] = str(profile_id)
+    return response
+
+
+def _recover_ingestion(interrupted: dict):
+    """Resume jobs cut off by the last shutdown, then catch up on upload
+    changes made while the server was down."""
+    try:
+        queue = ingest_queue.get_queue()
+        queue.resume_interrupted(interrupted)
+        if reconcile.enabled():
+            reconcile.reconcile(str(UPLOAD_DIR_ABS), busy=queue.active_files())
+    except Exception as exc:
+        logger.error(f"Startup recovery failed: {exc}")
+
+
+def _start_writer():
+    """Writer duties: recover ingestion state, then watch the upload folder."""
+    global observer
+    # Claimed before the watcher or any upload can journal new jobs.
+    interrupted = ingest_journal.claim_unfinished()
+    threading.Thread(
+        target=_recover_ingestion, args=(interrupted,), name="ingest-recovery", daemon=True
+    ).start()
+    observer = start_file_watcher(str(UPLOAD_DIR_ABS))
+
+
+def _delete_vectors(file_name: str) -> int:
+    from delete_file import delete_file
+
+    return delete_file(file_name)
+
+
+def _run_maintenance(dry_run: bool, keep_backups: int) -> dict:
+    from maintenance import run_maintenance
+
+    busy = ingest_queue.get_queue().active_files()
+    report = run_maintenance(dry_run=dry_run, keep_backups=keep_backups, busy=busy)
+    if not dry_run:
+        coordinator.notify_changed()
+    return report
+
+
+def _run_reconcile(dry_run: bool) -> dict:
+    busy = ingest_queue.get_queue().active_files()
+    return reconcile.reconcile(str(UPLOAD_DIR_ABS), dry_run=dry_run, busy=busy)
+
+
+# Writes that reader workers forward to the writer (multi-worker mode).
+coordinator.register("delete", _delete_vectors)
+coordinator.register("maintenance", _run_maintenance)
+coordinator.register("reconcile", _run_reconcile)
 
 
 @app.on_event("startup")
 def on_startup():
-    """Ensure folders exist and start the file watcher."""
-    global observer
+    """Ensure folders exist, elect the writer and start the file watcher there."""
     UPLOAD_DIR_ABS.mkdir(parents=True, exist_ok=True)
     logger.info(f"Upload directory: {UPLOAD_DIR_ABS}")
-    observer = start_file_watcher(str(UPLOAD_DIR_ABS))
+    coordinator.start(on_promote=_start_writer)
+    if coordinator.is_writer():
+        _start_writer()
+    else:
+        logger.info("Read-only worker: ingestion is handled by the writer process")
+    warmup.start()
 
 
 @app.on_event("shutdown")
 def on_shutdown():
-    """Stop the file watcher when the server exits."""
+    """Stop taking new files, drain ingestion, release cached state and give up
+    the writer role when the server exits."""
     global observer
     if observer:
         observer.stop()
         observer.join()
         observer = None
+    if coordinator.is_writer():
+        ingest_queue.drain()
+    text_store.clear_maps()
+    coordinator.stop()
 
 
 @app.get("/")
@@ -63,46 +238,170 @@ def root():
 
 @app.get("/api/health")
 def health():
+    """Liveness: answers as soon as the process serves HTTP, even while warming up."""
     return {"status": "ok"}
 
 
+@app.get("/api/ready")
+def ready():
+    """Readiness: 503 until the embedding model, vector store and LLM client are loaded."""
+    state = warmup.status()
+    return JSONResponse(state, status_code=200 if warmup.ready() else 503)
+
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus text exposition of pipeline, ingestion and HTTP metrics."""
+    if not metrics.ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/stats")
+def resource_stats():
+    """Memory, storage, cache, load and thread accounting for this process."""
+    return resources.collect()
+
+
 @app.get("/api/files")
-def list_files():
-    index = load_file_index()
-    files: List[dict] = [
-        {"name": name, "chunks": chunks}
-        for name, chunks in sorted(index.items())
-    ]
-    return {"files": files}
+@profiling.profiled
+def list_files(
+    request: Request,
+    sort: str = "name",
+    order: str = "asc",
+    prefix: str = "",
+    cursor: str | None = None,
+    limit: int = 1000,
+):
+    """Page through indexed files (cursor pagination, prefix search, sorting).
+
+    Served from an in-memory snapshot; unchanged listings return 304 when the
+    client sends the previous ETag in If-None-Match.
+    """
+    snapshot = catalog.get_snapshot(str(UPLOAD_DIR_ABS))
+    etag = catalog.listing_etag(
+        snapshot, sort=sort, order=order, prefix=prefix, cursor=cursor, limit=limit
+    )
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in (request.headers.get("If-None-Match") or ""):
+        return Response(status_code=304, headers=headers)
+    try:
+        page = snapshot.page(sort=sort, order=order, prefix=prefix, cursor=cursor, limit=limit)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return JSONResponse(page, headers=headers)
 
 
 @app.post("/api/upload")
+@profiling.profiled
 async def upload_file(file: UploadFile = File(...)):
     if not file.filename:
         raise HTTPException(status_code=400, detail="A file is required")
 
     safe_name = os.path.basename(file.filename)
-    if not safe_name.lower().endswith((".pdf", ".docx")):
-        raise HTTPException(status_code=400, detail="Only PDF or DOCX files are supported")
-
-    dest_path = UPLOAD_DIR_ABS / safe_name
-    contents = await file.read()
+    if not is_supported(safe_name):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Supported file types: {', '.join(supported_extensions())}",
+        )
 
     try:
-        with open(dest_path, "wb") as f:
-            f.write(contents)
-        logger.info(f"File uploaded: {dest_path}")
-        # The file watcher will pick this up and process asynchronously.
+        stored = await run_in_threadpool(save_stream, file.file, safe_name, str(UPLOAD_DIR_ABS))
+    except UploadTooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
     except Exception as exc:
         logger.error(f"Upload error: {exc}")
         raise HTTPException(status_code=500, detail=f"Could not save file: {exc}")
 
-    return {"file": safe_name, "status": "queued"}
+    logger.info(f"File uploaded: {stored.path} ({stored.size} bytes)")
+    job = ingest_queue.submit(stored.path, sha256=stored.sha256, source="upload")
+    return {
+        "file": safe_name,
+        "status": "queued",
+        "job_id": job.id,
+        "sha256": stored.sha256,
+        "size": stored.size,
+    }
+
+
+@app.post("/api/upload/bulk")
+@profiling.profiled
+async def upload_bulk(files: List[UploadFile] = File(...)):
+    """Upload many documents and/or zip/tar archives as one ingestion batch."""
+    batch = BatchUpload(str(UPLOAD_DIR_ABS))
+    for upload in files:
+        name = upload.filename or ""
+        try:
+            if is_archive(name):
+                await run_in_threadpool(batch.add_archive, upload.file, name)
+            else:
+                await run_in_threadpool(batch.add_stream, name, upload.file)
+        except Exception as exc:
+            logger.error(f"Bulk upload error for {name}: {exc}")
+            batch.batch.skipped.append({"file": name, "reason": f"could not save: {exc}"})
+    logger.info(
+        f"Batch {batch.batch.id}: {len(batch.batch.job_ids)} files queued, "
+        f"{len(batch.batch.skipped)} skipped"
+    )
+    batch.queue.record_batch(batch.batch)
+    return batch.queue.batch_status(batch.batch.id)
+
+
+@app.get("/api/batches/{batch_id}")
+def get_batch(batch_id: str):
+    status = ingest_queue.get_queue().batch_status(batch_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Batch not found: {batch_id}")
+    return status
+
+
+@app.get("/api/events")
+async def stream_events(request: Request):
+    """Server-sent events for ingestion progress and catalog changes."""
+    last_id = request.headers.get("Last-Event-ID")
+    token, queue, missed = events.subscribe(int(last_id) if last_id and last_id.isdigit() else None)
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            for event in missed:
+                yield events.format_sse(event)
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield events.format_sse(event)
+        finally:
+            events.unsubscribe(token)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/jobs")
+def list_jobs(limit: int = 100):
+    return {"jobs": [job.to_dict() for job in ingest_queue.get_queue().jobs(limit)]}
+
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    job = ingest_queue.get_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job.to_dict()
 
 
 @app.post("/api/query")
+@profiling.profiled
 def query_documents(payload: QueryRequest):
     """Compatibility endpoint that routes to CLaRa."""
+    from clara_engine import answer_with_clara
+
     question = payload.question.strip()
     if not question:
         raise HTTPException(status_code=400, detail="Question cannot be empty")
@@ -116,7 +415,10 @@ def query_documents(payload: QueryRequest):
 
 
 @app.post("/api/clara-query")
+@profiling.profiled
 def clara_query_documents(payload: CLaRaQueryRequest):
+    from clara_engine import answer_with_clara
+
     question = payload.question.strip()
     if not question:
         raise HTTPException(status_code=400, detail="Question cannot be empty")
@@ -127,6 +429,7 @@ def clara_query_documents(payload: CLaRaQueryRequest):
             max_iterations=payload.max_iterations,
             max_hops=payload.max_hops,
             detailed_response=payload.detailed,
+            session_id=payload.session_id,
         )
     except Exception as exc:  # pragma: no cover - propagate clean error
         raise HTTPException(status_code=500, detail=f"Could not generate CLaRa answer: {exc}")
@@ -136,15 +439,48 @@ def clara_query_documents(payload: CLaRaQueryRequest):
     return {"answer": answer}
 
 
+@app.delete("/api/sessions/{session_id}")
+def end_session(session_id: str):
+    """Forget a conversation's turns and evidence."""
+    if not sessions.end(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"session_id": session_id, "status": "ended"}
+
+
+@app.post("/api/batch-query")
+@profiling.profiled
+def batch_query_documents(payload: BatchQueryRequest):
+    """Answer many questions at once; results stream back as NDJSON lines."""
+    import batch_query
+
+    limit = batch_query.max_batch_questions()
+    if len(payload.questions) > limit:
+        raise HTTPException(status_code=400, detail=f"At most {limit} questions per batch")
+
+    try:
+        records = batch_query.run_batch(
+            payload.questions,
+            max_iterations=payload.max_iterations,
+            max_hops=payload.max_hops,
+            detailed=payload.detailed,
+            parallelism=payload.parallelism,
+        )
+    except Exception as exc:  # pragma: no cover - propagate clean error
+        raise HTTPException(status_code=500, detail=f"Could not start batch: {exc}")
+
+    return StreamingResponse(
+        (json.dumps(record) + "\n" for record in records),
+        media_type="application/x-ndjson",
+    )
+
+
 @app.delete("/api/files/{file_name}")
 def delete_document(file_name: str):
     """Delete a file from disk (uploads/), vector store, and index."""
-    from delete_file import delete_file
-
     safe_name = os.path.basename(file_name)
     try:
-        # 1) Remove vectors + index (idempotent)
-        delete_file(safe_name)
+        # 1) Remove vectors + index (idempotent; done by the writer process)
+        coordinator.call("delete", file_name=safe_name)
 
         # 2) Remove the physical file from uploads/
         disk_path = UPLOAD_DIR_ABS / safe_name
@@ -159,52 +495,56 @@ def delete_document(file_name: str):
 
 
 @app.post("/api/process-uploads")
+@profiling.profiled
 def process_uploads(file_name: str | None = None):
     """Manually trigger processing.
 
     - If file_name is provided: process only that file (useful as a fallback when watcher misses events).
-    - If file_name is omitted: process all unindexed files in uploads/.
+    - If file_name is omitted: process all unindexed or modified files in uploads/.
     """
-    from processor import process_file
-    import glob
-    
-    upload_path = UPLOAD_DIR_ABS
-
+    files = reconcile.list_uploads(str(UPLOAD_DIR_ABS))
     safe_name = os.path.basename(file_name) if file_name else None
     if safe_name:
-        candidate = upload_path / safe_name
-        if not candidate.exists() or not candidate.is_file():
+        if safe_name not in files:
             raise HTTPException(status_code=404, detail=f"File not found in uploads: {safe_name}")
-        all_files = [str(candidate)]
-    else:
-        pdf_files = glob.glob(str(upload_path / "*.pdf"))
-        docx_files = glob.glob(str(upload_path / "*.docx"))
-        all_files = pdf_files + docx_files
-    
+        files = {safe_name: files[safe_name]}
+
+    # New files, and indexed files whose content changed since ingestion.
+    changes = reconcile.changed_files(files)
+    pending = list(changes["added"].values()) + list(changes["modified"].values())
     processed = []
     errors = []
-    
-    index = load_file_index()
-    for file_path in all_files:
-        base_name = os.path.basename(file_path)
-        # Check if already indexed
-        if base_name not in index or index.get(base_name, 0) == 0:
-            try:
-                logger.info(f"Manually processing: {file_path}")
-                process_file(file_path)
-                processed.append(base_name)
-            except Exception as e:
-                logger.error(f"Error processing {file_path}: {e}")
-                errors.append({"file": base_name, "error": str(e)})
+
+    if not coordinator.is_writer():
+        # Read-only worker: hand the files to the writer instead of ingesting here.
+        queued = [
+            ingest_queue.submit(path, sha256=sha256, source="process-uploads").id
+            for path, sha256 in pending
+        ]
+        return {"processed": [], "queued": queued, "errors": [], "total": len(files)}
+
+    # Through the queue, so these jobs are journaled and drained like any other.
+    jobs = []
+    for file_path, sha256 in pending:
+        logger.info(f"Manually processing: {file_path}")
+        jobs.append(ingest_queue.submit(file_path, sha256=sha256, source="process-uploads"))
+    queue = ingest_queue.get_queue()
+    for job in jobs:
+        queue.wait(job)
+        if job.status in ("done", "skipped"):
+            processed.append(job.file_name)
+        else:
+            errors.append({"file": job.file_name, "error": job.error or f"Ingestion {job.status}"})
     
     return {
         "processed": processed,
         "errors": errors,
-        "total": len(all_files),
+        "total": len(files),
     }
 
 
 @app.post("/api/debug-query")
+@profiling.profiled
 def debug_query(payload: QueryRequest):
     """Debug endpoint to see retrieved documents."""
     from processor import get_retriever
@@ -230,12 +570,88 @@ def debug_query(payload: QueryRequest):
         raise HTTPException(status_code=500, detail=f"Debug error: {exc}")
 
 
+@app.post("/api/admin/maintenance", dependencies=[Depends(require_admin)])
+def run_index_maintenance(dry_run: bool = False, keep_backups: int = 1):
+    """Remove orphaned vectors, compact storage and prune old vector store backups."""
+    try:
+        return coordinator.call("maintenance", timeout=600, dry_run=dry_run, keep_backups=keep_backups)
+    except Exception as exc:
+        logger.error(f"Maintenance error: {exc}")
+        raise HTTPException(status_code=500, detail=f"Maintenance failed: {exc}")
+
+
+@app.post("/api/admin/reconcile", dependencies=[Depends(require_admin)])
+def run_reconcile(dry_run: bool = False):
+    """Compare uploads/ with the catalog and queue what changed (also run at startup)."""
+    try:
+        return coordinator.call("reconcile", timeout=600, dry_run=dry_run)
+    except Exception as exc:
+        logger.error(f"Reconcile error: {exc}")
+        raise HTTPException(status_code=500, detail=f"Reconcile failed: {exc}")
+
+
+@app.get("/api/admin/profiles", dependencies=[Depends(require_admin)])
+def list_profiles():
+    """Armed counters and captured profiles (without their payloads)."""
+    return {**profiling.status(), "profiles": profiling.list_profiles()}
+
+
+@app.post("/api/admin/profiles/arm", dependencies=[Depends(require_admin)])
+def arm_profiling(count: int = 1, mode: str = "sample", target: str = "requests"):
+    """Profile the next N requests and/or watcher ingestions."""
+    try:
+        armed = profiling.arm(count, mode=mode, target=target)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"armed": armed, "mode": mode}
+
+
+@app.post("/api/admin/profiles/window", dependencies=[Depends(require_admin)])
+def sample_process(seconds: float = 5.0, interval_ms: float = 5.0):
+    """Sample every thread (requests, watcher ingestion, ...) for a short window."""
+    if not 0 < seconds <= 60:
+        raise HTTPException(status_code=400, detail="seconds must be between 0 and 60")
+    profile = profiling.sample_window(seconds, interval=max(interval_ms, 1.0) / 1000)
+    return {key: value for key, value in profile.items() if key != "collapsed"}
+
+
+@app.get("/api/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+def get_profile(profile_id: int):
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile not found: {profile_id}")
+    return {key: value for key, value in profile.items() if key not in ("collapsed", "pstats")}
+
+
+@app.get("/api/admin/profiles/{profile_id}/download", dependencies=[Depends(require_admin)])
+def download_profile(profile_id: int):
+    """Collapsed stacks (sample mode) or a marshalled pstats dump (cprofile mode)."""
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile not found: {profile_id}")
+    if "collapsed" in profile:
+        return PlainTextResponse(
+            profile["collapsed"],
+            headers={"Content-Disposition": f'attachment; filename="profile_{profile_id}.folded"'},
+        )
+    return Response(
+        profile["pstats"],
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="profile_{profile_id}.pstats"'},
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
 
+    workers = env_int("WEB_WORKERS", 1)
+    if workers > 1:
+        # Worker processes inherit the environment, so they coordinate too.
+        os.environ["MULTI_WORKER"] = "true"
     uvicorn.run(
         "server:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        reload=workers == 1,
+        workers=workers,
     )
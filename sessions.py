@@ -0,0 +1,190 @@
+"""Conversation sessions for ``/api/clara-query``.
+
+A session keeps the last few turns of a conversation and the evidence their
+answers were built from, with an embedding per evidence chunk. A follow-up
+question is first matched against that evidence, using the previous question
+together with the new one, since follow-ups such as "and the second one?"
+rarely stand on their own. When enough of it is relevant, the engine answers
+from the session alone, with no query analysis and no retrieval rounds.
+Otherwise it falls back to the full index and adds what it finds to the
+session.
+
+Sessions live in a ``ByteLRU`` (``CACHE_SESSIONS_MB``, default 64) and
+expire after ``SESSION_TTL_SECONDS`` of inactivity. Each session holds at
+most ``SESSION_MAX_EVIDENCE`` chunks and ``SESSION_MAX_TURNS`` turns.
+Evidence from a file that is re-indexed or deleted is dropped. Sessions are
+per process: with several workers, a follow-up that reaches another worker
+starts a new session there.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+import events
+from cache import ByteLRU
+from utils import env_float, env_int
+
+MAX_SESSION_ID_LENGTH = 128
+
+
+@dataclass
+class Turn:
+    question: str
+    answer: str
+    evidence_source: str  # "session" or "index"
+    at: float = field(default_factory=time.time)
+
+
+@dataclass
+class Session:
+    id: str
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    turns: List[Turn] = field(default_factory=list)
+    # evidence key -> (RetrievedEvidence, embedding)
+    evidence: "OrderedDict[str, tuple]" = field(default_factory=OrderedDict)
+    stale_sources: set = field(default_factory=set)  # files changed since their evidence was stored
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)  # one turn at a time
+
+    def nbytes(self) -> int:
+        size = 512
+        for turn in self.turns:
+            size += len(turn.question) + len(turn.answer)
+        for evidence, vector in self.evidence.values():
+            size += len(evidence.content) + len(vector) * 8 + 256
+        return size
+
+    def search_query(self, question: str) -> str:
+        """The question, preceded by the previous one for context."""
+        if not self.turns:
+            return question
+        return f"{self.turns[-1].question} {question}"
+
+    def relevant_evidence(self, query_vector: List[float], min_score: float, limit: int) -> list:
+        """Session evidence scoring at least ``min_score`` against the query, best first."""
+        scored = []
+        for key, (evidence, vector) in self.evidence.items():
+            score = _cosine(query_vector, vector)
+            if score >= min_score:
+                scored.append((score, key, evidence))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        for _, key, _ in scored[:limit]:
+            self.evidence.move_to_end(key)  # recently useful evidence is kept longest
+        return [evidence for _, _, evidence in scored[:limit]]
+
+    def history(self, turns: int = 3, chars: int = 300) -> str:
+        return "\n".join(
+            f"Q: {turn.question}\nA: {turn.answer[:chars]}" for turn in self.turns[-turns:]
+        )
+
+    def add_turn(self, question: str, answer: str, evidence_source: str, evidence: list) -> None:
+        from processor import embed_documents
+
+        new = OrderedDict()
+        for item in evidence:
+            key = _evidence_key(item)
+            if key in self.evidence:
+                self.evidence.move_to_end(key)
+            elif key not in new:
+                new[key] = item
+        if new:
+            vectors = embed_documents([item.content for item in new.values()])
+            for (key, item), vector in zip(new.items(), vectors):
+                self.evidence[key] = (item, list(vector))
+        while len(self.evidence) > max(1, env_int("SESSION_MAX_EVIDENCE", 40)):
+            self.evidence.popitem(last=False)
+
+        self.turns.append(Turn(question, answer, evidence_source))
+        del self.turns[:-max(1, env_int("SESSION_MAX_TURNS", 10))]
+
+    def drop_stale(self) -> None:
+        """Forget evidence from files that were re-indexed or deleted (hold ``lock``)."""
+        while self.stale_sources:
+            file_name = self.stale_sources.pop()
+            for key in [k for k, (e, _) in self.evidence.items() if e.source == file_name]:
+                del self.evidence[key]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "turns": len(self.turns),
+            "evidence": len(self.evidence),
+        }
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _evidence_key(evidence) -> str:
+    chunk_id = (evidence.metadata or {}).get("chunk_id")
+    return chunk_id or f"{evidence.source}:{hash(evidence.content)}"
+
+
+_sessions = ByteLRU("sessions", default_mb=64, sizeof=lambda session: session.nbytes())
+_create_lock = threading.Lock()
+_counters = {"session_answers": 0, "index_fallbacks": 0}
+
+
+def min_score() -> float:
+    return env_float("SESSION_EVIDENCE_MIN_SCORE", 0.45)
+
+
+def min_evidence() -> int:
+    return max(1, env_int("SESSION_MIN_EVIDENCE", 3))
+
+
+def get_or_create(session_id: str) -> Session:
+    ttl = env_int("SESSION_TTL_SECONDS", 3600)
+    with _create_lock:
+        session = _sessions.get(session_id)
+        if session is not None and time.time() - session.last_used > ttl:
+            _sessions.pop(session_id)
+            session = None
+        if session is None:
+            session = Session(id=session_id)
+            _sessions.put(session_id, session)
+        return session
+
+
+def save(session: Session) -> None:
+    """Store the session again so its size is re-measured after a turn."""
+    session.last_used = time.time()
+    _sessions.put(session.id, session)
+
+
+def record(evidence_source: str) -> None:
+    _counters["session_answers" if evidence_source == "session" else "index_fallbacks"] += 1
+
+
+def end(session_id: str) -> bool:
+    existed = session_id in _sessions
+    _sessions.pop(session_id)
+    return existed
+
+
+def stats() -> Dict[str, Any]:
+    # Memory use is reported with the other caches (``cache.stats()``).
+    return {"active": len(_sessions), **_counters}
+
+
+def _on_event(event: dict) -> None:
+    # Re-indexed or deleted files: their old chunk text no longer applies.
+    # Finished jobs are relayed to reader workers too, catalog events are not.
+    data = event["data"]
+    changed = event["type"] == "catalog" or (event["type"] == "job" and data.get("stage") == "done")
+    if not changed or not data.get("file"):
+        return
+    # Marked here and purged on the session's next turn, so ingestion never
+    # waits for a session that is busy answering.
+    for session in _sessions.values():
+        session.stale_sources.add(data["file"])
+
+
+events.add_listener(_on_event)
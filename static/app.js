@@ -34,11 +34,20 @@ function addMessage(role, text, loading = false) {
 
 async function fetchFiles() {
   try {
-    const res = await fetch('/api/files');
-    if (!res.ok) throw new Error('Failed to load files');
-    const data = await res.json();
-    renderFiles(data.files || []);
-    return data.files || [];
+    const files = [];
+    let cursor = null;
+    do {
+      const params = new URLSearchParams({ limit: '1000' });
+      if (cursor) params.set('cursor', cursor);
+      // The browser revalidates with If-None-Match; unchanged pages come back as 304.
+      const res = await fetch(`/api/files?${params}`, { cache: 'no-cache' });
+      if (!res.ok) throw new Error('Failed to load files');
+      const data = await res.json();
+      files.push(...(data.files || []));
+      cursor = data.next_cursor;
+    } while (cursor);
+    renderFiles(files);
+    return files;
   } catch (err) {
     renderFiles([]);
     console.error(err);
@@ -91,28 +100,20 @@ async function uploadFile(file) {
       const error = await res.json().catch(() => ({}));
       throw new Error(error.detail || 'Upload failed');
     }
+    const { job_id: jobId } = await res.json();
     addMessage('bot', `📄 ${file.name} uploaded. Processing with Ollama (this may take a moment)...`);
     statusTag.textContent = 'Processing…';
-    const indexed = await waitForIndex(file.name);
-    if (indexed) {
-      await fetchFiles();
+    const job = await waitForJob(jobId);
+    if (!window.EventSource) await fetchFiles();
+    if (job.status === 'done' || job.status === 'skipped') {
       statusTag.textContent = 'Ready';
       statusTag.style.color = '';
-      addMessage('bot', `✅ Successfully indexed ${file.name}. Ask me anything about it!`);
+      const note = job.status === 'skipped' ? ' (already indexed, unchanged)' : '';
+      addMessage('bot', `✅ Successfully indexed ${file.name}${note}. Ask me anything about it!`);
     } else {
-      statusTag.textContent = 'Processing…';
-      addMessage('bot', `⏳ Processing is taking longer than expected. Trying manual trigger...`);
-      try {
-        await fetch(`/api/process-uploads?file_name=${encodeURIComponent(file.name)}`, { method: 'POST' });
-        await sleep(3000);
-        await fetchFiles();
-        statusTag.textContent = 'Ready';
-        addMessage('bot', `✅ ${file.name} processed!`);
-      } catch (e) {
-        statusTag.textContent = 'Error';
-        statusTag.style.color = '#ffb4b4';
-        addMessage('bot', `❌ Processing timeout. Make sure Ollama is running on port 11434. File is saved in uploads/ folder. Try refreshing the page.`);
-      }
+      statusTag.textContent = 'Error';
+      statusTag.style.color = '#ffb4b4';
+      addMessage('bot', `❌ Could not index ${file.name}: ${job.error || 'unknown error'}`);
     }
   } catch (err) {
     statusTag.textContent = 'Error';
@@ -121,17 +122,68 @@ async function uploadFile(file) {
   }
 }
 
-async function waitForIndex(fileName) {
-  for (let i = 0; i < 25; i += 1) {
-    await sleep(i === 0 ? 500 : 1500);
-    const files = await fetchFiles();
-    const found = files.find((f) => f.name === fileName && f.chunks > 0);
-    if (found) return true;
-    if (i % 5 === 4) {
-      addMessage('bot', `⏳ Still processing ${fileName}... (${(i + 1) * 1.5}s)`);
-    }
+const TERMINAL_STAGES = ['done', 'skipped', 'failed'];
+const jobWatchers = new Map();
+const lastJobEvent = new Map();
+let catalogRefresh = null;
+
+function handleJobEvent(event) {
+  lastJobEvent.set(event.job_id, event);
+  const watcher = jobWatchers.get(event.job_id);
+  if (watcher) watcher(event);
+}
+
+function connectEvents() {
+  if (!window.EventSource) return;
+  const source = new EventSource('/api/events');
+  source.addEventListener('job', (e) => handleJobEvent(JSON.parse(e.data)));
+  source.addEventListener('catalog', () => {
+    // Coalesce bursts (bulk uploads) into one refresh.
+    clearTimeout(catalogRefresh);
+    catalogRefresh = setTimeout(fetchFiles, 300);
+  });
+}
+
+function describeStage(event) {
+  switch (event.stage) {
+    case 'queued': return 'Queued…';
+    case 'running': return 'Parsing…';
+    case 'parsed': return `Parsed ${event.pages} page${event.pages === 1 ? '' : 's'}…`;
+    case 'embedding': return `Embedding ${event.done}/${event.total}…`;
+    default: return 'Processing…';
   }
-  return false;
+}
+
+function waitForJob(jobId) {
+  return new Promise((resolve) => {
+    let poll = null;
+    const finish = (job) => {
+      jobWatchers.delete(jobId);
+      clearInterval(poll);
+      resolve(job);
+    };
+    const onEvent = (event) => {
+      if (TERMINAL_STAGES.includes(event.stage)) {
+        finish({ status: event.stage, error: event.error, chunks: event.chunks });
+      } else {
+        statusTag.textContent = describeStage(event);
+      }
+    };
+    jobWatchers.set(jobId, onEvent);
+    const seen = lastJobEvent.get(jobId);
+    if (seen) onEvent(seen);
+    // Safety net in case the event stream is unavailable or drops events.
+    poll = setInterval(async () => {
+      try {
+        const res = await fetch(`/api/jobs/${encodeURIComponent(jobId)}`);
+        if (!res.ok) return;
+        const job = await res.json();
+        if (TERMINAL_STAGES.includes(job.status)) finish(job);
+      } catch (err) {
+        console.error(err);
+      }
+    }, 10000);
+  });
 }
 
 function setSending(state) {
@@ -311,4 +363,5 @@ maxHops.addEventListener('input', (e) => {
   hopsLabel.textContent = e.target.value;
 });
 
+connectEvents();
 fetchFiles();
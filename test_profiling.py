@@ -0,0 +1,49 @@
+"""Armed request profiles are only used up by profiled endpoints.
+
+Run with ``python test_profiling.py`` or ``pytest test_profiling.py``.
+"""
+
+import os
+import tempfile
+
+os.chdir(tempfile.mkdtemp(prefix="test_profiling_"))
+os.environ["ADMIN_TOKEN"] = "test-token"
+
+from fastapi.testclient import TestClient
+
+import profiling
+import server
+
+ADMIN = {"X-Admin-Token": "test-token"}
+
+
+def test_armed_slots_skip_unprofiled_requests():
+    server.UPLOAD_DIR_ABS = server.Path(os.getcwd()) / "uploads"
+    server.UPLOAD_DIR_ABS.mkdir(exist_ok=True)
+    client = TestClient(server.app)
+    stored = profiling.status()["stored"]
+
+    client.post("/api/admin/profiles/arm?count=1&mode=sample&target=requests", headers=ADMIN)
+    assert client.get("/api/health").status_code == 200
+    assert profiling.status()["armed"]["requests"] == 1
+
+    response = client.get("/api/files")
+    assert response.status_code == 200
+    assert "X-Profile-Id" in response.headers
+    status = profiling.status()
+    assert status["armed"]["requests"] == 0
+    assert status["stored"] == stored + 1
+
+
+def test_unknown_profile_mode_is_rejected():
+    client = TestClient(server.app)
+    client.post("/api/admin/profiles/arm?count=1&mode=sample&target=requests", headers=ADMIN)
+    assert client.get("/api/files", headers={**ADMIN, "X-Profile": "bogus"}).status_code == 400
+    assert profiling.status()["armed"]["requests"] == 1
+    profiling.arm(0, target="requests")
+
+
+if __name__ == "__main__":
+    test_armed_slots_skip_unprofiled_requests()
+    test_unknown_profile_mode_is_rejected()
+    print("ok")
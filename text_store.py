@@ -0,0 +1,146 @@
+"""Compact per-document text store.
+
+The extracted text of every document is written once to ``text_store/`` and
+memory-mapped on read. Vector store entries only carry ``(doc_id, start, end)``
+byte offsets into that file, so chunk text (and the chunk overlap) is not
+duplicated in Chroma, and context around a hit can be widened without another
+vector query.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import threading
+from typing import List, Tuple
+
+from cache import ByteLRU
+
+logger = logging.getLogger(__name__)
+
+TEXT_STORE_DIR = "text_store"
+PAGE_SEPARATOR = b"\n\n"
+
+_lock = threading.Lock()
+
+
+def doc_id_for(file_name: str) -> str:
+    return hashlib.sha1(file_name.encode("utf-8")).hexdigest()[:16]
+
+
+def _doc_path(doc_id: str) -> str:
+    return os.path.join(TEXT_STORE_DIR, f"{doc_id}.txt")
+
+
+def _release(doc_id: str, mapped: mmap.mmap) -> None:
+    try:
+        mapped.close()
+    except BufferError:
+        # A reader still holds a slice; the map is released once it is dropped.
+        pass
+
+
+# Open maps are capped by mapped size (CACHE_TEXT_STORE_MAPS_MB); the least
+# recently used documents are unmapped first.
+_maps = ByteLRU("text_store_maps", default_mb=512, sizeof=len, on_evict=_release)
+
+
+def _close_map(doc_id: str) -> None:
+    _maps.pop(doc_id)
+
+
+def byte_offset(text: str, char_offset: int) -> int:
+    """Convert a character offset within ``text`` to a UTF-8 byte offset."""
+    if text.isascii():
+        return char_offset
+    return len(text[:char_offset].encode("utf-8"))
+
+
+def write_document(file_name: str, pages: List[str]) -> Tuple[str, List[int]]:
+    """Store the page texts of one document.
+
+    Returns the document id and the byte offset at which each page starts.
+    """
+    os.makedirs(TEXT_STORE_DIR, exist_ok=True)
+    doc_id = doc_id_for(file_name)
+    path = _doc_path(doc_id)
+    tmp_path = f"{path}.tmp"
+
+    page_offsets = []
+    position = 0
+    with open(tmp_path, "wb") as f:
+        for idx, page in enumerate(pages):
+            if idx:
+                f.write(PAGE_SEPARATOR)
+                position += len(PAGE_SEPARATOR)
+            data = page.encode("utf-8")
+            page_offsets.append(position)
+            f.write(data)
+            position += len(data)
+
+    with _lock:
+        _close_map(doc_id)
+        os.replace(tmp_path, path)
+
+    return doc_id, page_offsets
+
+
+def _open_map(doc_id: str):
+    """Return the map for ``doc_id``; the caller must hold ``_lock``."""
+    mapped = _maps.get(doc_id)
+    if mapped is not None:
+        return mapped
+    path = _doc_path(doc_id)
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, "rb") as handle:
+        mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    # Documents larger than the cap are still served, just not kept mapped.
+    _maps.put(doc_id, mapped)
+    return mapped
+
+
+def slice_text(doc_id: str, start: int, end: int) -> memoryview:
+    """Return a zero-copy view of the stored bytes for ``[start, end)``."""
+    # Taking the view under the lock keeps eviction from closing the map
+    # between lookup and slicing; once exported, close() defers to the view.
+    with _lock:
+        mapped = _open_map(doc_id)
+        if mapped is None:
+            return memoryview(b"")
+        start = max(0, start)
+        end = min(len(mapped), end)
+        return memoryview(mapped)[start:end]
+
+
+def clear_maps() -> None:
+    """Unmap every document, e.g. after another process rewrote the store."""
+    with _lock:
+        _maps.clear()
+
+
+def mapped_bytes() -> int:
+    return _maps.size_bytes
+
+
+def get_text(doc_id: str, start: int, end: int, window: int = 0) -> str:
+    """Decode the text for ``[start, end)``, optionally widened by ``window`` bytes
+    on each side ("small-to-big" retrieval)."""
+    view = slice_text(doc_id, start - window, end + window)
+    try:
+        # Widened windows may cut through a multi-byte character at the edges.
+        return str(view, "utf-8", errors="ignore")
+    finally:
+        view.release()
+
+
+def remove_document(doc_id: str) -> None:
+    with _lock:
+        _close_map(doc_id)
+        path = _doc_path(doc_id)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except Exception as exc:
+            logger.warning(f"Could not remove stored text {path}: {exc}")
@@ -0,0 +1,95 @@
+"""Streaming upload persistence.
+
+Uploads are copied in fixed-size chunks to a temporary file outside the
+watched ``uploads/`` folder, hashed on the fly and size-checked as they go,
+then atomically renamed into place. Neither a partial file nor the whole
+body in memory is ever visible to the rest of the app.
+
+Starlette parses the multipart body (spooling large parts to disk) before
+the endpoint runs, so for requests without a ``Content-Length`` header the
+size limit only applies once the whole body has been received.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+
+from utils import env_float
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR", "upload_tmp")
+CHUNK_SIZE = 1024 * 1024
+
+
+def max_upload_bytes() -> int:
+    return int(env_float("MAX_UPLOAD_MB", 200) * 1024 * 1024)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+@dataclass
+class StoredUpload:
+    name: str
+    path: str
+    sha256: str
+    size: int
+
+
+class UploadWriter:
+    """Accumulates one upload into a temp file; ``commit`` renames it into place."""
+
+    def __init__(self, name: str, max_bytes: int):
+        os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+        self.name = name
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.digest = hashlib.sha256()
+        fd, self.tmp_path = tempfile.mkstemp(dir=UPLOAD_TMP_DIR, suffix=".part")
+        self.handle = os.fdopen(fd, "wb")
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(
+                f"{self.name} exceeds the {self.max_bytes / (1024 * 1024):g} MB upload limit"
+            )
+        self.digest.update(data)
+        self.handle.write(data)
+
+    @property
+    def sha256(self) -> str:
+        return self.digest.hexdigest()
+
+    def commit(self, dest_dir: str, name: str = None) -> StoredUpload:
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+        self.handle.close()
+        self.name = name or self.name
+        dest_path = os.path.join(dest_dir, self.name)
+        os.replace(self.tmp_path, dest_path)
+        return StoredUpload(self.name, dest_path, self.digest.hexdigest(), self.size)
+
+    def abort(self) -> None:
+        self.handle.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def save_stream(stream, name: str, dest_dir: str, max_bytes: int = None) -> StoredUpload:
+    """Copy a file-like object (an ``UploadFile.file`` or an archive member)
+    to ``dest_dir/name``. Blocking; call it from a worker thread."""
+    writer = UploadWriter(name, max_bytes or max_upload_bytes())
+    try:
+        for data in iter(lambda: stream.read(CHUNK_SIZE), b""):
+            writer.write(data)
+        return writer.commit(dest_dir)
+    except BaseException:
+        writer.abort()
+        raise
@@ -1,6 +1,56 @@
-import os, json
+import os, json, hashlib, logging, threading
+
+logger = logging.getLogger(__name__)
 
 INDEX_FILE = "file_index.json"
+META_FILE = "file_meta.json"
+
+# Ingestion workers update the index/meta files concurrently (read-modify-write).
+_write_lock = threading.RLock()
+
+def env_int(name, default):
+    """Integer setting from the environment; unset, empty or invalid -> ``default``."""
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        logger.warning(f"Invalid {name}={raw!r}; using {default}")
+        return default
+
+def env_float(name, default):
+    """Float setting from the environment; unset, empty or invalid -> ``default``."""
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        logger.warning(f"Invalid {name}={raw!r}; using {default}")
+        return default
+
+def env_flag(name, default=False):
+    """Boolean setting: 1/true/yes (any case) is on; unset or empty -> ``default``."""
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    return raw.strip().lower() in ("1", "true", "yes")
+
+def file_sha256(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _dump_json(path, data):
+    # Write-then-rename, so readers (other threads or worker processes)
+    # never see a half-written file.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
 
 def load_file_index():
     if not os.path.exists(INDEX_FILE):
@@ -9,14 +59,45 @@ def load_file_index():
         return json.load(f)
 
 def update_file_index(file_name, chunk_count):
-    index = load_file_index()
-    index[file_name] = chunk_count
-    with open(INDEX_FILE, "w") as f:
-        json.dump(index, f)
+    with _write_lock:
+        index = load_file_index()
+        index[file_name] = chunk_count
+        _dump_json(INDEX_FILE, index)
+
+def update_file_entries(entries):
+    """Add many files at once: ``entries`` maps file name -> (chunk count, meta fields)."""
+    with _write_lock:
+        index = load_file_index()
+        meta = load_file_meta()
+        for file_name, (chunk_count, fields) in entries.items():
+            index[file_name] = chunk_count
+            meta.setdefault(file_name, {}).update(fields)
+        _dump_json(META_FILE, meta)
+        _dump_json(INDEX_FILE, index)
 
 def remove_from_index(file_name):
-    index = load_file_index()
-    if file_name in index:
-        del index[file_name]
-        with open(INDEX_FILE, "w") as f:
-            json.dump(index, f)
+    with _write_lock:
+        index = load_file_index()
+        if file_name in index:
+            del index[file_name]
+            _dump_json(INDEX_FILE, index)
+        remove_file_meta(file_name)
+
+def load_file_meta():
+    if not os.path.exists(META_FILE):
+        return {}
+    with open(META_FILE, "r") as f:
+        return json.load(f)
+
+def update_file_meta(file_name, **fields):
+    with _write_lock:
+        meta = load_file_meta()
+        meta.setdefault(file_name, {}).update(fields)
+        _dump_json(META_FILE, meta)
+
+def remove_file_meta(file_name):
+    with _write_lock:
+        meta = load_file_meta()
+        if file_name in meta:
+            del meta[file_name]
+            _dump_json(META_FILE, meta)
@@ -0,0 +1,64 @@
+"""Background warm-up of the query path.
+
+Importing the server loads no ML stack (``bench_import.py`` guards this), so
+the embedding model, Chroma and the LLM client would otherwise load on the
+first query. ``start`` loads them on a daemon thread right after startup.
+``/api/health`` answers immediately either way, and ``/api/ready`` reports
+when the warm-up has finished. Set ``WARMUP=false`` to load on first use
+instead.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict
+
+from utils import env_flag
+
+logger = logging.getLogger(__name__)
+
+_state: Dict[str, Any] = {"status": "pending", "seconds": None, "error": None}
+_thread = None
+
+
+def enabled() -> bool:
+    return env_flag("WARMUP", True)
+
+
+def _run() -> None:
+    started = time.perf_counter()
+    _state["status"] = "warming"
+    try:
+        import processor
+
+        processor.embed_query("warm-up")  # embedding model + vector store
+
+        import clara_engine
+
+        clara_engine.get_clara_engine()
+        _state["status"] = "ready"
+    except Exception as exc:
+        _state.update(status="failed", error=str(exc))
+        logger.error(f"Warm-up failed: {exc}")
+    finally:
+        _state["seconds"] = round(time.perf_counter() - started, 3)
+    logger.info(f"Warm-up {_state['status']} in {_state['seconds']}s")
+
+
+def start() -> None:
+    global _thread
+    if _thread is not None:
+        return
+    if not enabled():
+        _state["status"] = "disabled"
+        return
+    _thread = threading.Thread(target=_run, name="warmup", daemon=True)
+    _thread.start()
+
+
+def status() -> Dict[str, Any]:
+    return dict(_state)
+
+
+def ready() -> bool:
+    return _state["status"] in ("ready", "disabled")